@@ -3,31 +3,95 @@ backend/app/database.py
 ------------------
 Mục đích:
 - Cấu hình kết nối database cho toàn bộ ứng dụng.
-- Cung cấp session và engine SQLAlchemy.
+- Cung cấp session và engine SQLAlchemy (bất đồng bộ và đồng bộ).
 - Khởi tạo bảng trong database.
 
 Chức năng chính:
-- Tạo SQLAlchemy engine với cấu hình kết nối PostgreSQL.
-- Cấu hình connection pool để tối ưu hiệu suất.
+- Tạo SQLAlchemy async engine (asyncpg/aiosqlite) để truy vấn không chặn event loop.
+- Giữ engine đồng bộ cho việc tạo bảng và cho chế độ DB_ASYNC_MODE=false (so sánh throughput).
+- Cấu hình connection pool để tối ưu hiệu suất, ghi số lần lấy kết nối và thời gian chờ pool.
 - Tạo session factory để tương tác với database.
-- Định nghĩa base class cho các model SQLAlchemy.
-- Cung cấp dependency get_db để sử dụng database session trong API.
-- Hàm create_tables để khởi tạo schema database.
+- Dùng chung base class của các model SQLAlchemy (app.models.base).
+- Cung cấp dependency async get_db để sử dụng database session trong API.
+- SyncSessionAdapter/SyncStreamResult: giao diện await (execute, stream, ...) cho Session đồng bộ.
+- Cung cấp dialect_insert để viết các câu lệnh upsert (INSERT ... ON CONFLICT) theo dialect.
+- Hàm create_tables để khởi tạo schema database, kể cả các index mới trên bảng đã có.
 """
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.config import DATABASE_URL, ASYNC_DATABASE_URL, DB_ASYNC_MODE
+from app.models.base import Base, load_models
+from app.utils.metrics import DB_POOL_CHECKOUTS, DB_POOL_WAIT
 import logging
+import time
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Driver bất đồng bộ tương ứng với từng loại database
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Chuyển URL database đồng bộ sang URL dùng driver bất đồng bộ.
+
+    Args:
+        url (str): URL database (vd: postgresql://...)
+
+    Returns:
+        str: URL với driver async (vd: postgresql+asyncpg://...)
+    """
+    sa_url = make_url(url)
+    backend = sa_url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return sa_url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+class PoolMetricsMixin:
+    """Ghi số lần lấy kết nối và thời gian chờ kết nối của pool (db_pool_*)."""
+
+    metrics_name = "default"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, pool=self.metrics_name)
+            DB_POOL_CHECKOUTS.inc(pool=self.metrics_name)
+
+
+class InstrumentedQueuePool(PoolMetricsMixin, QueuePool):
+    metrics_name = "sync"
+
+
+class InstrumentedAsyncQueuePool(PoolMetricsMixin, AsyncAdaptedQueuePool):
+    metrics_name = "async"
+
+
 # Tạo engine SQLAlchemy với PostgreSQL
 try:
     engine = create_engine(
         DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=1800
+    )
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL or to_async_url(DATABASE_URL),
+        poolclass=InstrumentedAsyncQueuePool,
         pool_size=5,
         max_overflow=10,
         pool_timeout=30,
@@ -39,19 +103,123 @@ except Exception as e:
     raise
 
 # Tạo session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+class SyncStreamResult:
+    """Duyệt kết quả của Session đồng bộ bằng async for, giống AsyncResult của session.stream()."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = self._result.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+
+class SyncSessionAdapter:
+    """
+    Bọc Session đồng bộ với cùng giao diện await như AsyncSession.
+
+    Dùng khi DB_ASYNC_MODE=false: các service chỉ viết một lần theo kiểu async,
+    nhưng mỗi truy vấn vẫn chạy đồng bộ trên event loop như đường đi cũ,
+    giúp so sánh throughput giữa hai chế độ.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def get_bind(self):
+        return self.sync_session.get_bind()
+
+    async def execute(self, statement, params=None, **kwargs):
+        return self.sync_session.execute(statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return self.sync_session.scalar(statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        return SyncStreamResult(self.sync_session.execute(statement, params, **kwargs))
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return self.sync_session.scalars(statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def flush(self, objects=None):
+        self.sync_session.flush(objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
 
-# Base class cho các model
-Base = declarative_base()
 
 # Dependency để có database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    if DB_ASYNC_MODE:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield SyncSessionAdapter(db)
+        finally:
+            db.close()
+
+
+# Session dùng ngoài dependency injection (middleware, background task)
+db_session = asynccontextmanager(get_db)
+
+
+def dialect_insert(db, table):
+    """
+    Tạo câu lệnh INSERT hỗ trợ ON CONFLICT DO UPDATE theo dialect của session.
+
+    Args:
+        db: Database session (AsyncSession hoặc SyncSessionAdapter)
+        table: Model hoặc Table cần insert
+
+    Returns:
+        Insert: Câu lệnh insert của dialect PostgreSQL hoặc SQLite
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Upsert is not supported for database dialect '{dialect}'")
+    return insert(table)
+
 
 # Tạo các bảng
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    metadata = load_models()
+    metadata.create_all(bind=engine)
+    # create_all bỏ qua bảng đã tồn tại: tạo bổ sung các index khai báo sau này trên bảng cũ
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
@@ -8,18 +8,32 @@ Mục đích:
 
 Chức năng chính:
 - Khởi tạo đối tượng FastAPI với tiêu đề và mô tả.
-- Đăng ký middleware CORS và rate limiting.
+- Đăng ký middleware CORS, rate limiting, đo số liệu (Prometheus tại /metrics)
+  và Server-Timing.
 - Tích hợp các router từ modules auth và chat.
-- Thêm event handler để khởi tạo database khi ứng dụng bắt đầu.
+- Thêm event handler để khởi tạo database, bộ đếm token, prompt template và client LLM khi ứng dụng bắt đầu.
+- Kiểm tra index và kế hoạch của các truy vấn nóng khi khởi động (SCHEMA_VERIFY_ON_STARTUP).
+- Chạy tác vụ nền đồng bộ số request xuống database.
+- Ghi nốt số liệu và đóng client LLM dùng chung khi ứng dụng tắt.
 - Cung cấp endpoint root đơn giản cho health check.
 - Cấu hình logging để ghi lại thông tin và lỗi.
 """
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import auth, chat_routes
+from app.routes import auth, chat_routes, monitoring, metrics
 from app.middleware.token_middlewave import rate_limit_middleware
+from app.middleware.metrics_middleware import MetricsMiddleware
+from app.middleware.timing_middleware import ServerTimingMiddleware
 from app.database import create_tables
+from app.services.schema_verifier import verify_schema, log_schema_report
+from app.config import SCHEMA_VERIFY_ON_STARTUP, SCHEMA_VERIFY_STRICT
+from app.utils.token_counter import load_tokenizer
+from app.utils.prompt_templates import compile_templates
+from app.services.llm_client import init_llm_client, close_llm_client
+from app.services.password_hasher import password_hasher
+from app.services.usage_aggregator import usage_aggregator
+import asyncio
 import logging
 
 # Cấu hình logging
@@ -47,9 +61,17 @@ app.add_middleware(
 # Thêm middleware rate limiting
 app.middleware("http")(rate_limit_middleware)
 
+# Đo độ trễ mọi request (middleware ngoài cùng, bao cả các request bị rate limit)
+app.add_middleware(MetricsMiddleware)
+
+# Trace từng giai đoạn của request: header Server-Timing và log JSON
+app.add_middleware(ServerTimingMiddleware)
+
 # Thêm các router
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(chat_routes.router, prefix="/api/chat", tags=["Chat"])
+app.include_router(monitoring.router, prefix="/api/monitoring", tags=["Monitoring"])
+app.include_router(metrics.router, tags=["Monitoring"])
 
 @app.get("/")
 async def root():
@@ -60,8 +82,27 @@ async def root():
 async def startup_event():
     logger.info("Creating database tables if they don't exist...")
     create_tables()
+    if SCHEMA_VERIFY_ON_STARTUP:
+        report = await asyncio.to_thread(verify_schema)
+        log_schema_report(report)
+        if SCHEMA_VERIFY_STRICT and not report.ok:
+            raise RuntimeError("Database schema verification failed, see warnings above")
+    await asyncio.to_thread(load_tokenizer)
+    compile_templates()
+    logger.info("Warming up LLM client...")
+    await init_llm_client()
+    usage_aggregator.start()
     logger.info("Application startup complete")
 
+# Đóng kết nối khi tắt
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ghi nốt số request/token đã gom trước khi tắt
+    await usage_aggregator.stop()
+    await close_llm_client()
+    password_hasher.shutdown()
+    logger.info("Application shutdown complete")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8080, reload=True)
\ No newline at end of file
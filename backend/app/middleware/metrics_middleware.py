@@ -0,0 +1,63 @@
+"""
+backend/app/middleware/metrics_middleware.py
+------------------
+Mục đích:
+- Đo độ trễ của mọi request HTTP, kể cả response dạng stream (tính tới khi gửi xong body,
+  không chỉ tới lúc gửi header như X-Process-Time).
+
+Chức năng chính:
+- MetricsMiddleware (ASGI thuần): ghi độ trễ theo method/route/status, thời gian tới byte body đầu tiên
+  và số request đang xử lý.
+- Nhãn route là mẫu đường dẫn (vd: /api/chat/conversations/{conversation_id}/chat) để số nhãn không tăng
+  theo id; request không khớp route nào được gộp vào "unmatched".
+"""
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, HTTP_TIME_TO_FIRST_BYTE
+
+
+def _route_label(scope: Scope) -> str:
+    """Mẫu đường dẫn của route đã khớp: thay các đoạn là tham số đường dẫn bằng {tên tham số}."""
+    if scope.get("route") is None:
+        return "unmatched"
+    params = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    if not params:
+        return scope["path"]
+    return "/".join(f"{{{params[segment]}}}" if segment in params else segment
+                    for segment in scope["path"].split("/"))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI ghi số liệu HTTP vào app.utils.metrics."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        first_byte_sent = False
+
+        async def send_with_metrics(message: Message):
+            nonlocal status_code, first_byte_sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and not first_byte_sent and message.get("body"):
+                first_byte_sent = True
+                HTTP_TIME_TO_FIRST_BYTE.observe(time.perf_counter() - started, method=scope["method"],
+                                                route=_route_label(scope))
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=scope["method"],
+                                          route=_route_label(scope), status=str(status_code))
@@ -0,0 +1,58 @@
+"""
+backend/app/middleware/timing_middleware.py
+------------------
+Mục đích:
+- Gắn trace (app.utils.tracing) cho mỗi request để các giai đoạn xử lý được đo và công khai.
+
+Chức năng chính:
+- ServerTimingMiddleware (ASGI thuần): bắt đầu trace, thêm header Server-Timing gồm các giai đoạn
+  đã xong trước khi gửi header (với response stream, TTFT của upstream và commit cuối xảy ra sau đó).
+- Khi request kết thúc (gửi xong body), ghi một dòng log JSON có đủ mọi giai đoạn, kể cả phần stream.
+"""
+import json
+import logging
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import REQUEST_TIMING_LOG
+from app.utils.tracing import end_trace, server_timing, start_trace
+
+logger = logging.getLogger("app.timing")
+
+
+class ServerTimingMiddleware:
+    """Middleware ASGI thêm header Server-Timing và log thời gian từng giai đoạn của request."""
+
+    def __init__(self, app: ASGIApp, log_enabled: bool = REQUEST_TIMING_LOG):
+        self.app = app
+        self.log_enabled = log_enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, token = start_trace()
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_trace(token)
+            if self.log_enabled and trace.spans:
+                logger.info(json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "total_ms": round(trace.elapsed() * 1000, 3),
+                    "spans_ms": trace.totals()
+                }))
@@ -0,0 +1,20 @@
+"""
+backend/app/models/base.py
+------------------
+Mục đích:
+- Định nghĩa một declarative base dùng chung cho mọi model SQLAlchemy.
+
+Chức năng chính:
+- Tất cả các bảng (users, conversations, messages, token_usage, request_count) nằm trong cùng một
+  MetaData, nhờ đó khóa ngoại được resolve và create_tables()/bộ kiểm tra schema thấy đủ các bảng.
+- Hàm load_models() import các module model để đăng ký bảng vào MetaData.
+"""
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+def load_models():
+    """Import các module model để mọi bảng được đăng ký vào Base.metadata."""
+    from app.models import chat, token_usage, user  # noqa: F401
+    return Base.metadata
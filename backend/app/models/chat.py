@@ -7,22 +7,40 @@ Mục đích:
 - Cung cấp schema cho request/response của API chat.
 
 Chức năng chính:
-- Định nghĩa model SQLAlchemy Conversation với các trường: id, user_id, title, timestamps.
-- Định nghĩa model SQLAlchemy Message với các trường: id, conversation_id, role, content, timestamp.
+- Định nghĩa model SQLAlchemy Conversation với các trường: id, user_id, title, timestamps
+  và các cột tóm tắt được cập nhật khi ghi tin nhắn (message_count, last_message_preview, total_tokens).
+- Index (user_id, updated_at, id) cho danh sách hội thoại phân trang theo keyset.
+- Định nghĩa model SQLAlchemy Message với các trường: id, conversation_id, role, content, token_count, status, timestamp.
+- Trạng thái tin nhắn assistant: streaming (đang sinh), complete, truncated (bị cắt), failed (lỗi upstream).
 - Thiết lập relationship giữa Conversation và Message.
+- Index (conversation_id, created_at) cho truy vấn cửa sổ lịch sử gần nhất.
 - Định nghĩa các Pydantic model cho API:
-  + MessageBase, MessageCreate, MessageResponse: Schema cho tin nhắn.
+  + MessageBase, MessageCreate, MessageResponse, MessagePage: Schema cho tin nhắn (trang tin nhắn theo cursor).
   + ConversationBase, ConversationCreate, ConversationResponse: Schema cho cuộc trò chuyện.
+  + ConversationSummary, ConversationPage: Schema cho danh sách hội thoại (không kèm tin nhắn).
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
-Base = declarative_base()
+from app.models.base import Base
+
+# Trạng thái của tin nhắn
+MESSAGE_STATUS_STREAMING = "streaming"
+MESSAGE_STATUS_COMPLETE = "complete"
+MESSAGE_STATUS_TRUNCATED = "truncated"
+MESSAGE_STATUS_FAILED = "failed"
+
+# Độ dài tối đa của đoạn xem trước tin nhắn cuối trong danh sách hội thoại
+LAST_MESSAGE_PREVIEW_LENGTH = 200
+
+
+def utcnow() -> datetime:
+    """Thời điểm hiện tại (UTC), dùng cho updated_at để thứ tự phân trang nhất quán."""
+    return datetime.now(timezone.utc)
 
 
 class Conversation(Base):
@@ -33,11 +51,19 @@ class Conversation(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String, default="New Conversation")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), onupdate=utcnow)
+
+    # Các cột tóm tắt, được cập nhật mỗi khi ghi tin nhắn (xem conversation_service.record_message)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_preview = Column(String(LAST_MESSAGE_PREVIEW_LENGTH), nullable=True)
+    total_tokens = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationship
     messages = relationship("Message", back_populates="conversation")
 
+    # Danh sách hội thoại của người dùng, mới cập nhật trước, phân trang theo (updated_at, id)
+    __table_args__ = (Index("ix_conversations_user_id_updated_at", "user_id", "updated_at", "id"),)
+
 
 class Message(Base):
     """SQLAlchemy model cho tin nhắn"""
@@ -47,11 +73,18 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
     role = Column(String)  # 'user' hoặc 'assistant'
     content = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    token_count = Column(Integer, nullable=True)  # Số token của content, tính một lần khi ghi
+    status = Column(String(16), nullable=False, default=MESSAGE_STATUS_COMPLETE,
+                    server_default=MESSAGE_STATUS_COMPLETE)  # streaming/complete/truncated/failed
+    # Gán từ ứng dụng (độ chính xác micro giây) để cursor (created_at, id) so sánh nhất quán
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
 
     # Relationship
     conversation = relationship("Conversation", back_populates="messages")
 
+    # Lấy cửa sổ lịch sử gần nhất của một cuộc hội thoại bằng index scan
+    __table_args__ = (Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),)
+
 
 # Pydantic models cho API
 class MessageBase(BaseModel):
@@ -65,12 +98,19 @@ class MessageCreate(MessageBase):
 
 class MessageResponse(MessageBase):
     id: int
+    status: str = MESSAGE_STATUS_COMPLETE
     created_at: datetime
 
     class Config:
         orm_mode = True
 
 
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    prev_cursor: Optional[str] = None  # Dùng với ?before= để lấy các tin nhắn cũ hơn
+    next_cursor: Optional[str] = None  # Dùng với ?after= để lấy các tin nhắn mới hơn
+
+
 class ConversationBase(BaseModel):
     title: str = "New Conversation"
 
@@ -84,7 +124,25 @@ class ConversationResponse(ConversationBase):
     user_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
-    messages: List[MessageResponse] = []
+    messages: List[MessageResponse] = []  # Chỉ trang tin nhắn mới nhất
+    messages_prev_cursor: Optional[str] = None  # Cursor để tải tiếp các tin nhắn cũ hơn
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class ConversationSummary(ConversationBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    message_count: int = 0
+    last_message_preview: Optional[str] = None
+    total_tokens: int = 0
+
+    class Config:
+        orm_mode = True
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None
\ No newline at end of file
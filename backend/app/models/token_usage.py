@@ -13,13 +13,12 @@ Chức năng chính:
 - Định nghĩa Pydantic model TokenUsageResponse và RequestCountResponse cho API response.
 """
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Date, UniqueConstraint
-from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from pydantic import BaseModel
 from typing import Optional
 from datetime import date, datetime
 
-Base = declarative_base()
+from app.models.base import Base
 
 class TokenUsage(Base):
     """SQLAlchemy model để theo dõi việc sử dụng token"""
@@ -12,16 +12,16 @@ Chức năng chính:
   + UserBase: Mô hình cơ bản với email.
   + UserCreate: Kế thừa từ UserBase, thêm name và provider.
   + UserResponse: Schema cho API response với đầy đủ thông tin người dùng.
+  + UserPrincipal: Danh tính người dùng đã xác thực, được cache và gắn vào request.
   + Token và TokenData: Schema liên quan đến JWT authentication.
 """
 from sqlalchemy import Column, Integer, String, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 
-Base = declarative_base()
+from app.models.base import Base
 
 
 class User(Base):
@@ -61,6 +61,19 @@ class UserResponse(UserBase):
         from_attributes = True  # Thay thế cho orm_mode=True trong Pydantic v2
 
 
+class UserPrincipal(BaseModel):
+    """Danh tính người dùng đã xác thực (bất biến, an toàn để cache giữa các request)"""
+    id: int
+    email: str
+    name: Optional[str] = None
+    provider: Optional[str] = None
+    is_active: Optional[bool] = True
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
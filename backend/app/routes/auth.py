@@ -15,11 +15,13 @@ Chức năng chính:
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Optional
-from app.models.user import User, UserCreate, UserResponse, Token, UserLogin
+from app.models.user import User, UserCreate, UserResponse, Token, UserLogin, UserPrincipal
 from app.services.auth_service import (
     get_current_user,
+    get_user_by_email,
+    invalidate_user,
     verify_google_token,
     create_access_token,
     get_password_hash,
@@ -40,19 +42,19 @@ router = APIRouter()
 
 # Đăng ký tài khoản mới
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Đăng ký tài khoản mới.
 
     Args:
         user (UserCreate): Thông tin người dùng mới
-        db (Session): Database session
+        db (AsyncSession): Database session
 
     Returns:
         UserResponse: Thông tin người dùng đã tạo
     """
     # Kiểm tra email đã tồn tại chưa
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -60,7 +62,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Tạo người dùng mới
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         email=user.email,
         name=user.name,
@@ -69,8 +71,9 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await invalidate_user(db_user.email)
 
     return db_user
 
@@ -79,14 +82,14 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Đăng nhập và tạo access token.
 
     Args:
         form_data (OAuth2PasswordRequestForm): Form đăng nhập
-        db (Session): Database session
+        db (AsyncSession): Database session
 
     Returns:
         Token: JWT token
@@ -112,14 +115,14 @@ async def login_for_access_token(
 @router.post("/login", response_model=Token)
 async def login_json(
         user_data: UserLogin,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Đăng nhập với JSON payload.
 
     Args:
         user_data (UserLogin): Thông tin đăng nhập
-        db (Session): Database session
+        db (AsyncSession): Database session
 
     Returns:
         Token: JWT token
@@ -159,13 +162,13 @@ async def google_login():
 
 # Xử lý callback từ Google
 @router.get("/google/callback")
-async def google_callback(code: str, db: Session = Depends(get_db)):
+async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
     """
     Xử lý callback từ Google OAuth và tạo JWT token.
 
     Args:
         code (str): Authorization code từ Google
-        db (Session): Database session
+        db (AsyncSession): Database session
 
     Returns:
         Token: JWT token
@@ -197,7 +200,7 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
         user_data = await verify_google_token(id_token)
 
         # Kiểm tra người dùng đã tồn tại chưa
-        db_user = db.query(User).filter(User.email == user_data["email"]).first()
+        db_user = await get_user_by_email(db, user_data["email"])
 
         if not db_user:
             # Tạo người dùng mới
@@ -207,8 +210,9 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
                 provider="google"
             )
             db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
+            await db.commit()
+            await db.refresh(db_user)
+            await invalidate_user(db_user.email)
 
         # Tạo JWT token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -222,13 +226,13 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
 
 # Endpoint hiện tại vẫn giữ để hỗ trợ client có token ID Google sẵn
 @router.post("/google", response_model=Token)
-async def login_with_google(token: str, db: Session = Depends(get_db)):
+async def login_with_google(token: str, db: AsyncSession = Depends(get_db)):
     """
     Đăng nhập bằng Google OAuth token ID.
 
     Args:
         token (str): Google OAuth token
-        db (Session): Database session
+        db (AsyncSession): Database session
 
     Returns:
         Token: JWT token
@@ -236,7 +240,7 @@ async def login_with_google(token: str, db: Session = Depends(get_db)):
     user_data = await verify_google_token(token)
 
     # Kiểm tra người dùng đã tồn tại chưa
-    db_user = db.query(User).filter(User.email == user_data["email"]).first()
+    db_user = await get_user_by_email(db, user_data["email"])
 
     if not db_user:
         # Tạo người dùng mới
@@ -246,8 +250,9 @@ async def login_with_google(token: str, db: Session = Depends(get_db)):
             provider="google"
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        await invalidate_user(db_user.email)
 
     # Tạo JWT token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -260,12 +265,12 @@ async def login_with_google(token: str, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: UserPrincipal = Depends(get_current_user)):
     """
     Lấy thông tin người dùng hiện tại.
 
     Args:
-        current_user (User): Người dùng hiện tại (từ token)
+        current_user (UserPrincipal): Người dùng hiện tại (từ token)
 
     Returns:
         UserResponse: Thông tin người dùng
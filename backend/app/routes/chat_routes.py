@@ -5,113 +5,91 @@ Mục đích:
 - Quản lý cuộc trò chuyện và tin nhắn giữa người dùng và AI.
 - Xử lý stream phản hồi từ LLM.
 - Lưu trữ lịch sử cuộc trò chuyện vào database.
+- Chỉ lấy cửa sổ lịch sử gần nhất (cache theo hội thoại) và chọn theo ngân sách token để tạo prompt.
 
 Chức năng chính:
-- Định nghĩa class AITutorPrompt để định dạng prompt cho LLM.
-- Cung cấp API để tạo, lấy danh sách và chi tiết cuộc trò chuyện.
+- Tạo prompt từ template đã biên dịch sẵn (prefix cố định, lịch sử nối phía sau).
+- Cung cấp API để tạo, lấy danh sách (tóm tắt, phân trang theo cursor) và chi tiết cuộc trò chuyện.
+- Lấy tin nhắn theo trang (cursor hai chiều), ghi JSON dần theo từng tin nhắn thay vì dựng cả danh sách.
 - Xử lý việc thêm tin nhắn vào cuộc trò chuyện.
-- Stream phản hồi từ LLM về client theo thời gian thực.
-- Theo dõi và kiểm tra quota token trước khi gọi LLM.
+- Stream phản hồi từ LLM về client theo thời gian thực (qua cache câu trả lời nếu được bật),
+  dạng text/plain hoặc Server-Sent Events.
+- Hủy request tới LLM khi client ngắt kết nối, chỉ tính số token đã thực sự sinh ra.
+- Lưu dần câu trả lời trong lúc stream và ghi trạng thái complete/truncated/failed của tin nhắn.
+- Giữ trước token (prompt + max_tokens) trên sổ quota trước khi gọi LLM, chốt theo số token thực tế sau khi stream.
+- Xếp lượt chat vào hàng đợi gọi LLM (app.services.admission): /chat chờ trước khi trả header (503 nếu
+  quá deadline), /chat/sse báo vị trí trong hàng đợi bằng sự kiện "queued".
 - Cung cấp API để lấy thông tin sử dụng token của người dùng.
+- Đo thời gian từng giai đoạn của lượt chat (lưu tin nhắn, lịch sử, prompt, commit cuối) bằng span.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+import logging
+import math
+from contextlib import aclosing
+from functools import partial
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List, Dict
-from app.models.user import User
-from app.models.chat import Conversation, Message, ConversationCreate, ConversationResponse, MessageCreate, \
-    MessageResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional
+from app.models.user import UserPrincipal
+from app.models.chat import Conversation, Message, ConversationCreate, ConversationResponse, ConversationPage, \
+    MessageCreate, MessagePage, MessageResponse, MESSAGE_STATUS_STREAMING, MESSAGE_STATUS_COMPLETE, MESSAGE_STATUS_TRUNCATED, MESSAGE_STATUS_FAILED
+from app.services.admission import AdmissionRejected, Ticket, llm_admission, user_priority
 from app.services.auth_service import get_current_user
-from app.services.llm_client import generate_response_stream
-from app.services.token_service import check_token_quota
-from app.utils.reflection import Reflection
-from app.config import REFLECTION
+from app.services.conversation_service import list_conversation_summaries, record_message, decode_cursor, \
+    get_message_page, stream_message_page
+from app.services.llm_client import StreamUsage
+from app.services.response_cache import cached_response_stream
+from app.services.stream_persistence import MessageStreamWriter
+from app.services.quota_ledger import QuotaExceeded, Reservation
+from app.services.token_service import check_token_quota, reserve_tokens, settle_token_usage, release_tokens
+from app.utils.prompt_templates import AI_TUTOR_TEMPLATE
+from app.utils.streaming import DisconnectAwareStreamingResponse, sse_event
+from app.utils.tracing import span
+from app.services.history_service import get_recent_history, append_history
+from app.utils.token_counter import count_tokens
+from app.config import MAX_TOKENS, REFLECTION, HISTORY_WINDOW_SIZE, HISTORY_TOKEN_BUDGET, CONVERSATION_PAGE_SIZE, \
+    CONVERSATION_PAGE_MAX_SIZE, MESSAGE_PAGE_SIZE, MESSAGE_PAGE_MAX_SIZE
 from app.database import get_db
-from datetime import datetime
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
-class AITutorPrompt:
-    def __init__(self, history: list):
-        self.history = history
-
-        self.template = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-You are an AI tutor teaching programming to children in **Vietnamese**. Your task is to guide students step by step, helping them discover answers on their own instead of providing direct solutions.
-
-### **Guiding Rules:**
-1. **Step-by-step guidance:** When a student asks a question, do not provide the answer immediately. Instead, break down the problem, ask leading questions, and encourage critical thinking.
-2. **Keep guiding if the student struggles:** If the student cannot find the answer or is unsure, continue providing hints and explanations, but do not solve the problem for them.
-3. **Do not provide direct answers to specific solution requests:**
-   - If a student explicitly asks for a complete solution, guide them to think independently instead.
-   - Provide hints, ask leading questions, or suggest alternative approaches rather than giving a direct answer.
-   - Let the LLM generate better suggestions to help students develop a deeper understanding.
-   - Only provide a full solution if the student has made at least **three attempts** and still struggles.
-4. **All programming responses must use C and C++:**
-   - When providing examples, explanations, or coding exercises, use only **C or C++**.
-   - Do not use any other programming language. If a student asks about another language, guide them toward C/C++ with a suitable explanation.
-5. **Restart guidance when switching topics before completing the current one:**
-   - If the student abandons the current question and switches to another, restart guidance from the new question.
-   - If the student completes a question and asks a new one, continue naturally without restarting.
-6. **Respond only in Vietnamese:** All responses, explanations, and instructions must be in Vietnamese. Do not use any other language.
-7. **Use simple and friendly language:** Make explanations easy for children to understand.
-8. **Encourage creative thinking:** Praise the student’s efforts and motivate them to experiment and explore instead of just looking for the correct answer.
-9. **Explain mistakes clearly:** If the student gives a wrong answer, explain the mistake, provide examples, and guide them toward the correct understanding.
-
-### **Example Interaction:**
-Student: Làm sao để in "Hello, world!" trong C/C++?
-AI Tutor: Trước khi in một dòng chữ ra màn hình, bạn có biết lệnh nào trong C/C++ giúp mình hiển thị nội dung không?
-Student: echo "Hello, world!";
-AI Tutor: Gần đúng rồi! "echo" là lệnh trong một số ngôn ngữ như Bash, nhưng trong C/C++, ta cần một lệnh khác. Trong C, lệnh này bắt đầu bằng "p", còn trong C++ thì bắt đầu bằng "c". Em thử đoán xem?
-Student: printf?
-AI Tutor: Đúng rồi! Trong C, ta dùng printf. Vậy nếu muốn hiển thị dòng chữ "Hello, world!" trên màn hình, bạn sẽ viết như thế nào?
-Student: printf("Hello, world!");
-AI Tutor: Tuyệt vời! Trong C,bạn cần thêm #include <stdio.h> ở đầu chương trình nữa nhé.
-Student: Còn C++ thì sao ạ?
-AI Tutor: Trong C++, thay vì printf, ta dùng cout. Vậy bạn thử đoán xem, làm thế nào để in "Hello, world!" trong C++?
-Student: std::cout << "Hello, world!";
-AI Tutor: Chính xác! Đừng quên thêm #include <iostream> ở đầu chương trình nhé! Nếu bạn muốn in nội dung khác, chỉ cần thay đổi dòng chữ trong dấu ngoặc kép là được.
-
-### **Important Notes:**
-- **Only restart guidance if the student abandons the current question before completing it.**
-- **If the student finishes one question and asks another, continue answering without restarting.**
-- **All responses must be in Vietnamese.**
-
-### **Conversation History:**
-{history}
-
-### **Response:**
-<|eot_id|><|start_header_id|>user<|end_header_id|>
-<|eot_id|><|start_header_id|>assistant<|end_header_id|>
-"""
+async def get_user_conversation(db: AsyncSession, conversation_id: int, user_id: int):
+    """
+    Lấy cuộc hội thoại thuộc về người dùng.
 
-    def format(self) -> str:
-        """
-        Định dạng prompt với lịch sử hội thoại.
+    Args:
+        db (AsyncSession): Database session
+        conversation_id (int): ID cuộc hội thoại
+        user_id (int): ID người dùng
 
-        Returns:
-            str: Chuỗi prompt hoàn chỉnh.
-        """
-        formatted_history = "\n".join(
-            [f"{entry['role']}: {entry['content']}" for entry in self.history]
-        )
-        return self.template.format(history=formatted_history)
+    Returns:
+        Conversation: Cuộc hội thoại hoặc None nếu không tồn tại
+    """
+    result = await db.execute(
+        select(Conversation).where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+    )
+    return result.scalars().first()
 
 
 @router.post("/conversations", response_model=ConversationResponse)
 async def create_conversation(
         conversation: ConversationCreate,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Tạo cuộc hội thoại mới.
 
     Args:
         conversation (ConversationCreate): Dữ liệu cuộc hội thoại
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
     Returns:
         ConversationResponse: Cuộc hội thoại đã được tạo
@@ -121,60 +99,113 @@ async def create_conversation(
         title=conversation.title
     )
     db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation, ["id", "created_at", "updated_at", "messages"])
 
     return db_conversation
 
 
-@router.get("/conversations", response_model=List[ConversationResponse])
+@router.get("/conversations", response_model=ConversationPage)
 async def get_conversations(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        limit: int = Query(CONVERSATION_PAGE_SIZE, ge=1, le=CONVERSATION_PAGE_MAX_SIZE),
+        cursor: Optional[str] = None,
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """
-    Lấy danh sách cuộc hội thoại của người dùng.
+    Lấy danh sách cuộc hội thoại của người dùng (tóm tắt, phân trang theo cursor).
 
     Args:
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        limit (int): Số hội thoại mỗi trang
+        cursor (str, optional): next_cursor của trang trước
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
     Returns:
-        List[ConversationResponse]: Danh sách cuộc hội thoại
+        ConversationPage: Danh sách hội thoại, mới cập nhật trước, và cursor của trang tiếp theo
     """
-    conversations = db.query(Conversation).filter(
-        Conversation.user_id == current_user.id
-    ).all()
-
-    return conversations
+    try:
+        return await list_conversation_summaries(db, current_user.id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
         conversation_id: int,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Lấy chi tiết một cuộc hội thoại.
 
     Args:
         conversation_id (int): ID cuộc hội thoại
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
     Returns:
         ConversationResponse: Chi tiết cuộc hội thoại
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await get_user_conversation(db, conversation_id, current_user.id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    # Chỉ nhúng trang tin nhắn mới nhất, phần cũ hơn tải qua GET /messages?before=messages_prev_cursor
+    page = await get_message_page(db, conversation.id, MESSAGE_PAGE_SIZE)
+    return ConversationResponse(
+        id=conversation.id,
+        user_id=conversation.user_id,
+        title=conversation.title,
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at,
+        messages=page.items,
+        messages_prev_cursor=page.prev_cursor
+    )
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_messages(
+        conversation_id: int,
+        limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX_SIZE),
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Lấy một trang tin nhắn của cuộc hội thoại, từ cũ đến mới.
+
+    Không truyền cursor: trang mới nhất. `before`: các tin nhắn ngay trước vị trí đó (prev_cursor),
+    `after`: các tin nhắn ngay sau vị trí đó (next_cursor).
+
+    Args:
+        conversation_id (int): ID cuộc hội thoại
+        limit (int): Số tin nhắn mỗi trang
+        before (str, optional): Cursor để lấy các tin nhắn cũ hơn
+        after (str, optional): Cursor để lấy các tin nhắn mới hơn
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
+    Returns:
+        StreamingResponse: JSON dạng MessagePage, được ghi dần theo từng tin nhắn
+    """
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or after, not both")
+    try:
+        before_position = decode_cursor(before) if before else None
+        after_position = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    conversation = await get_user_conversation(db, conversation_id, current_user.id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return conversation
+    return StreamingResponse(
+        stream_message_page(db, conversation_id, limit, before_position, after_position),
+        media_type="application/json"
+    )
 
 
 @router.post("/conversations/{conversation_id}/messages", response_model=MessageResponse)
@@ -182,8 +213,8 @@ async def create_message(
         conversation_id: int,
         message: MessageCreate,
         background_tasks: BackgroundTasks,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Tạo tin nhắn mới và nhận phản hồi từ assistant.
@@ -192,17 +223,14 @@ async def create_message(
         conversation_id (int): ID cuộc hội thoại
         message (MessageCreate): Nội dung tin nhắn
         background_tasks (BackgroundTasks): FastAPI background tasks
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
     Returns:
         MessageResponse: Tin nhắn đã được tạo
     """
     # Kiểm tra cuộc hội thoại tồn tại và thuộc về người dùng
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await get_user_conversation(db, conversation_id, current_user.id)
 
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -211,42 +239,34 @@ async def create_message(
     user_message = Message(
         conversation_id=conversation_id,
         role="user",
-        content=message.content
+        content=message.content,
+        token_count=count_tokens(message.content)
     )
     db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
+    await db.commit()
+    await db.refresh(user_message)
+    append_history(conversation_id, "user", user_message.content, user_message.token_count)
 
-    # Cập nhật thời gian cuộc hội thoại
-    conversation.updated_at = datetime.now()
-    db.commit()
+    # Cập nhật tóm tắt và thời gian cuộc hội thoại
+    await record_message(db, conversation_id, user_message.content, user_message.token_count)
 
     return user_message
 
 
-@router.post("/conversations/{conversation_id}/chat")
-async def chat(
-        conversation_id: int,
-        message: Dict[str, str],
-        request: Request,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
-):
+async def check_chat_turn(conversation_id: int, current_user: UserPrincipal, db: AsyncSession):
     """
-    Gửi tin nhắn và nhận phản hồi realtime từ assistant.
+    Kiểm tra một lượt chat có được thực hiện không, trước khi xếp hàng chờ gọi LLM.
 
     Args:
         conversation_id (int): ID cuộc hội thoại
-        message (Dict[str, str]): Tin nhắn người dùng ({"content": "..."})
-        request (Request): FastAPI request
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
-    Returns:
-        StreamingResponse: Stream phản hồi từ assistant
+    Raises:
+        HTTPException: 429 nếu hết quota token, 404 nếu không tìm thấy cuộc hội thoại
     """
-    # Kiểm tra token quota
-    token_quota = await check_token_quota(db, current_user.id)
+    # Kiểm tra nhanh token quota (trong bộ nhớ); phần giữ trước chính xác nằm ở start_chat_turn
+    token_quota = await check_token_quota(current_user.id)
     if token_quota["tokens_remaining"] <= 0:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -254,76 +274,285 @@ async def chat(
         )
 
     # Kiểm tra cuộc hội thoại tồn tại và thuộc về người dùng
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    with span("conversation"):
+        conversation = await get_user_conversation(db, conversation_id, current_user.id)
 
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # Lưu tin nhắn của người dùng
-    user_message = Message(
-        conversation_id=conversation_id,
-        role="user",
-        content=message["content"]
+
+def capacity_exceeded(error: AdmissionRejected) -> HTTPException:
+    """Lỗi 503 kèm Retry-After khi hàng đợi LLM từ chối request."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
     )
-    db.add(user_message)
-    db.commit()
 
-    # Lấy lịch sử tin nhắn của cuộc hội thoại
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at).all()
 
-    history = [{"role": msg.role, "content": msg.content} for msg in messages]
+def enqueue_chat_turn(current_user: UserPrincipal) -> Ticket:
+    """
+    Xếp lượt chat vào hàng đợi gọi LLM (công bằng theo người dùng, theo bậc ưu tiên).
 
-    # Tạo prompt từ lịch sử gần nhất
-    latest_history = REFLECTION(history, lastItemsConsidereds=8)
-    prompt = AITutorPrompt(history=latest_history).format()
+    Args:
+        current_user (UserPrincipal): Người dùng hiện tại
 
-    # Tạo assistant message trống để cập nhật sau
-    assistant_message = Message(
-        conversation_id=conversation_id,
-        role="assistant",
-        content=""
-    )
-    db.add(assistant_message)
-    db.commit()
-    db.refresh(assistant_message)
+    Returns:
+        Ticket: Vé trong hàng đợi (đã được nhận nếu còn chỗ)
+
+    Raises:
+        HTTPException: 503 nếu hàng đợi đầy hoặc thời gian chờ ước lượng vượt deadline
+    """
+    try:
+        return llm_admission.enqueue(current_user.id, user_priority(current_user.email))
+    except AdmissionRejected as e:
+        raise capacity_exceeded(e)
+
+
+async def start_chat_turn(conversation_id: int, content: str, current_user: UserPrincipal, db: AsyncSession,
+                          ticket: Ticket):
+    """
+    Bắt đầu một lượt chat đã được nhận vào hàng đợi: tạo prompt, giữ trước token
+    (prompt + MAX_TOKENS), lưu tin nhắn người dùng và tạo generator stream câu trả lời của assistant.
+
+    Generator luôn lưu phần trả lời đã sinh và chốt số token thực tế, kể cả khi
+    client ngắt kết nối giữa chừng (trạng thái truncated) hoặc upstream lỗi (failed).
+    Chỗ trong hàng đợi LLM được trả ngay khi stream từ upstream kết thúc, hoặc ngay từ đầu nếu câu trả lời
+    lấy từ cache hay dùng chung lần gọi upstream của một request giống hệt đang chạy.
+    Nếu generator không bao giờ chạy, người gọi cần hủy phần giữ trước bằng release_tokens().
+
+    Args:
+        conversation_id (int): ID cuộc hội thoại (đã kiểm tra bằng check_chat_turn)
+        content (str): Nội dung tin nhắn người dùng
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
+        ticket (Ticket): Vé đã được nhận trong hàng đợi LLM
+
+    Returns:
+        Tuple[Message, AsyncGenerator, Reservation]: Tin nhắn assistant, generator các token và phần giữ trước
 
-    # Cập nhật thời gian cuộc hội thoại
-    conversation.updated_at = datetime.now()
-    db.commit()
+    Raises:
+        HTTPException: 429 nếu không đủ quota để giữ trước (tin nhắn người dùng chưa được lưu)
+    """
+    token_count = count_tokens(content)
+
+    # Lấy cửa sổ lịch sử gần nhất (từ cache, hoặc chỉ truy vấn các tin nhắn cần dùng)
+    with span("history"):
+        history = await get_recent_history(db, conversation_id)
+
+    # Chọn lịch sử theo ngân sách token (kể cả tin nhắn mới), từ tin nhắn mới nhất trở về trước
+    with span("prompt"):
+        history = history + [{"role": "user", "content": content, "token_count": token_count}]
+        latest_history = REFLECTION(history, lastItemsConsidereds=HISTORY_WINDOW_SIZE,
+                                    token_budget=HISTORY_TOKEN_BUDGET)
+        prompt = AI_TUTOR_TEMPLATE.render(latest_history)
+        prompt_tokens = AI_TUTOR_TEMPLATE.count_prompt_tokens(latest_history)
+
+    # Giữ trước số token tối đa của lượt chat để các stream đồng thời không cùng vượt quota
+    try:
+        reservation = await reserve_tokens(current_user.id, prompt_tokens + MAX_TOKENS)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+    try:
+        # Lưu tin nhắn của người dùng
+        with span("save_message"):
+            user_message = Message(
+                conversation_id=conversation_id,
+                role="user",
+                content=content,
+                token_count=token_count
+            )
+            db.add(user_message)
+            await db.commit()
+            append_history(conversation_id, "user", user_message.content, user_message.token_count)
+            await record_message(db, conversation_id, user_message.content, user_message.token_count)
+
+        # Tạo assistant message trống, nội dung được lưu dần trong lúc stream
+        with span("placeholder"):
+            assistant_message = Message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content="",
+                status=MESSAGE_STATUS_STREAMING
+            )
+            db.add(assistant_message)
+            await db.commit()
+            await db.refresh(assistant_message)
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await release_tokens(reservation)
+        raise
 
     # Tạo generator để xử lý stream
     async def message_generator():
-        full_response = ""
+        usage = StreamUsage()
+        writer = MessageStreamWriter(db, assistant_message)
+        written_tokens = 0
+        # Mặc định là truncated: generator bị hủy/đóng giữa chừng khi client ngắt kết nối
+        message_status = MESSAGE_STATUS_TRUNCATED
+
+        try:
+            async with aclosing(cached_response_stream(prompt, latest_history, usage=usage,
+                                                       prompt_tokens=prompt_tokens,
+                                                       on_shared=partial(llm_admission.release, ticket))) as tokens:
+                async for token in tokens:
+                    # StreamUsage đã đếm token của chunk: dùng lại thay vì để writer đếm lần nữa
+                    counted = usage.completion_tokens
+                    await writer.write(token, max(counted - written_tokens, 0))
+                    written_tokens = counted
+                    yield token
+            # Hoàn thành (truncated nếu bị cắt do max_tokens)
+            if usage.finish_reason != "length":
+                message_status = MESSAGE_STATUS_COMPLETE
+        except Exception:
+            # Lỗi từ upstream: giữ lại phần đã sinh và đánh dấu failed
+            message_status = MESSAGE_STATUS_FAILED
+            raise
+        finally:
+            llm_admission.release(ticket)
+            # Không để việc hủy (client ngắt kết nối) cắt ngang việc lưu câu trả lời và tính token
+            with anyio.CancelScope(shield=True):
+                with span("finalize"):
+                    response_text = await writer.finish(message_status, usage.completion_tokens)
+                    # Giống load_history_window(): câu trả lời bị lỗi không được đưa vào prompt
+                    if message_status != MESSAGE_STATUS_FAILED:
+                        append_history(conversation_id, "assistant", response_text, usage.completion_tokens)
+                    await record_message(db, conversation_id, response_text, usage.completion_tokens)
+
+                # Chỉ tính số token thực tế đã sinh (prompt + completion), trả lại phần giữ thừa
+                await settle_token_usage(reservation, usage.total_tokens)
+
+    return assistant_message, message_generator(), reservation
+
+
+async def end_chat_turn(ticket: Ticket, reservation: Optional[Reservation]):
+    """
+    Dọn dẹp khi response của lượt chat kết thúc: trả chỗ trong hàng đợi LLM và hủy phần giữ trước
+    nếu generator chưa từng chạy (đã chốt thì không làm gì).
+    """
+    llm_admission.release(ticket)
+    if reservation is not None:
+        await release_tokens(reservation)
 
-        async for token in generate_response_stream(prompt, current_user.id, db=db):
-            full_response += token
-            yield token
 
-        # Cập nhật tin nhắn assistant khi đã hoàn thành
-        assistant_message.content = full_response
-        db.commit()
+@router.post("/conversations/{conversation_id}/chat")
+async def chat(
+        conversation_id: int,
+        message: Dict[str, str],
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Gửi tin nhắn và nhận phản hồi realtime từ assistant.
 
-    return StreamingResponse(message_generator(), media_type="text/plain")
+    Khi client ngắt kết nối, request tới LLM bị hủy ngay và phần trả lời dở được lưu lại.
+
+    Args:
+        conversation_id (int): ID cuộc hội thoại
+        message (Dict[str, str]): Tin nhắn người dùng ({"content": "..."})
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
+
+    Returns:
+        StreamingResponse: Stream phản hồi từ assistant
+    """
+    await check_chat_turn(conversation_id, current_user, db)
+
+    # Chờ tới lượt gọi LLM trước khi trả header, để request chờ quá deadline nhận 503
+    ticket = enqueue_chat_turn(current_user)
+    try:
+        with span("admission"):
+            await llm_admission.acquire(ticket)
+        _, tokens, reservation = await start_chat_turn(conversation_id, message["content"], current_user, db,
+                                                       ticket)
+    except AdmissionRejected as e:
+        raise capacity_exceeded(e)
+    except BaseException:
+        llm_admission.release(ticket)
+        raise
+    return DisconnectAwareStreamingResponse(tokens, media_type="text/plain",
+                                            on_close=partial(end_chat_turn, ticket, reservation))
+
+
+@router.post("/conversations/{conversation_id}/chat/sse")
+async def chat_sse(
+        conversation_id: int,
+        message: Dict[str, str],
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Giống /chat nhưng stream dạng Server-Sent Events.
+
+    Khi phải chờ tới lượt gọi LLM, phát sự kiện "queued" {"position": n} mỗi khi vị trí thay đổi;
+    chờ quá deadline thì phát sự kiện "rejected" {"detail": "...", "status": 503, "retry_after": giây} và kết thúc;
+    không đủ quota token để giữ trước thì phát "rejected" {"detail": "...", "status": 429}.
+    Mỗi token là một sự kiện {"token": "..."}; sự kiện cuối "done" chứa id và trạng thái của tin nhắn.
+
+    Args:
+        conversation_id (int): ID cuộc hội thoại
+        message (Dict[str, str]): Tin nhắn người dùng ({"content": "..."})
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
+
+    Returns:
+        StreamingResponse: Stream sự kiện text/event-stream
+    """
+    await check_chat_turn(conversation_id, current_user, db)
+    ticket = enqueue_chat_turn(current_user)
+
+    async def event_generator():
+        try:
+            with span("admission"):
+                async with aclosing(llm_admission.watch(ticket)) as positions:
+                    async for position in positions:
+                        yield sse_event({"position": position}, event="queued")
+        except AdmissionRejected as e:
+            yield sse_event({"detail": str(e), "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                             "retry_after": math.ceil(e.retry_after)}, event="rejected")
+            return
+
+        try:
+            assistant_message, tokens, reservation = await start_chat_turn(conversation_id, message["content"],
+                                                                           current_user, db, ticket)
+        except HTTPException as e:
+            yield sse_event({"detail": e.detail, "status": e.status_code}, event="rejected")
+            return
+
+        try:
+            async with aclosing(tokens):
+                async for token in tokens:
+                    yield sse_event({"token": token})
+        except Exception as e:
+            logger.error(f"Chat stream failed for message {assistant_message.id}: {e}")
+        finally:
+            # Generator token bị đóng trước khi chạy thì phần giữ trước chưa được chốt
+            with anyio.CancelScope(shield=True):
+                await release_tokens(reservation)
+        yield sse_event({"id": assistant_message.id, "status": assistant_message.status}, event="done")
+
+    return DisconnectAwareStreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        on_close=partial(llm_admission.release, ticket)
+    )
 
 
 @router.get("/token-usage")
 async def get_token_usage(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Lấy thông tin về việc sử dụng token của người dùng.
 
     Args:
-        current_user (User): Người dùng hiện tại
-        db (Session): Database session
+        current_user (UserPrincipal): Người dùng hiện tại
+        db (AsyncSession): Database session
 
     Returns:
         Dict: Thông tin về việc sử dụng token
     """
-    return await check_token_quota(db, current_user.id)
\ No newline at end of file
+    return await check_token_quota(current_user.id)
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+backend/app/routes/metrics.py
+------------------
+Mục đích:
+- Công khai số liệu vận hành theo định dạng Prometheus tại /metrics.
+
+Chức năng chính:
+- Xuất các số liệu được ghi trên đường xử lý request (app.utils.metrics).
+- Đọc thêm các thống kê sẵn có lúc scrape (không tốn chi phí trên đường xử lý request):
+  trạng thái DB pool, hit/miss của các cache, single-flight, connection pool, backend và hàng đợi gọi LLM,
+  số liệu sử dụng đang chờ ghi xuống database.
+"""
+from typing import List
+
+from fastapi import APIRouter, Response
+
+from app.database import async_engine, engine
+from app.services.admission import llm_admission
+from app.services.auth_service import user_identity_cache
+from app.services.history_service import history_cache
+from app.services.llm_client import pool_stats
+from app.services.llm_router import CIRCUIT_CLOSED, llm_router
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.usage_aggregator import usage_aggregator
+from app.utils.metrics import MetricFamily, PROMETHEUS_CONTENT_TYPE, registry
+
+router = APIRouter()
+
+
+def collect_db_pools() -> List[MetricFamily]:
+    """Trạng thái hiện tại của các DB pool."""
+    size = MetricFamily("db_pool_size", "gauge", "Số kết nối tối đa thường trực của DB pool.")
+    checked_out = MetricFamily("db_pool_checked_out", "gauge", "Số kết nối DB đang được dùng.")
+    overflow = MetricFamily("db_pool_overflow", "gauge", "Số kết nối DB mở vượt pool_size.")
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        if hasattr(pool, "checkedout"):
+            size.add(pool.size(), pool=name)
+            checked_out.add(pool.checkedout(), pool=name)
+            overflow.add(max(pool.overflow(), 0), pool=name)
+    return [size, checked_out, overflow]
+
+
+def collect_caches() -> List[MetricFamily]:
+    """Hit/miss của các cache trong tiến trình."""
+    hits = MetricFamily("cache_hits_total", "counter", "Số lần tìm thấy trong cache.")
+    misses = MetricFamily("cache_misses_total", "counter", "Số lần không tìm thấy trong cache.")
+    entries = MetricFamily("cache_entries", "gauge", "Số phần tử đang lưu trong cache.")
+    for name, stats in (("user_identity", user_identity_cache.stats()), ("history", history_cache.stats()),
+                        ("response", response_cache.stats())):
+        hits.add(stats["hits"], cache=name)
+        misses.add(stats["misses"], cache=name)
+        entries.add(stats.get("size", stats.get("contexts", 0)), cache=name)
+
+    flights = single_flight.stats()
+    return [
+        hits, misses, entries,
+        MetricFamily("llm_single_flight_calls_total", "counter", "Request LLM theo cách được phục vụ.")
+        .add(flights["upstream_calls"], kind="upstream").add(flights["saved_calls"], kind="shared"),
+        MetricFamily("llm_pool_connections_total", "counter", "Kết nối tới LLM theo loại.")
+        .add(pool_stats.connections_opened, kind="opened").add(pool_stats.connections_reused, kind="reused"),
+    ]
+
+
+def collect_llm_backends() -> List[MetricFamily]:
+    """Sức khỏe hiện tại của từng backend LLM."""
+    circuit_open = MetricFamily("llm_backend_circuit_open", "gauge", "1 nếu circuit của backend đang mở/thăm dò.")
+    ttft = MetricFamily("llm_backend_ewma_ttft_seconds", "gauge", "TTFT trung bình (EWMA) của backend.")
+    error_rate = MetricFamily("llm_backend_error_rate", "gauge", "Tỉ lệ lỗi (EWMA) của backend.")
+    for backend in llm_router.backends:
+        circuit_open.add(int(backend.circuit != CIRCUIT_CLOSED), backend=backend.name)
+        ttft.add(backend.ttft or 0.0, backend=backend.name)
+        error_rate.add(backend.error_rate, backend=backend.name)
+    return [circuit_open, ttft, error_rate]
+
+
+def collect_admission() -> List[MetricFamily]:
+    """Trạng thái hiện tại của hàng đợi gọi LLM."""
+    return [
+        MetricFamily("llm_admission_active", "gauge", "Số lượt gọi LLM đang giữ chỗ.").add(llm_admission.active),
+        MetricFamily("llm_admission_queue_depth", "gauge", "Số request đang chờ gọi LLM.")
+        .add(llm_admission.waiting),
+    ]
+
+
+def collect_usage() -> List[MetricFamily]:
+    """Số liệu sử dụng đang chờ ghi xuống database (mất nếu tiến trình bị kill)."""
+    return [
+        MetricFamily("usage_pending_rows", "gauge", "Số bản ghi (loại, người dùng, ngày) đang chờ ghi xuống database.")
+        .add(usage_aggregator.pending_rows()),
+    ]
+
+
+registry.register_collector(collect_db_pools)
+registry.register_collector(collect_caches)
+registry.register_collector(collect_llm_backends)
+registry.register_collector(collect_admission)
+registry.register_collector(collect_usage)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """
+    Xuất số liệu vận hành cho Prometheus.
+
+    Returns:
+        Response: Số liệu dạng text exposition
+    """
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,206 @@
+"""
+backend/app/routes/monitoring.py
+------------------
+Mục đích:
+- Cung cấp các endpoint theo dõi tình trạng hoạt động của ứng dụng.
+- Cung cấp cho quản trị viên các số liệu thống kê phục vụ việc tối ưu hiệu năng.
+
+Chức năng chính:
+- Mọi route đều chỉ dành cho quản trị viên (get_admin_user): số liệu cho biết tải và cấu hình nội bộ.
+- Cung cấp route /api/monitoring/llm-pool để xem thống kê connection pool tới API LLM
+  (số kết nối mở mới, số lần tái sử dụng, TTFT trung bình theo từng loại kết nối).
+- Cung cấp route /api/monitoring/llm-backends để xem trạng thái từng backend LLM
+  (TTFT EWMA, tỉ lệ lỗi, circuit).
+- Cung cấp route /api/monitoring/hedging để xem số request dự phòng đã gửi/thắng và ngưỡng hiện tại.
+- Cung cấp route /api/monitoring/response-cache để xem tỉ lệ hit/miss của cache câu trả lời.
+- Cung cấp route /api/monitoring/single-flight để xem số lần gọi LLM tiết kiệm được nhờ gộp request.
+- Cung cấp route /api/monitoring/admission để xem hàng đợi gọi LLM (đang chạy, đang chờ, bị từ chối).
+- Cung cấp route /api/monitoring/usage để xem việc ghi số request/token theo lô (số sự kiện, số transaction).
+- Cung cấp route /api/monitoring/password-hashing để xem executor hash mật khẩu (đang chạy, đang chờ, bị từ chối).
+- Cung cấp route /api/monitoring/schema để kiểm tra index và kế hoạch của các truy vấn nóng.
+- Cung cấp route /api/monitoring/profile chạy sampling profiler trên traffic thật và
+  trả về folded stacks để vẽ flamegraph.
+"""
+
+import asyncio
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import Dict, Any, List
+from app.config import PROFILER_MAX_SECONDS, PROFILER_SAMPLE_INTERVAL
+from app.models.user import UserPrincipal
+from app.services.admission import llm_admission
+from app.services.auth_service import get_admin_user
+from app.services.hedging import hedge_policy
+from app.services.llm_client import pool_stats
+from app.services.llm_router import llm_router
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.password_hasher import password_hasher
+from app.services.schema_verifier import verify_schema
+from app.services.usage_aggregator import usage_aggregator
+from app.utils.profiler import ProfilerBusyError, SamplingProfiler
+
+router = APIRouter()
+
+
+@router.get("/llm-pool")
+async def get_llm_pool_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê connection pool tới API LLM.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Thống kê tái sử dụng kết nối và TTFT
+    """
+    return pool_stats.snapshot()
+
+
+@router.get("/llm-backends")
+async def get_llm_backends(admin: UserPrincipal = Depends(get_admin_user)) -> List[Dict[str, Any]]:
+    """
+    Lấy trạng thái các backend LLM (chỉ quản trị viên: có URL của các upstream).
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        List[Dict]: TTFT EWMA, tỉ lệ lỗi, số request đang chạy và trạng thái circuit của từng backend
+    """
+    return llm_router.snapshot()
+
+
+@router.get("/hedging")
+async def get_hedging_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê hedging.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Ngưỡng hiện tại, số hedge đã gửi, đã thắng và bị chặn bởi ngân sách
+    """
+    return hedge_policy.stats()
+
+
+@router.get("/response-cache")
+async def get_response_cache_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê cache câu trả lời.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Số lần hit/miss, tỉ lệ hit và số ngữ cảnh đang lưu
+    """
+    return response_cache.stats()
+
+
+@router.get("/single-flight")
+async def get_single_flight_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê gộp các request LLM giống hệt nhau.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Số lần gọi upstream và số lần gọi tiết kiệm được
+    """
+    return single_flight.stats()
+
+
+@router.get("/admission")
+async def get_admission_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê hàng đợi gọi LLM.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Số lượt đang chạy, đang chờ, đã nhận, bị từ chối và thời gian chờ ước lượng
+    """
+    return llm_admission.stats()
+
+
+@router.get("/usage")
+async def get_usage_flush_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê ghi số liệu sử dụng theo lô.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Số sự kiện đã gom, số lần ghi, số bản ghi đang chờ và số transaction tiết kiệm được
+    """
+    return usage_aggregator.stats()
+
+
+@router.get("/password-hashing")
+async def get_password_hashing_stats(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Lấy thống kê executor hash mật khẩu.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Số thao tác đang chạy, đang chờ, đã xong và bị từ chối
+    """
+    return password_hasher.stats()
+
+
+@router.get("/schema")
+async def get_schema_report(admin: UserPrincipal = Depends(get_admin_user)) -> Dict[str, Any]:
+    """
+    Kiểm tra schema database: bảng/cột/index còn thiếu và các truy vấn nóng quét toàn bảng.
+
+    Chỉ quản trị viên: mỗi lần gọi mở engine riêng, đọc schema và chạy EXPLAIN các truy vấn nóng.
+
+    Args:
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Dict: Kết quả kiểm tra schema
+    """
+    report = await asyncio.to_thread(verify_schema)
+    return report.to_dict()
+
+
+@router.get("/profile")
+async def run_profiler(
+        seconds: float = Query(10.0, gt=0, le=PROFILER_MAX_SECONDS),
+        interval: float = Query(PROFILER_SAMPLE_INTERVAL, ge=0.001, le=1.0),
+        all_threads: bool = False,
+        admin: UserPrincipal = Depends(get_admin_user)
+) -> Response:
+    """
+    Chạy sampling profiler trong một khoảng thời gian, trong khi ứng dụng vẫn phục vụ traffic.
+
+    Mặc định chỉ lấy mẫu thread của event loop (nơi chạy toàn bộ code async của request).
+
+    Args:
+        seconds (float): Thời gian profiling (tối đa PROFILER_MAX_SECONDS)
+        interval (float): Khoảng cách giữa hai lần lấy mẫu (giây)
+        all_threads (bool): Lấy mẫu mọi thread (kể cả thread pool của DB/bcrypt)
+        admin (UserPrincipal): Quản trị viên hiện tại
+
+    Returns:
+        Response: Folded stacks dạng text/plain (dùng với flamegraph.pl hoặc speedscope)
+
+    Raises:
+        HTTPException: 409 nếu đang có một lần profiling khác chạy
+    """
+    profiler = SamplingProfiler(interval, None if all_threads else [threading.get_ident()])
+    try:
+        await asyncio.to_thread(profiler.run, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(profiler.folded(), media_type="text/plain",
+                    headers={"X-Profile-Samples": str(profiler.samples)})
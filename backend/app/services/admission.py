@@ -0,0 +1,278 @@
+"""
+backend/app/services/admission.py
+------------------
+Mục đích:
+- Giới hạn số lượt sinh câu trả lời chạy đồng thời tới LLM trên mỗi worker, để upstream không bị quá tải
+  và không throttle toàn bộ ứng dụng.
+- Chia công bằng chỗ trống giữa các người dùng: một người gửi dồn dập nhiều request không chiếm hết
+  lượt của cả lớp.
+
+Chức năng chính:
+- Class AdmissionController: hàng đợi weighted fair queuing (start-time fair queuing) theo người dùng,
+  với các bậc ưu tiên tùy chọn (bậc nhỏ hơn luôn được xét trước, trong cùng bậc chia công bằng theo trọng số).
+- Mỗi request nhận một Ticket; người chờ biết vị trí của mình trong hàng đợi (watch()).
+- Từ chối nhanh khi hàng đợi đầy, khi thời gian chờ ước lượng vượt deadline, hoặc khi chờ quá deadline.
+- Thống kê số lượt đang chạy, đang chờ, bị từ chối và thời gian chờ.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from app.config import (LLM_MAX_CONCURRENT_STREAMS, LLM_ADMISSION_MAX_QUEUE, LLM_ADMISSION_DEADLINE,
+                        LLM_PRIORITY_EMAILS)
+from app.utils.metrics import LLM_ADMISSION_REJECTIONS, LLM_ADMISSION_WAIT
+
+# Bậc ưu tiên: số nhỏ hơn được phục vụ trước
+PRIORITY_HIGH = 0
+PRIORITY_STANDARD = 1
+
+# Hệ số làm mượt của thời gian giữ chỗ trung bình (dùng để ước lượng thời gian chờ)
+_HOLD_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    Request không được nhận vào (hàng đợi đầy hoặc chờ quá deadline).
+
+    Thuộc tính:
+        reason (str): 'queue_full', 'deadline_estimate' hoặc 'deadline'
+        retry_after (float): Số giây gợi ý để thử lại
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    Một request đang chờ hoặc đang giữ chỗ.
+
+    Thuộc tính:
+        user_id (int): Người dùng gửi request
+        priority (int): Bậc ưu tiên
+        start_tag, finish_tag (float): Thời gian ảo bắt đầu/kết thúc theo WFQ
+        admitted (bool): Đã được nhận vào và đang giữ chỗ
+        done (bool): Đã trả chỗ hoặc đã rời hàng đợi
+    """
+
+    def __init__(self, user_id: int, priority: int, start_tag: float, finish_tag: float, deadline: float):
+        self.user_id = user_id
+        self.priority = priority
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.sequence = 0
+        self.admitted = False
+        self.done = False
+        # Được set mỗi khi hàng đợi thay đổi (vị trí có thể đã đổi hoặc đã được nhận)
+        self.changed = asyncio.Event()
+
+    @property
+    def waited(self) -> float:
+        """Thời gian đã chờ trong hàng đợi (giây)."""
+        return (self.admitted_at or time.monotonic()) - self.enqueued_at
+
+
+class AdmissionController:
+    """
+    Bộ điều phối số lượt gọi LLM đồng thời với hàng đợi công bằng theo người dùng.
+
+    Thuộc tính:
+        capacity (int): Số lượt được chạy đồng thời (0 là không giới hạn)
+        max_queue (int): Số request được chờ tối đa
+        deadline (float): Thời gian chờ tối đa (giây)
+        active (int): Số lượt đang giữ chỗ
+    """
+
+    def __init__(self, capacity: int = LLM_MAX_CONCURRENT_STREAMS, max_queue: int = LLM_ADMISSION_MAX_QUEUE,
+                 deadline: float = LLM_ADMISSION_DEADLINE):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.active = 0
+        # Hàng đợi (bậc ưu tiên, finish tag, thứ tự đến, ticket); ticket đã rời hàng được bỏ qua khi lấy ra
+        self._heap: List[Tuple[int, float, int, Ticket]] = []
+        self._waiting = 0
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        # Finish tag của request gần nhất theo từng người dùng
+        self._last_finish: Dict[int, float] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.hold_time = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _notify(self):
+        for entry in self._heap:
+            entry[3].changed.set()
+
+    def estimated_wait(self, position: int) -> float:
+        """Thời gian chờ ước lượng của request ở vị trí position (1 là người kế tiếp)."""
+        if not self.capacity or not self.hold_time:
+            return 0.0
+        return position * self.hold_time / self.capacity
+
+    def enqueue(self, user_id: int, priority: int = PRIORITY_STANDARD, weight: float = 1.0) -> Ticket:
+        """
+        Xếp một request vào hàng đợi; được nhận ngay nếu còn chỗ và không ai đang chờ.
+
+        Args:
+            user_id (int): Người dùng gửi request
+            priority (int): Bậc ưu tiên (PRIORITY_HIGH/PRIORITY_STANDARD)
+            weight (float): Trọng số của người dùng trong bậc (lớn hơn thì được phục vụ nhiều hơn)
+
+        Returns:
+            Ticket: Vé của request
+
+        Raises:
+            AdmissionRejected: Nếu hàng đợi đầy hoặc thời gian chờ ước lượng vượt deadline
+        """
+        start_tag = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        ticket = Ticket(user_id, priority, start_tag, start_tag + 1.0 / weight, time.monotonic() + self.deadline)
+
+        if not self.capacity or (self.active < self.capacity and not self._waiting):
+            self._admit(ticket)
+            self._last_finish[user_id] = ticket.finish_tag
+            return ticket
+
+        if self._waiting >= self.max_queue:
+            self._reject("queue_full")
+        if self.estimated_wait(self._waiting + 1) > self.deadline:
+            self._reject("deadline_estimate")
+
+        self._last_finish[user_id] = ticket.finish_tag
+        ticket.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (priority, ticket.finish_tag, ticket.sequence, ticket))
+        self._waiting += 1
+        self._notify()
+        return ticket
+
+    def _reject(self, reason: str):
+        self.rejected_total += 1
+        LLM_ADMISSION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason, retry_after=max(self.estimated_wait(self._waiting), 1.0))
+
+    def _admit(self, ticket: Ticket):
+        ticket.admitted = True
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        self.admitted_total += 1
+        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+        ticket.changed.set()
+        LLM_ADMISSION_WAIT.observe(ticket.waited)
+
+    def _dispatch(self):
+        """Nhận các request đứng đầu hàng đợi cho tới khi hết chỗ."""
+        while self._heap and (not self.capacity or self.active < self.capacity):
+            ticket = heapq.heappop(self._heap)[3]
+            if ticket.done:
+                continue
+            self._waiting -= 1
+            self._admit(ticket)
+        self._notify()
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        Vị trí của request trong hàng đợi (1 là người được nhận kế tiếp, 0 là đã được nhận).
+
+        Args:
+            ticket (Ticket): Vé của request
+
+        Returns:
+            int: Vị trí trong hàng đợi
+        """
+        if ticket.admitted or ticket.done:
+            return 0
+        key = (ticket.priority, ticket.finish_tag, ticket.sequence)
+        return 1 + sum(1 for priority, finish, sequence, other in self._heap
+                       if not other.done and (priority, finish, sequence) < key)
+
+    async def watch(self, ticket: Ticket) -> AsyncGenerator[int, None]:
+        """
+        Chờ tới lượt, phát vị trí trong hàng đợi mỗi khi vị trí thay đổi.
+
+        Args:
+            ticket (Ticket): Vé của request
+
+        Yields:
+            int: Vị trí hiện tại trong hàng đợi (chỉ khi còn phải chờ)
+
+        Raises:
+            AdmissionRejected: Nếu chờ quá deadline (vé đã được rời khỏi hàng đợi)
+        """
+        last_position = None
+        while not ticket.admitted:
+            ticket.changed.clear()
+            position = self.position(ticket)
+            if position != last_position:
+                last_position = position
+                yield position
+            remaining = ticket.deadline - time.monotonic()
+            if remaining <= 0:
+                self.release(ticket)
+                self._reject("deadline")
+            try:
+                await asyncio.wait_for(ticket.changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def acquire(self, ticket: Ticket):
+        """Chờ tới lượt mà không cần biết vị trí (xem watch())."""
+        async for _ in self.watch(ticket):
+            pass
+
+    def release(self, ticket: Ticket):
+        """
+        Trả chỗ (hoặc rời hàng đợi nếu chưa được nhận) và nhận request kế tiếp. Gọi nhiều lần không sao.
+
+        Args:
+            ticket (Ticket): Vé của request
+        """
+        if ticket.done:
+            return
+        ticket.done = True
+        if ticket.admitted:
+            self.active -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self.hold_time = held if not self.hold_time else (
+                _HOLD_TIME_ALPHA * held + (1 - _HOLD_TIME_ALPHA) * self.hold_time)
+        else:
+            self._waiting -= 1
+        if not self._waiting:
+            # Hàng đợi rỗng: bỏ các vé đã rời hàng và tag của người dùng không còn request chờ
+            self._heap.clear()
+            self._last_finish = {user_id: finish for user_id, finish in self._last_finish.items()
+                                 if finish > self._virtual_time}
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hàng đợi và số lượt đang chạy."""
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "waiting": self._waiting,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "avg_hold_seconds": round(self.hold_time, 3),
+            "estimated_wait_seconds": round(self.estimated_wait(self._waiting), 3)
+        }
+
+
+def user_priority(email: str) -> int:
+    """Bậc ưu tiên của người dùng: PRIORITY_HIGH nếu email nằm trong LLM_PRIORITY_EMAILS."""
+    return PRIORITY_HIGH if email in LLM_PRIORITY_EMAILS else PRIORITY_STANDARD
+
+
+llm_admission = AdmissionController()
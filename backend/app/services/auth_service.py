@@ -9,44 +9,86 @@ Mục đích:
 Chức năng chính:
 - Tạo JWT access token với thời gian hết hạn có thể cấu hình.
 - Xác minh JWT token và trích xuất thông tin người dùng.
-- Cung cấp dependency get_current_user để bảo vệ các endpoint.
+- Xác thực mỗi request đúng một lần (authenticate_request) và lưu principal vào request.state.
+- Cache danh tính người dùng (TTL/LRU) theo subject của token, có vô hiệu hóa tường minh;
+  mọi thay đổi người dùng đi qua update_user()/deactivate_user() để cache không giữ dữ liệu cũ.
+  Với RATE_LIMIT_BACKEND=redis, việc vô hiệu hóa được báo cho mọi worker qua một phiên bản trên Redis;
+  với bộ đếm trong bộ nhớ, các worker khác thấy thay đổi chậm nhất sau USER_CACHE_TTL giây.
+- Người dùng bị vô hiệu hóa (is_active = False) không đăng nhập và không xác thực được request.
+- Cung cấp dependency get_current_user để bảo vệ các endpoint, get_admin_user cho các endpoint quản trị.
+- Hash và xác minh mật khẩu trên executor riêng (app.services.password_hasher), không chặn event loop.
 - Xác thực token OAuth từ Google và lấy thông tin người dùng.
 - Xử lý các exception khi xác thực thất bại.
 """
+import math
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.models.user import User, TokenData
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User, TokenData, UserPrincipal
+from app.config import (SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, USER_CACHE_TTL, USER_CACHE_MAX_SIZE,
+                        ADMIN_EMAILS)
+from app.services.password_hasher import PasswordHasherBusy, password_hasher
+from app.services.rate_limiter import build_counter_store
+from app.utils.ttl_cache import TTLCache
+from app.utils.tracing import span
+
+from app.database import db_session
 
-from app.database import get_db
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-# Thêm đoạn này để xử lý hash mật khẩu
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cache danh tính người dùng theo email (subject của JWT)
+user_identity_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL)
+# Phiên bản danh tính theo email (thời điểm vô hiệu hóa gần nhất), dùng chung giữa các worker khi dùng Redis
+identity_versions = build_counter_store(prefix="aitutor:identity:")
+# Phiên bản sống lâu hơn nhiều so với mục trong cache; hết hạn thì mục cũ chỉ bị nạp lại
+_IDENTITY_VERSION_TTL = 7 * 24 * 3600
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
+
+def _password_busy(error: PasswordHasherBusy) -> HTTPException:
+    """Lỗi 503 kèm Retry-After khi executor hash mật khẩu quá tải."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
 
 
-def verify_password(plain_password, hashed_password):
-    """Xác minh mật khẩu"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    """Xác minh mật khẩu (bcrypt chạy ngoài event loop)"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy as e:
+        raise _password_busy(e)
 
 
-def get_password_hash(password):
-    """Hash mật khẩu"""
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    """Hash mật khẩu (bcrypt chạy ngoài event loop)"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy as e:
+        raise _password_busy(e)
 
 
-async def authenticate_user(db: Session, email: str, password: str):
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    """Tìm người dùng theo email"""
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
     """Xác thực người dùng bằng email và mật khẩu"""
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not user.hashed_password:
+    user = await get_user_by_email(db, email)
+    if not user or not user.hashed_password or not user.is_active:
         return False
-    if not verify_password(password, user.hashed_password):
+    # Kết thúc transaction chỉ đọc để trả kết nối về pool trong lúc chờ bcrypt
+    # (khi nhiều người đăng nhập cùng lúc, việc chờ có thể kéo dài vài giây)
+    await db.commit()
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -75,16 +117,150 @@ async def create_access_token(data: dict, expires_delta: Optional[timedelta] = N
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_access_token(token: str) -> Optional[str]:
+    """
+    Giải mã JWT và lấy subject (email).
+
+    Args:
+        token (str): JWT token
+
+    Returns:
+        Optional[str]: Email trong token, None nếu token không hợp lệ
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return TokenData(email=payload.get("sub")).email
+
+
+async def resolve_principal(email: str) -> Optional[UserPrincipal]:
+    """
+    Lấy danh tính người dùng theo email, ưu tiên từ cache.
+
+    Khi phiên bản dùng chung (Redis), mục trong cache chỉ được dùng nếu phiên bản chưa đổi: một lần đọc
+    Redis thay cho một truy vấn database.
+
+    Args:
+        email (str): Email của người dùng
+
+    Returns:
+        Optional[UserPrincipal]: Danh tính người dùng, None nếu không tồn tại hoặc đã bị vô hiệu hóa
+    """
+    version = await identity_versions.get(email) if identity_versions.shared else 0
+    cached = user_identity_cache.get(email)
+    if cached is not None and cached[1] == version:
+        principal = cached[0]
+    else:
+        # Đọc phiên bản trước database: thay đổi xảy ra trong lúc đọc sẽ làm mục này hết hiệu lực
+        async with db_session() as db:
+            user = await get_user_by_email(db, email)
+
+        if user is None:
+            return None
+
+        # Cache cả người dùng đã bị vô hiệu hóa để không truy vấn database ở mỗi request của họ
+        principal = UserPrincipal.model_validate(user)
+        user_identity_cache.set(email, (principal, version))
+
+    if principal.is_active is False:
+        return None
+    return principal
+
+
+async def invalidate_user(email: str):
+    """
+    Xóa danh tính người dùng khỏi cache sau khi dữ liệu người dùng thay đổi.
+
+    Cache của worker này được xóa ngay; các worker khác bỏ mục của họ ở request tiếp theo nếu phiên bản
+    dùng chung (Redis), nếu không thì khi mục hết hạn (USER_CACHE_TTL).
+    """
+    user_identity_cache.invalidate(email)
+    if identity_versions.shared:
+        await identity_versions.set(email, time.time(), _IDENTITY_VERSION_TTL)
+
+
+async def update_user(db: AsyncSession, user: User, **changes) -> User:
+    """
+    Cập nhật người dùng và xóa danh tính cũ khỏi cache.
+
+    Args:
+        db (AsyncSession): Database session
+        user (User): Người dùng cần cập nhật
+        **changes: Các trường cần thay đổi (vd: name, is_active)
+
+    Returns:
+        User: Người dùng đã cập nhật
+    """
+    old_email = user.email
+    for field, value in changes.items():
+        setattr(user, field, value)
+    await db.commit()
+    # Xóa sau khi commit để request đồng thời không nạp lại dữ liệu cũ vào cache
+    await invalidate_user(old_email)
+    await invalidate_user(user.email)
+    return user
+
+
+async def deactivate_user(db: AsyncSession, email: str) -> Optional[User]:
+    """
+    Vô hiệu hóa người dùng; token đã cấp bị từ chối ở request tiếp theo (trên worker khác: xem invalidate_user).
+
+    Args:
+        db (AsyncSession): Database session
+        email (str): Email của người dùng
+
+    Returns:
+        Optional[User]: Người dùng đã vô hiệu hóa, None nếu không tồn tại
+    """
+    user = await get_user_by_email(db, email)
+    if user is None:
+        return None
+    return await update_user(db, user, is_active=False)
+
+
+async def authenticate_request(request: Request) -> Optional[UserPrincipal]:
+    """
+    Xác thực request từ header Authorization, chỉ giải mã JWT một lần cho mỗi request.
+
+    Kết quả được lưu vào request.state.user để middleware và các dependency dùng lại.
+
+    Args:
+        request (Request): FastAPI request
+
+    Returns:
+        Optional[UserPrincipal]: Người dùng đã xác thực, None nếu không có token hợp lệ
+    """
+    if getattr(request.state, "auth_checked", False):
+        return request.state.user
+
+    request.state.auth_checked = True
+    request.state.user = None
+
+    authorization = request.headers.get("Authorization")
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+
+    with span("auth_jwt"):
+        email = decode_access_token(authorization[len("Bearer "):])
+    if email is None:
+        return None
+
+    with span("auth_user"):
+        request.state.user = await resolve_principal(email)
+    return request.state.user
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> UserPrincipal:
     """
     Lấy người dùng hiện tại từ token.
 
     Args:
+        request (Request): FastAPI request (chứa principal đã xác thực bởi middleware)
         token (str): JWT token
-        db (Session): Database session
 
     Returns:
-        User: Đối tượng người dùng
+        UserPrincipal: Người dùng hiện tại
 
     Raises:
         HTTPException: Nếu token không hợp lệ
@@ -95,18 +271,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-
-        if email is None:
-            raise credentials_exception
-
-        token_data = TokenData(email=email)
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = await authenticate_request(request)
 
     if user is None:
         raise credentials_exception
@@ -114,6 +279,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return user
 
 
+async def get_admin_user(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
+    """
+    Chỉ cho phép người dùng có email trong ADMIN_EMAILS.
+
+    Args:
+        current_user (UserPrincipal): Người dùng hiện tại
+
+    Returns:
+        UserPrincipal: Người dùng hiện tại (là quản trị viên)
+
+    Raises:
+        HTTPException: 403 nếu người dùng không phải quản trị viên
+    """
+    if current_user.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
+
+
 async def verify_google_token(token: str):
     """
     Xác thực token OAuth từ Google.
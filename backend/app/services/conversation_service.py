@@ -0,0 +1,221 @@
+"""
+backend/app/services/conversation_service.py
+------------------
+Mục đích:
+- Duy trì các cột tóm tắt của cuộc hội thoại (số tin nhắn, tin nhắn cuối, tổng token) khi ghi tin nhắn.
+- Lấy danh sách hội thoại bằng một truy vấn có index, phân trang theo keyset thay vì tải toàn bộ tin nhắn.
+
+Chức năng chính:
+- Hàm record_message(): cập nhật tóm tắt bằng một câu lệnh UPDATE nguyên tử.
+- Hàm encode_cursor()/decode_cursor(): cursor dạng chuỗi mờ chứa (updated_at, id) của phần tử cuối trang.
+- Hàm list_conversation_summaries(): trả về một trang hội thoại, mới cập nhật trước.
+- Hàm get_message_page()/stream_message_page(): một trang tin nhắn theo cursor (created_at, id),
+  lấy theo cả hai chiều (cũ hơn với before, mới hơn với after); bản stream ghi JSON dần từng tin nhắn.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from sqlalchemy import exists, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.chat import Conversation, ConversationSummary, ConversationPage, LAST_MESSAGE_PREVIEW_LENGTH, \
+    Message, MessagePage, MessageResponse, utcnow
+
+# Vị trí của một bản ghi trong thứ tự phân trang: (thời điểm, id)
+Position = Tuple[datetime, int]
+
+
+def make_preview(content: str) -> str:
+    """
+    Tạo đoạn xem trước của tin nhắn (gộp khoảng trắng, cắt theo LAST_MESSAGE_PREVIEW_LENGTH).
+
+    Args:
+        content (str): Nội dung tin nhắn
+
+    Returns:
+        str: Đoạn xem trước
+    """
+    preview = " ".join(content.split())
+    if len(preview) > LAST_MESSAGE_PREVIEW_LENGTH:
+        preview = preview[:LAST_MESSAGE_PREVIEW_LENGTH - 1] + "…"
+    return preview
+
+
+async def record_message(db: AsyncSession, conversation_id: int, content: str, token_count: Optional[int]):
+    """
+    Cập nhật tóm tắt của cuộc hội thoại sau khi ghi một tin nhắn.
+
+    Dùng UPDATE cộng dồn trên database nên các lượt ghi đồng thời không ghi đè lẫn nhau.
+
+    Args:
+        db (AsyncSession): Database session
+        conversation_id (int): ID cuộc hội thoại
+        content (str): Nội dung tin nhắn
+        token_count (int, optional): Số token của tin nhắn
+    """
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            message_count=Conversation.message_count + 1,
+            total_tokens=Conversation.total_tokens + (token_count or 0),
+            last_message_preview=make_preview(content),
+            updated_at=utcnow()
+        )
+    )
+    await db.commit()
+
+
+def encode_cursor(timestamp: datetime, record_id: int) -> str:
+    """Mã hóa vị trí (thời điểm, id) thành cursor."""
+    raw = json.dumps({"u": timestamp.isoformat(), "i": record_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Position:
+    """
+    Giải mã cursor thành vị trí (thời điểm, id).
+
+    Raises:
+        ValueError: Cursor không hợp lệ
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(data["u"]), int(data["i"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def conversation_page_query(user_id: int, limit: int, after: Optional[Position] = None):
+    """Truy vấn một trang tóm tắt hội thoại của người dùng, mới cập nhật trước."""
+    query = (
+        select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.created_at,
+            Conversation.updated_at,
+            Conversation.message_count,
+            Conversation.last_message_preview,
+            Conversation.total_tokens
+        )
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < after)
+    return query
+
+
+async def list_conversation_summaries(db: AsyncSession, user_id: int, limit: int,
+                                      cursor: Optional[str] = None) -> ConversationPage:
+    """
+    Lấy một trang hội thoại của người dùng, sắp xếp theo updated_at giảm dần.
+
+    Chỉ chọn các cột tóm tắt và dùng index (user_id, updated_at, id): không tải tin nhắn,
+    không OFFSET, chi phí mỗi trang không phụ thuộc vào số hội thoại đã có.
+
+    Args:
+        db (AsyncSession): Database session
+        user_id (int): ID người dùng
+        limit (int): Số hội thoại tối đa mỗi trang
+        cursor (str, optional): Cursor của trang trước (next_cursor)
+
+    Returns:
+        ConversationPage: Danh sách hội thoại và cursor của trang tiếp theo
+
+    Raises:
+        ValueError: Cursor không hợp lệ
+    """
+    position = decode_cursor(cursor) if cursor else None
+    query = conversation_page_query(user_id, limit + 1, position)
+    rows = (await db.execute(query)).all()
+    items: List[ConversationSummary] = [ConversationSummary(**row._mapping) for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+    return ConversationPage(items=items, next_cursor=next_cursor)
+
+
+def message_page_query(conversation_id: int, limit: int, before: Optional[Position] = None,
+                       after: Optional[Position] = None):
+    """Truy vấn một trang tin nhắn, luôn trả về theo thứ tự từ cũ đến mới."""
+    position = tuple_(Message.created_at, Message.id)
+    query = select(Message.id, Message.role, Message.content, Message.status, Message.created_at) \
+        .where(Message.conversation_id == conversation_id)
+
+    if after is not None:
+        return query.where(position > after).order_by(Message.created_at, Message.id).limit(limit)
+
+    # Trang mới nhất (hoặc cũ hơn `before`): lấy giảm dần theo index rồi đảo lại thứ tự
+    if before is not None:
+        query = query.where(position < before)
+    page = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).subquery()
+    return select(page).order_by(page.c.created_at, page.c.id)
+
+
+async def _page_cursors(db: AsyncSession, conversation_id: int, first: MessageResponse,
+                        last: MessageResponse) -> Tuple[Optional[str], Optional[str]]:
+    """Cursor của trang trước/sau, chỉ trả về khi thực sự còn tin nhắn (kiểm tra bằng EXISTS trên index)."""
+    position = tuple_(Message.created_at, Message.id)
+    has_older = await db.scalar(select(exists().where(
+        Message.conversation_id == conversation_id, position < (first.created_at, first.id))))
+    has_newer = await db.scalar(select(exists().where(
+        Message.conversation_id == conversation_id, position > (last.created_at, last.id))))
+    return (
+        encode_cursor(first.created_at, first.id) if has_older else None,
+        encode_cursor(last.created_at, last.id) if has_newer else None
+    )
+
+
+async def get_message_page(db: AsyncSession, conversation_id: int, limit: int, before: Optional[Position] = None,
+                           after: Optional[Position] = None) -> MessagePage:
+    """
+    Lấy một trang tin nhắn của cuộc hội thoại.
+
+    Args:
+        db (AsyncSession): Database session
+        conversation_id (int): ID cuộc hội thoại
+        limit (int): Số tin nhắn tối đa
+        before (Position, optional): Chỉ lấy tin nhắn cũ hơn vị trí này
+        after (Position, optional): Chỉ lấy tin nhắn mới hơn vị trí này
+
+    Returns:
+        MessagePage: Các tin nhắn (từ cũ đến mới) và cursor hai chiều
+    """
+    rows = (await db.execute(message_page_query(conversation_id, limit, before, after))).all()
+    items = [MessageResponse(**row._mapping) for row in rows]
+    if not items:
+        return MessagePage(items=[])
+    prev_cursor, next_cursor = await _page_cursors(db, conversation_id, items[0], items[-1])
+    return MessagePage(items=items, prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+
+async def stream_message_page(db: AsyncSession, conversation_id: int, limit: int, before: Optional[Position] = None,
+                              after: Optional[Position] = None) -> AsyncGenerator[str, None]:
+    """
+    Giống get_message_page() nhưng ghi JSON dần theo từng tin nhắn khi đọc từ database,
+    không dựng toàn bộ danh sách trong bộ nhớ.
+
+    Yields:
+        str: Các phần của JSON {"items": [...], "prev_cursor": ..., "next_cursor": ...}
+    """
+    yield '{"items":['
+    first = last = None
+    result = await db.stream(message_page_query(conversation_id, limit, before, after))
+    async for row in result:
+        item = MessageResponse(**row._mapping)
+        yield ("," if first is not None else "") + item.model_dump_json()
+        if first is None:
+            first = item
+        last = item
+
+    prev_cursor = next_cursor = None
+    if first is not None:
+        prev_cursor, next_cursor = await _page_cursors(db, conversation_id, first, last)
+    yield f'],"prev_cursor":{json.dumps(prev_cursor)},"next_cursor":{json.dumps(next_cursor)}}}'
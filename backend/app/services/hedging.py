@@ -0,0 +1,125 @@
+"""
+backend/app/services/hedging.py
+------------------
+Mục đích:
+- Giảm đuôi phân phối TTFT: khi một request tới LLM bị kẹt trong hàng đợi của upstream, gửi thêm một
+  request dự phòng (hedge) tới backend/replica khác, lấy kết quả của request có token trước.
+
+Chức năng chính:
+- Class HedgePolicy: ngưỡng hedge động theo phân vị TTFT gần đây (mặc định p95, không thấp hơn
+  LLM_HEDGE_MIN_DELAY), tính trên TTFT người dùng thực sự chờ (kể cả khi hedge thắng hoặc request
+  hết thời gian chờ) để ngưỡng không bị kéo về phía các request nhanh; ngân sách hedge (tỉ lệ tối đa so với số request) để giới hạn tải phát sinh
+  và thống kê số hedge đã gửi / thắng / bị chặn bởi ngân sách.
+- Việc chạy đua hai request và hủy request thua nằm trong llm_client.
+"""
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.config import (LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_BUDGET,
+                        LLM_HEDGE_MIN_SAMPLES)
+from app.utils.metrics import LLM_HEDGES
+
+# Số mẫu TTFT gần nhất dùng để tính phân vị
+_WINDOW_SIZE = 500
+# Số hedge tối đa được gửi dồn liên tiếp khi ngân sách đã tích lũy
+_MAX_BURST = 10.0
+
+
+class HedgePolicy:
+    """
+    Quyết định khi nào gửi request dự phòng.
+
+    Thuộc tính:
+        enabled (bool): Bật hedging
+        quantile (float): Phân vị TTFT làm ngưỡng (vd: 0.95)
+        min_delay (float): Ngưỡng tối thiểu (giây)
+        budget (float): Số hedge tối đa trên mỗi request (vd: 0.05 = thêm tối đa 5% tải)
+        min_samples (int): Số mẫu TTFT cần có trước khi bắt đầu hedge
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGE_ENABLED, quantile: float = LLM_HEDGE_QUANTILE,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY, budget: float = LLM_HEDGE_BUDGET,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=_WINDOW_SIZE)
+        # Cùng các mẫu nhưng đã sắp xếp, để lấy phân vị mà không phải sort ở mỗi request
+        self._ordered = []
+        self._credit = 1.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.fired = 0
+        self.won = 0
+        self.budget_exhausted = 0
+
+    def observe(self, ttft: float):
+        """
+        Ghi nhận TTFT của một request, tính từ lúc request bắt đầu (không phải từ lúc gửi hedge).
+
+        Request chưa có token đầu tiên (hết thời gian chờ) được ghi bằng thời gian đã chờ: TTFT thật
+        ít nhất bằng chừng đó.
+        """
+        if len(self._samples) == self._samples.maxlen:
+            del self._ordered[bisect_left(self._ordered, self._samples[0])]
+        self._samples.append(ttft)
+        insort(self._ordered, ttft)
+
+    def delay(self) -> Optional[float]:
+        """
+        Thời gian chờ token đầu tiên trước khi gửi hedge; mỗi request gọi đúng một lần
+        (cũng là lúc ngân sách hedge được cộng thêm).
+
+        Returns:
+            Optional[float]: Số giây, hoặc None nếu không hedge (tắt hoặc chưa đủ mẫu)
+        """
+        if not self.enabled or len(self._samples) < self.min_samples:
+            return None
+        self._credit = min(self._credit + self.budget, _MAX_BURST)
+        return max(self.threshold(), self.min_delay)
+
+    def threshold(self) -> float:
+        """Phân vị TTFT hiện tại (0 nếu chưa có mẫu)."""
+        ordered = self._ordered
+        if not ordered:
+            return 0.0
+        return ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)]
+
+    def try_fire(self) -> bool:
+        """
+        Dùng một đơn vị ngân sách để gửi hedge.
+
+        Returns:
+            bool: True nếu được phép gửi hedge
+        """
+        if self._credit < 1.0:
+            self.budget_exhausted += 1
+            LLM_HEDGES.inc(outcome="budget_exhausted")
+            return False
+        self._credit -= 1.0
+        self.fired += 1
+        LLM_HEDGES.inc(outcome="fired")
+        return True
+
+    def record_win(self):
+        """Hedge có token trước request gốc."""
+        self.won += 1
+        LLM_HEDGES.inc(outcome="won")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": round(max(self.threshold(), self.min_delay), 4),
+            "samples": len(self._samples),
+            "fired": self.fired,
+            "won": self.won,
+            "budget_exhausted": self.budget_exhausted,
+            "win_ratio": self.won / self.fired if self.fired else 0.0
+        }
+
+
+hedge_policy = HedgePolicy()
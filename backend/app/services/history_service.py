@@ -0,0 +1,163 @@
+"""
+backend/app/services/history_service.py
+------------------
+Mục đích:
+- Cung cấp lịch sử hội thoại gần nhất để tạo prompt mà không tải toàn bộ cuộc hội thoại.
+- Giữ cache lịch sử gần nhất theo từng cuộc hội thoại, cập nhật mỗi khi có tin nhắn mới.
+
+Chức năng chính:
+- Truy vấn chỉ HISTORY_WINDOW_SIZE tin nhắn mới nhất (dùng index (conversation_id, created_at)), bỏ qua
+  câu trả lời đang stream hoặc bị lỗi.
+- ConversationHistoryCache: cache có giới hạn (LRU + TTL), mỗi hội thoại là một deque cố định độ dài;
+  lần tải từ database chỉ được đưa vào cache khi không có tin nhắn mới nào được thêm trong lúc tải.
+- Hàm get_recent_history() và append_history() dùng trong các route chat.
+
+Lưu ý:
+- Cache nằm trong từng worker; TTL giới hạn thời gian dữ liệu có thể cũ khi nhiều worker
+  cùng ghi vào một cuộc hội thoại.
+"""
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import Message, MESSAGE_STATUS_COMPLETE, MESSAGE_STATUS_TRUNCATED
+from app.utils.ttl_cache import TTLCache
+from app.config import HISTORY_WINDOW_SIZE, HISTORY_CACHE_MAX_CONVERSATIONS, HISTORY_CACHE_TTL
+
+
+class ConversationHistoryCache:
+    """
+    Cache các tin nhắn gần nhất của từng cuộc hội thoại.
+
+    Thuộc tính:
+        window (int): Số tin nhắn tối đa giữ lại cho mỗi hội thoại.
+    """
+
+    def __init__(self, window: int = HISTORY_WINDOW_SIZE, maxsize: int = HISTORY_CACHE_MAX_CONVERSATIONS,
+                 ttl: float = HISTORY_CACHE_TTL):
+        self.window = window
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Số lần tải từ database đang chạy của từng hội thoại, và các hội thoại có tin nhắn mới trong lúc tải
+        self._loading: Dict[int, int] = {}
+        self._stale = set()
+
+    def get(self, conversation_id: int) -> Optional[List[Dict]]:
+        history: Optional[Deque] = self._cache.get(conversation_id)
+        return list(history) if history is not None else None
+
+    def set(self, conversation_id: int, history: List[Dict]):
+        self._cache.set(conversation_id, deque(history, maxlen=self.window))
+
+    async def get_or_load(self, conversation_id: int, load: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        """
+        Lấy lịch sử từ cache, hoặc tải từ database khi cache miss.
+
+        Kết quả tải chỉ được đưa vào cache nếu hội thoại vẫn chưa có trong cache và không có tin nhắn nào
+        được thêm trong lúc tải (lần tải có thể đã đọc database trước khi tin nhắn đó được lưu).
+
+        Args:
+            conversation_id (int): ID cuộc hội thoại
+            load (Callable): Hàm async tải lịch sử từ database
+
+        Returns:
+            List[Dict]: Lịch sử gần nhất từ cũ đến mới
+        """
+        history = self.get(conversation_id)
+        if history is not None:
+            return history
+
+        self._loading[conversation_id] = self._loading.get(conversation_id, 0) + 1
+        try:
+            history = await load()
+        finally:
+            stale = conversation_id in self._stale
+            remaining = self._loading.pop(conversation_id) - 1
+            if remaining:
+                self._loading[conversation_id] = remaining
+            else:
+                self._stale.discard(conversation_id)
+
+        # Lần tải khác đã đưa vào cache (và có thể đã được thêm tin nhắn): không ghi đè
+        if not stale and conversation_id not in self._cache:
+            self.set(conversation_id, history)
+        return history
+
+    def append(self, conversation_id: int, entry: Dict) -> bool:
+        """
+        Thêm tin nhắn vào lịch sử đã cache.
+
+        Returns:
+            bool: False nếu hội thoại chưa có trong cache (lần sau sẽ tải từ database)
+        """
+        history: Optional[Deque] = self._cache.get(conversation_id)
+        if history is None:
+            if conversation_id in self._loading:
+                self._stale.add(conversation_id)
+            return False
+        history.append(entry)
+        self._cache.set(conversation_id, history)
+        return True
+
+    def invalidate(self, conversation_id: int):
+        self._cache.invalidate(conversation_id)
+
+    def clear(self):
+        self._cache.clear()
+        self._loading.clear()
+        self._stale.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+history_cache = ConversationHistoryCache()
+
+
+async def load_history_window(db: AsyncSession, conversation_id: int,
+                              limit: int = HISTORY_WINDOW_SIZE) -> List[Dict]:
+    """
+    Tải `limit` tin nhắn mới nhất của cuộc hội thoại theo thứ tự thời gian.
+
+    Chỉ lấy tin nhắn đã hoàn tất (complete/truncated): câu trả lời đang stream hoặc bị lỗi không
+    được đưa vào prompt.
+
+    Args:
+        db (AsyncSession): Database session
+        conversation_id (int): ID cuộc hội thoại
+        limit (int): Số tin nhắn cần lấy
+
+    Returns:
+        List[Dict]: Danh sách {"role", "content", "token_count"} từ cũ đến mới
+    """
+    result = await db.execute(
+        select(Message.role, Message.content, Message.token_count)
+        .where(Message.conversation_id == conversation_id,
+               Message.status.in_((MESSAGE_STATUS_COMPLETE, MESSAGE_STATUS_TRUNCATED)))
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    rows = result.all()
+    return [
+        {"role": role, "content": content, "token_count": token_count}
+        for role, content, token_count in reversed(rows)
+    ]
+
+
+async def get_recent_history(db: AsyncSession, conversation_id: int) -> List[Dict]:
+    """
+    Lấy lịch sử gần nhất, ưu tiên từ cache; chỉ truy vấn database khi cache miss.
+
+    Args:
+        db (AsyncSession): Database session
+        conversation_id (int): ID cuộc hội thoại
+
+    Returns:
+        List[Dict]: Lịch sử gần nhất từ cũ đến mới
+    """
+    return await history_cache.get_or_load(
+        conversation_id, lambda: load_history_window(db, conversation_id, history_cache.window))
+
+
+def append_history(conversation_id: int, role: str, content: str, token_count: Optional[int] = None):
+    """Cập nhật cache sau khi một tin nhắn đã được lưu vào database."""
+    history_cache.append(conversation_id, {"role": role, "content": content, "token_count": token_count})
@@ -7,21 +7,241 @@ Mục đích:
 - Theo dõi việc sử dụng token để quản lý quota.
 
 Chức năng chính:
-- Tạo client OpenAI và gửi request đến API LLM.
-- Ước tính số lượng token trong văn bản bằng tiktoken.
+- Quản lý một client AsyncOpenAI dùng chung cho mỗi worker và mỗi backend (connection pool, keep-alive,
+  HTTP/2 tùy chọn).
+- Mở sẵn kết nối tới các backend khi ứng dụng khởi động và đóng client khi tắt.
+- Chọn backend cho mỗi stream qua BackendRouter (app.services.llm_router); nếu backend lỗi hoặc quá
+  LLM_FIRST_TOKEN_TIMEOUT trước token đầu tiên thì chuyển sang backend khác (người dùng không thấy lỗi).
+- Hedging (tùy chọn, app.services.hedging): chưa có token sau ngưỡng TTFT động thì gửi thêm một request
+  dự phòng, request có token trước thắng, request thua bị hủy.
+- Thống kê việc tái sử dụng kết nối và thời gian tới token đầu tiên (TTFT).
 - Cung cấp hàm generate_response() để gọi API trực tiếp.
-- Cung cấp hàm async generate_response_stream() để stream phản hồi và theo dõi token.
-- Tự động cập nhật thống kê sử dụng token của người dùng.
+- Cung cấp hàm async generate_response_stream() để stream phản hồi mà không chặn event loop.
+- Đếm token prompt và token sinh ra trong lúc stream (StreamUsage) để tính quota chính xác.
+- Đóng request upstream ngay khi stream bị dừng giữa chừng.
+- Ghi số liệu TTFT, thời lượng stream, tokens/s và số stream đang mở (app.utils.metrics).
+- Ghi span kết nối, TTFT và thời lượng stream vào trace của request (app.utils.tracing).
 """
-from openai import OpenAI
-from app.config import API_KEY, GEN_API_URL, DEFAULT_MODEL, MAX_TOKENS
-from typing import AsyncGenerator
+import asyncio
+import importlib.util
+import logging
+import time
+import weakref
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, Optional, Tuple
 
+import anyio
+import httpx
+from openai import AsyncOpenAI
+from app.config import (
+    API_KEY,
+    GEN_API_URL,
+    DEFAULT_MODEL,
+    MAX_TOKENS,
+    LLM_POOL_MAX_CONNECTIONS,
+    LLM_POOL_MAX_KEEPALIVE,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_HTTP2,
+    LLM_REQUEST_TIMEOUT,
+    LLM_WARMUP_CONNECTIONS,
+    LLM_STREAM_INCLUDE_USAGE,
+    LLM_FAILOVER_ATTEMPTS,
+    LLM_FIRST_TOKEN_TIMEOUT
+)
+from app.services.hedging import hedge_policy
+from app.services.llm_router import LLMBackend, NoBackendAvailable, llm_router
+from app.utils.token_counter import count_tokens
+from app.utils.metrics import LLM_TIME_TO_FIRST_TOKEN, LLM_STREAM_DURATION, LLM_TOKENS_PER_SECOND, \
+    LLM_COMPLETION_TOKENS, LLM_STREAMS_IN_FLIGHT, LLM_BACKEND_ATTEMPTS
+from app.utils.tracing import record_span, span
 
-def generate_response(prompt: str, model: str = DEFAULT_MODEL, max_tokens: int = MAX_TOKENS, api_key: str = API_KEY,
-                      url: str = GEN_API_URL):
+logger = logging.getLogger(__name__)
+
+
+class LLMPoolStats:
+    """
+    Thống kê việc sử dụng connection pool tới API LLM.
+
+    Mỗi request được phân loại theo kết nối mới mở hay kết nối tái sử dụng,
+    kèm theo TTFT tương ứng để thấy được lợi ích của keep-alive.
+    """
+
+    def __init__(self):
+        self._seen_streams = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.ttft_new_total = 0.0
+        self.ttft_new_count = 0
+        self.ttft_reused_total = 0.0
+        self.ttft_reused_count = 0
+
+    def record_connection(self, response: httpx.Response) -> bool:
+        """
+        Ghi nhận kết nối mạng mà response đã sử dụng.
+
+        Returns:
+            bool: True nếu kết nối được tái sử dụng
+        """
+        self.requests += 1
+        network_stream = response.extensions.get("network_stream")
+        if network_stream is None:
+            self.connections_opened += 1
+            return False
+
+        try:
+            reused = network_stream in self._seen_streams
+            if not reused:
+                self._seen_streams.add(network_stream)
+        except TypeError:
+            reused = False
+
+        if reused:
+            self.connections_reused += 1
+        else:
+            self.connections_opened += 1
+        return reused
+
+    def record_ttft(self, seconds: float, reused: bool):
+        if reused:
+            self.ttft_reused_total += seconds
+            self.ttft_reused_count += 1
+        else:
+            self.ttft_new_total += seconds
+            self.ttft_new_count += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        avg_new = self.ttft_new_total / self.ttft_new_count if self.ttft_new_count else None
+        avg_reused = self.ttft_reused_total / self.ttft_reused_count if self.ttft_reused_count else None
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": self.connections_reused / self.requests if self.requests else 0.0,
+            "avg_ttft_new_connection": avg_new,
+            "avg_ttft_reused_connection": avg_reused,
+            "avg_ttft_saving": avg_new - avg_reused if avg_new is not None and avg_reused is not None else None,
+            "http2": _http2_enabled(),
+            "max_connections": LLM_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": LLM_POOL_MAX_KEEPALIVE
+        }
+
+
+pool_stats = LLMPoolStats()
+
+
+class StreamUsage:
+    """
+    Số token của một lượt stream, được cập nhật dần trong lúc nhận token.
+
+    Nếu upstream trả về usage chính xác ở cuối stream thì giá trị đó được ưu tiên.
+    finish_reason lưu lý do upstream dừng sinh (vd: 'stop', 'length').
+    """
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.finish_reason = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+# Client dùng chung theo (url, api_key), gắn với event loop đã tạo ra nó
+_clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+_clients_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _http2_enabled() -> bool:
+    return LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def _build_client(url: str, api_key: str) -> AsyncOpenAI:
+    if LLM_HTTP2 and not _http2_enabled():
+        logger.warning("LLM_HTTP2 is enabled but package 'h2' is not installed, falling back to HTTP/1.1")
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0),
+        http2=_http2_enabled()
+    )
+    # Không để SDK tự thử lại: việc thử lại (kể cả sang backend khác) do generate_response_stream đảm nhiệm
+    return AsyncOpenAI(base_url=url, api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def get_llm_client(url: str = GEN_API_URL, api_key: str = API_KEY) -> AsyncOpenAI:
+    """
+    Lấy client AsyncOpenAI dùng chung cho worker hiện tại.
+
+    Args:
+        url (str): API URL
+        api_key (str): API key
+
+    Returns:
+        AsyncOpenAI: Client dùng chung
+    """
+    global _clients_loop
+
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        # Kết nối trong pool thuộc về event loop cũ, không thể dùng lại
+        _clients.clear()
+        _clients_loop = loop
+
+    key = (url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = _build_client(url, api_key)
+        _clients[key] = client
+    return client
+
+
+async def init_llm_client():
+    """Khởi tạo client dùng chung và mở sẵn kết nối tới từng backend LLM."""
+    for backend in llm_router.backends:
+        if not backend.url or not backend.api_key:
+            logger.warning(f"LLM backend {backend.name} has no API URL or key, skipping warm-up")
+            continue
+
+        client = get_llm_client(backend.url, backend.api_key)
+        if LLM_WARMUP_CONNECTIONS <= 0:
+            continue
+
+        async def warm_up():
+            await client.models.list()
+
+        results = await asyncio.gather(
+            *(warm_up() for _ in range(LLM_WARMUP_CONNECTIONS)),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"LLM connection warm-up failed for backend {backend.name}: {failures[0]}")
+        else:
+            logger.info(f"Warmed up {LLM_WARMUP_CONNECTIONS} connections to LLM backend {backend.name}")
+
+
+async def close_llm_client():
+    """Đóng toàn bộ client dùng chung khi ứng dụng tắt."""
+    global _clients_loop
+
+    for client in list(_clients.values()):
+        await client.close()
+    _clients.clear()
+    _clients_loop = None
+
+
+async def generate_response(prompt: str, model: str = DEFAULT_MODEL, max_tokens: int = MAX_TOKENS,
+                            api_key: str = API_KEY, url: str = GEN_API_URL):
     """
-    Gọi API LLM và trả về stream phản hồi.
+    Gọi API LLM và trả về async stream phản hồi.
 
     Args:
         prompt (str): Prompt đầu vào cho mô hình
@@ -31,38 +251,268 @@ def generate_response(prompt: str, model: str = DEFAULT_MODEL, max_tokens: int =
         url (str): API URL
 
     Returns:
-        stream: Stream phản hồi từ API
+        AsyncStream: Stream phản hồi từ API
     """
-    client = OpenAI(
-        base_url=url,
-        api_key=api_key
-    )
+    client = get_llm_client(url, api_key)
 
-    stream = client.completions.create(
+    extra = {"stream_options": {"include_usage": True}} if LLM_STREAM_INCLUDE_USAGE else {}
+    stream = await client.completions.create(
         model=model,
         prompt=prompt,
         stream=True,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        **extra
     )
 
     return stream
 
 
-async def generate_response_stream(prompt: str, model: str = DEFAULT_MODEL, max_tokens: int = MAX_TOKENS) -> \
-AsyncGenerator[str, None]:
+async def _open_backend_stream(backend: LLMBackend, prompt: str, model: str, max_tokens: int):
+    """
+    Mở stream tới một backend và đọc tới chunk có nội dung đầu tiên (hoặc tới hết stream).
+
+    Returns:
+        Tuple[AsyncStream, AsyncIterator, List]: Stream, iterator đọc tiếp và các chunk đã đọc
+    """
+    stream = await generate_response(prompt, backend.model or model, max_tokens,
+                                     api_key=backend.api_key, url=backend.url)
+    events = stream.__aiter__()
+    pending = []
+    try:
+        async for event in events:
+            pending.append(event)
+            if event.choices and event.choices[0].text:
+                break
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await stream.close()
+        raise
+    return stream, events, pending
+
+
+async def _attempt(backend: LLMBackend, prompt: str, model: str, max_tokens: int):
+    """
+    Một lần mở stream trên backend đã chọn, ghi nhận kết quả vào router.
+
+    Nếu thất bại hoặc bị hủy, chỗ của request trên backend được trả lại; nếu thành công, người gọi
+    giữ chỗ đó cho tới khi stream kết thúc.
+
+    Returns:
+        Tuple[AsyncStream, AsyncIterator, List]: Như _open_backend_stream()
+    """
+    started = time.perf_counter()
+    try:
+        with anyio.fail_after(LLM_FIRST_TOKEN_TIMEOUT):
+            opened = await _open_backend_stream(backend, prompt, model, max_tokens)
+    except Exception as e:
+        llm_router.record_failure(backend)
+        llm_router.release(backend)
+        result = "timeout" if isinstance(e, TimeoutError) else "error"
+        LLM_BACKEND_ATTEMPTS.inc(backend=backend.name, result=result)
+        logger.warning(f"LLM backend {backend.name} failed before first token ({result}: {e!r})")
+        raise
+    except BaseException:
+        llm_router.release(backend)
+        raise
+
+    ttft = time.perf_counter() - started
+    llm_router.record_success(backend, ttft)
+    LLM_BACKEND_ATTEMPTS.inc(backend=backend.name, result="success")
+    return opened
+
+
+async def _hedged_attempt(primary: LLMBackend, tried: list, prompt: str, model: str, max_tokens: int):
+    """
+    Mở stream trên backend chính; nếu chưa có token đầu tiên sau ngưỡng của HedgePolicy thì gửi thêm
+    một request dự phòng tới backend khác (hoặc replica khác của cùng backend). Request có token trước
+    thắng, request còn lại bị hủy và đóng.
+
+    Returns:
+        Tuple[LLMBackend, Tuple]: Backend thắng và kết quả của _attempt()
+
+    Raises:
+        Exception: Lỗi của request thất bại sau cùng nếu mọi request đều thất bại
+    """
+    started = time.perf_counter()
+    delay = hedge_policy.delay()
+    if delay is None:
+        tried.append(primary)
+        try:
+            opened = await _attempt(primary, prompt, model, max_tokens)
+        except TimeoutError:
+            hedge_policy.observe(time.perf_counter() - started)
+            raise
+        hedge_policy.observe(time.perf_counter() - started)
+        return primary, opened
+
+    tasks = {asyncio.create_task(_attempt(primary, prompt, model, max_tokens)): primary}
+    tried.append(primary)
+    hedge_task = None
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and hedge_policy.try_fire():
+            try:
+                hedge_backend = llm_router.choose(exclude=tried)
+            except NoBackendAvailable:
+                hedge_backend = None
+            if hedge_backend is not None:
+                hedge_task = asyncio.create_task(_attempt(hedge_backend, prompt, model, max_tokens))
+                tasks[hedge_task] = hedge_backend
+                tried.append(hedge_backend)
+
+        pending = set(tasks)
+        error = None
+        timed_out = False
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = task.exception()
+                timed_out = timed_out or isinstance(error, TimeoutError)
+        # Một mẫu cho mỗi request: thời gian người dùng chờ tới token đầu tiên (cũng là cận dưới TTFT của
+        # request gốc khi hedge thắng), hoặc thời gian đã chờ khi mọi request đều hết thời gian chờ
+        if winner is not None or timed_out:
+            hedge_policy.observe(time.perf_counter() - started)
+        if winner is None:
+            raise error
+        if winner is hedge_task:
+            hedge_policy.record_win()
+        return tasks[winner], winner.result()
+    finally:
+        for task, backend in tasks.items():
+            if task is winner:
+                continue
+            task.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait([task])
+                if not task.cancelled() and task.exception() is None:
+                    # Cả hai cùng có token: đóng stream của request thua
+                    await task.result()[0].close()
+                    llm_router.release(backend)
+
+
+async def _connect(prompt: str, model: str, max_tokens: int):
+    """
+    Mở stream qua BackendRouter, chuyển sang backend khác khi lỗi xảy ra trước token đầu tiên.
+
+    Returns:
+        Tuple[LLMBackend, AsyncStream, AsyncIterator, List]: Backend đã chọn (đang giữ chỗ trong router),
+            stream, iterator đọc tiếp và các chunk đã đọc
+
+    Raises:
+        Exception: Lỗi của lần thử cuối cùng (kể cả khi không còn backend nào để thử lại),
+            hoặc NoBackendAvailable nếu mọi backend đều đang ngắt ngay từ lần thử đầu
+    """
+    tried = []
+    for attempt in range(1, LLM_FAILOVER_ATTEMPTS + 1):
+        try:
+            backend = llm_router.choose(exclude=tried)
+        except NoBackendAvailable as e:
+            if attempt == 1:
+                raise
+            # Không còn backend nào để thử lại: báo lỗi thật của lần thử trước thay vì NoBackendAvailable
+            raise last_error from e
+        try:
+            backend, (stream, events, pending) = await _hedged_attempt(backend, tried, prompt, model, max_tokens)
+        except Exception as e:
+            if attempt == LLM_FAILOVER_ATTEMPTS:
+                raise
+            last_error = e
+            continue
+        return backend, stream, events, pending
+
+
+async def _replay(pending: list, events) -> AsyncGenerator:
+    """Phát lại các chunk đã đọc khi mở stream rồi đọc tiếp phần còn lại."""
+    for event in pending:
+        yield event
+    async for event in events:
+        yield event
+
+
+def _record_stream_metrics(start_time: float, first_token_time: Optional[float], completion_tokens: int,
+                           outcome: str):
+    """Ghi số liệu của một stream đã kết thúc: thời lượng, số token và tốc độ sinh token."""
+    finished = time.perf_counter()
+    record_span("llm_stream", finished - start_time)
+    LLM_STREAMS_IN_FLIGHT.dec()
+    LLM_STREAM_DURATION.observe(finished - start_time, outcome=outcome)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens)
+    if first_token_time is not None and completion_tokens > 1 and finished > first_token_time:
+        LLM_TOKENS_PER_SECOND.observe((completion_tokens - 1) / (finished - first_token_time))
+
+
+async def generate_response_stream(prompt: str, model: str = DEFAULT_MODEL, max_tokens: int = MAX_TOKENS,
+                                   usage: Optional[StreamUsage] = None,
+                                   prompt_tokens: Optional[int] = None) -> AsyncGenerator[str, None]:
     """
     Hàm async để stream phản hồi từ LLM.
 
+    Mỗi lần đọc token đều là một lệnh await trên socket bất đồng bộ,
+    nên một stream chậm từ upstream không làm treo các request khác trên cùng worker.
+    Backend được chọn qua llm_router; lỗi trước token đầu tiên được chuyển sang backend khác.
+
     Args:
         prompt (str): Prompt đầu vào cho mô hình
         model (str): Tên mô hình sử dụng
         max_tokens (int): Số token tối đa trong phản hồi
+        usage (StreamUsage, optional): Đối tượng nhận số token prompt/completion
+        prompt_tokens (int, optional): Số token prompt đã biết trước (tránh mã hóa lại prompt)
 
     Yields:
         str: Từng phần của phản hồi
     """
-    stream = generate_response(prompt, model, max_tokens)
+    if usage is not None:
+        usage.prompt_tokens = prompt_tokens if prompt_tokens is not None else count_tokens(prompt)
+
+    start_time = time.perf_counter()
+    with span("llm_connect"):
+        backend, stream, events, pending = await _connect(prompt, model, max_tokens)
+    reused = pool_stats.record_connection(stream.response)
+    first_token_time = None
+    completion_tokens = 0
+    outcome = "cancelled"
+    LLM_STREAMS_IN_FLIGHT.inc()
+
+    try:
+        async with aclosing(_replay(pending, events)) as replay:
+            async for event in replay:
+                text = event.choices[0].text if event.choices else None
+
+                if usage is not None:
+                    if event.choices and event.choices[0].finish_reason:
+                        usage.finish_reason = event.choices[0].finish_reason
+                    if getattr(event, "usage", None):
+                        # Số liệu chính xác từ upstream (luỹ kế) thay cho ước lượng
+                        usage.prompt_tokens = event.usage.prompt_tokens
+                        usage.completion_tokens = event.usage.completion_tokens
+                    elif text:
+                        usage.completion_tokens += count_tokens(text)
 
-    for event in stream:
-        if event.choices[0].text:
-            yield event.choices[0].text
\ No newline at end of file
+                if text:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                        ttft = first_token_time - start_time
+                        pool_stats.record_ttft(ttft, reused)
+                        LLM_TIME_TO_FIRST_TOKEN.observe(ttft, connection="reused" if reused else "new")
+                        record_span("llm_ttft", ttft)
+                    completion_tokens += 1
+                    yield text
+        outcome = "complete"
+    except Exception:
+        outcome = "error"
+        # Lỗi giữa stream: không chuyển backend được nữa (client đã nhận token) nhưng vẫn tính vào tỉ lệ lỗi
+        llm_router.record_failure(backend)
+        raise
+    finally:
+        llm_router.release(backend)
+        # Đóng response upstream khi dừng giữa chừng (client ngắt kết nối, lỗi),
+        # để server LLM ngừng sinh token không ai đọc
+        with anyio.CancelScope(shield=True):
+            await stream.close()
+        # Không có usage thì mỗi chunk được tính là một token
+        _record_stream_metrics(start_time, first_token_time,
+                               usage.completion_tokens if usage is not None else completion_tokens, outcome)
@@ -0,0 +1,188 @@
+"""
+backend/app/services/llm_router.py
+------------------
+Mục đích:
+- Không phụ thuộc vào một endpoint LLM duy nhất: khi một backend chậm hoặc lỗi, các lượt chat
+  được chuyển sang backend khác tương thích OpenAI.
+
+Chức năng chính:
+- Class LLMBackend: một backend (url, api key, tên mô hình) cùng các chỉ số EWMA của TTFT và tỉ lệ lỗi.
+- Class BackendRouter: chọn backend cho mỗi request theo TTFT EWMA, số request đang chạy và tỉ lệ lỗi;
+  circuit breaker theo từng backend (closed -> open sau nhiều lỗi liên tiếp -> half-open cho một request
+  thăm dò sau thời gian nghỉ -> closed nếu thành công).
+- Hàm load_backends(): đọc danh sách backend từ LLM_BACKENDS (JSON), mặc định là GEN_API_URL/API_KEY.
+"""
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config import (API_KEY, GEN_API_URL, LLM_BACKENDS, LLM_ROUTER_EWMA_ALPHA, LLM_CIRCUIT_FAILURE_THRESHOLD,
+                        LLM_CIRCUIT_OPEN_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class NoBackendAvailable(Exception):
+    """Không còn backend LLM nào nhận request (mọi circuit đều đang mở)."""
+
+
+class LLMBackend:
+    """
+    Một backend LLM tương thích OpenAI.
+
+    Thuộc tính:
+        name (str): Tên dùng trong log và số liệu
+        url (str): Base URL của API
+        api_key (str): API key
+        model (str, optional): Tên mô hình trên backend này (None: dùng tên mô hình của request)
+        ttft (float, optional): TTFT trung bình (EWMA, giây); None khi chưa có mẫu
+        error_rate (float): Tỉ lệ lỗi (EWMA, 0..1)
+        in_flight (int): Số request đang chạy trên backend
+        circuit (str): Trạng thái circuit breaker
+    """
+
+    def __init__(self, name: str, url: str, api_key: str, model: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.circuit = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+
+    def score(self) -> float:
+        """Chi phí ước lượng của việc gửi thêm một request (nhỏ hơn là tốt hơn)."""
+        # Backend chưa có mẫu TTFT được thử trước để có số liệu
+        latency = self.ttft if self.ttft is not None else 0.0
+        return (latency + 0.001) * (1 + self.in_flight) / max(1.0 - self.error_rate, 0.01)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "model": self.model,
+            "circuit": self.circuit,
+            "ewma_ttft": round(self.ttft, 4) if self.ttft is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+class BackendRouter:
+    """
+    Chọn backend LLM cho từng request và theo dõi sức khỏe của các backend.
+
+    Thuộc tính:
+        backends (List[LLMBackend]): Các backend theo thứ tự ưu tiên khi điểm bằng nhau
+        alpha (float): Hệ số làm mượt EWMA
+        failure_threshold (int): Số lỗi liên tiếp để mở circuit
+        open_seconds (float): Thời gian circuit mở trước khi cho một request thăm dò
+    """
+
+    def __init__(self, backends: Iterable[LLMBackend], alpha: float = LLM_ROUTER_EWMA_ALPHA,
+                 failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD,
+                 open_seconds: float = LLM_CIRCUIT_OPEN_SECONDS):
+        self.backends: List[LLMBackend] = list(backends)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+    def _available(self, backend: LLMBackend, now: float) -> bool:
+        if backend.circuit == CIRCUIT_CLOSED:
+            return True
+        # Circuit mở đã hết thời gian nghỉ: cho đúng một request thăm dò (half-open)
+        return backend.circuit == CIRCUIT_OPEN and now - backend.opened_at >= self.open_seconds
+
+    def choose(self, exclude: Iterable[LLMBackend] = ()) -> LLMBackend:
+        """
+        Chọn backend có chi phí ước lượng thấp nhất và đánh dấu request bắt đầu.
+
+        Backend trong exclude (đã thử và lỗi trong cùng request) chỉ được chọn lại khi không còn backend nào khác.
+
+        Args:
+            exclude (Iterable[LLMBackend]): Các backend nên tránh
+
+        Returns:
+            LLMBackend: Backend được chọn (cần gọi record_success/record_failure và release sau đó)
+
+        Raises:
+            NoBackendAvailable: Nếu mọi backend đều đang mở circuit
+        """
+        now = time.monotonic()
+        available = [backend for backend in self.backends if self._available(backend, now)]
+        if not available:
+            raise NoBackendAvailable("All LLM backends are unavailable (circuit open)")
+
+        excluded = set(map(id, exclude))
+        candidates = [backend for backend in available if id(backend) not in excluded] or available
+        backend = min(candidates, key=LLMBackend.score)
+        if backend.circuit == CIRCUIT_OPEN:
+            backend.circuit = CIRCUIT_HALF_OPEN
+            logger.info(f"Probing LLM backend {backend.name} (half-open)")
+        backend.in_flight += 1
+        return backend
+
+    def release(self, backend: LLMBackend):
+        """Đánh dấu request trên backend đã kết thúc."""
+        backend.in_flight -= 1
+        if backend.circuit == CIRCUIT_HALF_OPEN:
+            # Request thăm dò bị hủy trước khi có kết quả: cho phép thăm dò lại ngay
+            backend.circuit = CIRCUIT_OPEN
+            backend.opened_at = time.monotonic() - self.open_seconds
+
+    def record_success(self, backend: LLMBackend, ttft: float):
+        """Ghi nhận backend trả token đầu tiên sau ttft giây."""
+        backend.ttft = ttft if backend.ttft is None else self.alpha * ttft + (1 - self.alpha) * backend.ttft
+        backend.error_rate *= 1 - self.alpha
+        backend.consecutive_failures = 0
+        if backend.circuit != CIRCUIT_CLOSED:
+            logger.info(f"LLM backend {backend.name} recovered, closing circuit")
+            backend.circuit = CIRCUIT_CLOSED
+
+    def record_failure(self, backend: LLMBackend):
+        """Ghi nhận một lỗi (lỗi kết nối, HTTP lỗi, quá thời gian chờ token đầu hoặc lỗi giữa stream)."""
+        backend.error_rate = self.alpha + (1 - self.alpha) * backend.error_rate
+        backend.consecutive_failures += 1
+        if backend.circuit == CIRCUIT_HALF_OPEN or (
+                backend.circuit == CIRCUIT_CLOSED and backend.consecutive_failures >= self.failure_threshold):
+            logger.warning(f"Opening circuit for LLM backend {backend.name} "
+                           f"after {backend.consecutive_failures} consecutive failure(s)")
+            backend.circuit = CIRCUIT_OPEN
+            backend.opened_at = time.monotonic()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Trạng thái của từng backend."""
+        return [backend.snapshot() for backend in self.backends]
+
+
+def load_backends(raw: str = LLM_BACKENDS) -> List[LLMBackend]:
+    """
+    Đọc danh sách backend từ chuỗi JSON.
+
+    Args:
+        raw (str): Danh sách JSON, vd: [{"name": "fpt", "url": "https://...", "api_key": "...", "model": "..."}];
+            api_key mặc định là API_KEY, model mặc định là mô hình của request.
+            Chuỗi rỗng: một backend duy nhất từ GEN_API_URL/API_KEY.
+
+    Returns:
+        List[LLMBackend]: Các backend
+    """
+    if not raw:
+        return [LLMBackend("default", GEN_API_URL, API_KEY)]
+    return [
+        LLMBackend(entry.get("name") or f"backend{index}", entry["url"], entry.get("api_key") or API_KEY,
+                   entry.get("model"))
+        for index, entry in enumerate(json.loads(raw))
+    ]
+
+
+llm_router = BackendRouter(load_backends())
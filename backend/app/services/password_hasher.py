@@ -0,0 +1,177 @@
+"""
+backend/app/services/password_hasher.py
+------------------
+Mục đích:
+- Không để bcrypt chặn event loop: mỗi lần hash/verify mật khẩu tốn hàng chục tới hàng trăm ms CPU,
+  chạy trực tiếp trong handler async thì một loạt đăng nhập đầu giờ học làm đứng mọi stream chat của worker.
+
+Chức năng chính:
+- Class PasswordHasher: chạy hash/verify của passlib trên executor riêng (thread hoặc process) với số thao tác
+  đồng thời tối đa PASSWORD_HASH_WORKERS; request chờ chỗ quá PASSWORD_HASH_QUEUE_TIMEOUT giây bị từ chối
+  bằng PasswordHasherBusy thay vì xếp hàng vô hạn.
+- pwd_context: cấu hình passlib dùng chung (bcrypt).
+"""
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from passlib.context import CryptContext
+
+from app.config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_TIMEOUT, PASSWORD_HASH_EXECUTOR
+from app.utils.metrics import PASSWORD_HASH_WAIT, PASSWORD_HASH_REJECTIONS
+from app.utils.tracing import span
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    """Quá nhiều thao tác hash mật khẩu đang chờ; client nên thử lại sau retry_after giây."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many password operations in progress, please retry")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Chạy bcrypt ngoài event loop với số thao tác đồng thời và thời gian chờ giới hạn.
+
+    bcrypt nhả GIL trong lúc tính nên thread pool đã đủ để event loop chạy tiếp; process pool dùng
+    khi muốn tách hẳn CPU của bcrypt khỏi tiến trình phục vụ request.
+
+    Thuộc tính:
+        workers (int): Số thao tác hash/verify chạy đồng thời
+        queue_timeout (float): Thời gian chờ tối đa (giây) để tới lượt
+        executor_kind (str): 'thread' hoặc 'process'
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT,
+                 executor_kind: str = PASSWORD_HASH_EXECUTOR):
+        if executor_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor '{executor_kind}'")
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.executor_kind = executor_kind
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop = None
+        self.active = 0
+        self.waiting = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Semaphore gắn với event loop đang chạy (mỗi worker một loop; test tạo loop mới cho mỗi lần chạy)
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        return self._slots
+
+    async def _acquire(self, slots: asyncio.Semaphore) -> bool:
+        """
+        Chờ tới lượt tối đa queue_timeout giây.
+
+        Không dùng asyncio.wait_for(slots.acquire()): trên Python < 3.12, lần acquire đã thành công đúng lúc
+        hết giờ vẫn bị hủy và chỗ đó không bao giờ được trả lại.
+
+        Returns:
+            bool: True nếu đã giữ được một chỗ (người gọi phải trả lại), False nếu hết thời gian chờ
+        """
+        acquiring = asyncio.ensure_future(slots.acquire())
+        try:
+            await asyncio.wait({acquiring}, timeout=self.queue_timeout)
+        except BaseException:
+            self._abandon(slots, acquiring)
+            raise
+        if acquiring.done():
+            return True
+        self._abandon(slots, acquiring)
+        return False
+
+    @staticmethod
+    def _abandon(slots: asyncio.Semaphore, acquiring: asyncio.Future):
+        """Bỏ lần chờ; nếu acquire đã xong (không hủy được nữa) thì trả lại chỗ vừa giữ."""
+        if not acquiring.cancel():
+            slots.release()
+
+    async def _run(self, operation: str, func: Callable, *args) -> Any:
+        slots = self._get_slots()
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            acquired = await self._acquire(slots)
+        finally:
+            self.waiting -= 1
+        if not acquired:
+            self.rejected += 1
+            PASSWORD_HASH_REJECTIONS.inc(operation=operation)
+            raise PasswordHasherBusy(self.queue_timeout)
+        PASSWORD_HASH_WAIT.observe(time.perf_counter() - started, operation=operation)
+
+        self.active += 1
+        try:
+            with span(f"password_{operation}"):
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            slots.release()
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash mật khẩu.
+
+        Raises:
+            PasswordHasherBusy: Nếu chờ tới lượt quá queue_timeout
+        """
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Xác minh mật khẩu với chuỗi hash đã lưu.
+
+        Raises:
+            PasswordHasherBusy: Nếu chờ tới lượt quá queue_timeout
+        """
+        return await self._run("verify", _verify, password, hashed_password)
+
+    def shutdown(self):
+        """Dừng executor (gọi khi tắt ứng dụng)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_timeout": self.queue_timeout
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,178 @@
+"""
+backend/app/services/quota_ledger.py
+------------------
+Mục đích:
+- Không để nhiều stream đồng thời của cùng một người dùng cùng vượt qua bước kiểm tra quota rồi
+  tiêu quá TOKEN_QUOTA_PER_USER: mỗi lượt chat giữ trước số token tối đa có thể dùng.
+
+Chức năng chính:
+- Class QuotaLedger: sổ quota token theo (người dùng, ngày) trên một bộ đếm của rate_limiter
+  (trong bộ nhớ hoặc Redis); giá trị bộ đếm = token đã tính + token đang giữ trước.
+- reserve(): giữ trước token bằng một phép cộng nguyên tử, hoàn lại ngay nếu vượt quota.
+- settle()/release(): chốt theo số token thực tế, trả lại phần giữ thừa.
+- Database chỉ được đọc một lần cho mỗi (người dùng, ngày) để khôi phục bộ đếm;
+  việc ghi số token đã dùng xuống database nằm ở token_service.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Bộ đếm sống qua hết ngày (theo giờ của các worker) rồi tự hết hạn
+_COUNTER_TTL = 2 * 24 * 3600
+
+
+class QuotaExceeded(Exception):
+    """Không đủ quota token để giữ trước cho lượt chat."""
+
+    def __init__(self, requested: int, remaining: int):
+        super().__init__(f"Token quota exceeded for today ({requested} tokens requested, {remaining} remaining)")
+        self.requested = requested
+        self.remaining = remaining
+
+
+@dataclass
+class Reservation:
+    """Số token giữ trước cho một lượt chat."""
+    user_id: int
+    day: date
+    amount: int
+    settled: bool = False
+
+
+class QuotaLedger:
+    """
+    Sổ quota token theo ngày, giữ trước token trước khi stream và chốt theo số thực tế sau khi stream.
+
+    Thuộc tính:
+        store (MemoryCounterStore | RedisCounterStore): Bộ đếm (xem rate_limiter)
+        quota (int): Số token tối đa mỗi người dùng mỗi ngày
+        load_used (Callable): Hàm async (user_id, day) -> số token đã dùng trong database,
+            dùng để khôi phục bộ đếm trong bộ nhớ
+    """
+
+    def __init__(self, store, quota: int, load_used: Callable[[int, date], Awaitable[int]]):
+        self.store = store
+        self.quota = quota
+        self.load_used = load_used
+        # (người dùng) đã khôi phục theo ngày; chỉ giữ ngày hiện tại trở đi
+        self._seeded: Dict[date, set] = {}
+        self._seeding: Dict[str, asyncio.Future] = {}
+        # Token đang giữ trước bởi các lượt chat của tiến trình này
+        self._reserved: Dict[Tuple[int, date], int] = {}
+
+    @staticmethod
+    def _key(user_id: int, day: date) -> str:
+        return f"quota:{user_id}:{day.isoformat()}"
+
+    async def _ensure_seeded(self, user_id: int, day: date) -> str:
+        """Khôi phục bộ đếm từ database lần đầu gặp (người dùng, ngày) trong tiến trình này."""
+        key = self._key(user_id, day)
+        # Bộ đếm dùng chung (Redis) tồn tại qua các lần khởi động lại nên không cần khôi phục
+        if self.store.shared or user_id in self._seeded_users(day):
+            return key
+
+        # Các lượt chat đồng thời dùng chung một lần đọc database; bị hủy giữa chừng thì lần đọc vẫn chạy tiếp
+        seeding = self._seeding.get(key)
+        if seeding is None:
+            seeding = self._seeding[key] = asyncio.ensure_future(self._seed(key, user_id, day))
+        await asyncio.shield(seeding)
+        return key
+
+    def _seeded_users(self, day: date) -> set:
+        seeded = self._seeded.get(day)
+        if seeded is None:
+            # Sang ngày mới: bỏ đánh dấu của các ngày trước (bộ đếm của chúng cũng sẽ hết hạn)
+            for old_day in [seeded_day for seeded_day in self._seeded if seeded_day < day]:
+                del self._seeded[old_day]
+            seeded = self._seeded[day] = set()
+        return seeded
+
+    async def _seed(self, key: str, user_id: int, day: date):
+        try:
+            used = await self.load_used(user_id, day)
+            # Cộng dồn thay vì ghi đè để không mất các thay đổi xảy ra trong lúc đọc database
+            await self.store.incr(key, used, _COUNTER_TTL)
+            self._seeded_users(day).add(user_id)
+        finally:
+            self._seeding.pop(key, None)
+
+    async def reserve(self, user_id: int, amount: int, day: Optional[date] = None) -> Reservation:
+        """
+        Giữ trước token cho một lượt chat.
+
+        Args:
+            user_id (int): ID của người dùng
+            amount (int): Số token tối đa lượt chat có thể dùng (prompt + max_tokens)
+            day (date, optional): Ngày tính quota (mặc định hôm nay)
+
+        Returns:
+            Reservation: Phần giữ trước, cần gọi settle() hoặc release() đúng một lần
+
+        Raises:
+            QuotaExceeded: Nếu số token đã dùng và đang giữ cộng thêm amount vượt quota
+        """
+        day = day or date.today()
+        key = await self._ensure_seeded(user_id, day)
+
+        total = await self.store.incr(key, amount, _COUNTER_TTL)
+        if total > self.quota:
+            await self.store.incr(key, -amount, _COUNTER_TTL)
+            raise QuotaExceeded(amount, max(int(self.quota - (total - amount)), 0))
+
+        self._reserved[(user_id, day)] = self._reserved.get((user_id, day), 0) + amount
+        return Reservation(user_id, day, amount)
+
+    async def settle(self, reservation: Reservation, actual: int) -> bool:
+        """
+        Chốt phần giữ trước theo số token thực tế và trả lại phần thừa.
+
+        Số token thực tế luôn được tính, kể cả khi lớn hơn phần giữ trước.
+
+        Args:
+            reservation (Reservation): Phần giữ trước
+            actual (int): Số token thực tế đã dùng
+
+        Returns:
+            bool: False nếu phần giữ trước đã được chốt trước đó (không làm gì)
+        """
+        if reservation.settled:
+            return False
+        reservation.settled = True
+
+        row_key = (reservation.user_id, reservation.day)
+        remaining = self._reserved.get(row_key, 0) - reservation.amount
+        if remaining > 0:
+            self._reserved[row_key] = remaining
+        else:
+            self._reserved.pop(row_key, None)
+
+        if actual != reservation.amount:
+            await self.store.incr(self._key(*row_key), actual - reservation.amount, _COUNTER_TTL)
+        return True
+
+    async def release(self, reservation: Reservation) -> bool:
+        """Hủy phần giữ trước của lượt chat không gọi LLM (không tính token nào)."""
+        return await self.settle(reservation, 0)
+
+    async def usage(self, user_id: int, day: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Số token đã dùng và đang giữ trước của người dùng trong ngày.
+
+        Args:
+            user_id (int): ID của người dùng
+            day (date, optional): Ngày (mặc định hôm nay)
+
+        Returns:
+            Dict: {"tokens_used", "tokens_reserved", "tokens_remaining"}
+        """
+        day = day or date.today()
+        key = await self._ensure_seeded(user_id, day)
+        total = int(await self.store.get(key))
+        # Với Redis chỉ biết phần giữ trước của tiến trình này; tokens_remaining vẫn tính trên tổng
+        reserved = self._reserved.get((user_id, day), 0)
+        return {
+            "tokens_used": total - reserved,
+            "tokens_reserved": reserved,
+            "tokens_remaining": self.quota - total
+        }
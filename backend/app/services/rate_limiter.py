@@ -0,0 +1,297 @@
+"""
+backend/app/services/rate_limiter.py
+------------------
+Mục đích:
+- Kiểm tra giới hạn request trong bộ nhớ thay vì đếm trực tiếp trên database.
+- Cho phép thay đổi thuật toán và nơi lưu bộ đếm qua cấu hình.
+
+Chức năng chính:
+- Định nghĩa CounterStore: MemoryCounterStore (trong tiến trình) và RedisCounterStore (dùng chung giữa các worker).
+- SlidingWindowLimiter: thuật toán sliding window counter, bộ nhớ O(1) cho mỗi người dùng; cộng trước rồi
+  mới kiểm tra nên các request đồng thời (kể cả từ nhiều worker qua Redis) không cùng vượt giới hạn.
+- TokenBucketLimiter: thuật toán token bucket (chỉ hỗ trợ MemoryCounterStore).
+- Hàm build_counter_store() tạo bộ đếm theo RATE_LIMIT_BACKEND (dùng chung với sổ đặt trước quota token).
+- Hàm build_rate_limiter() tạo limiter theo cấu hình RATE_LIMIT_ALGORITHM / RATE_LIMIT_BACKEND.
+- Database chỉ là bản ghi được ghi theo lô (xem usage_aggregator).
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+from app.config import (
+    DAILY_REQUEST_LIMIT,
+    RATE_LIMIT_ALGORITHM,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_WINDOW_SECONDS,
+    REDIS_URL
+)
+
+
+@dataclass
+class RateLimitResult:
+    """Kết quả của một lần kiểm tra rate limit"""
+    allowed: bool
+    limit: int
+    count: int
+    remaining: int
+    reset_at: float
+
+
+class MemoryCounterStore:
+    """
+    Bộ đếm trong bộ nhớ của tiến trình.
+
+    Các thao tác không có await ở giữa nên là nguyên tử trong một event loop.
+    """
+
+    shared = False
+
+    def __init__(self, clock: Callable[[], float] = time.time, prune_every: int = 1000):
+        self._clock = clock
+        self._values: Dict[str, Tuple[float, float]] = {}
+        self._prune_every = prune_every
+        self._ops = 0
+
+    def _maybe_prune(self):
+        self._ops += 1
+        if self._ops % self._prune_every:
+            return
+        now = self._clock()
+        expired = [key for key, (_, expires_at) in self._values.items() if expires_at <= now]
+        for key in expired:
+            del self._values[key]
+
+    async def get(self, key: str) -> float:
+        value = self._values.get(key)
+        if value is None or value[1] <= self._clock():
+            return 0
+        return value[0]
+
+    async def incr(self, key: str, amount: float, ttl: float) -> float:
+        self._maybe_prune()
+        current = await self.get(key)
+        self._values[key] = (current + amount, self._clock() + ttl)
+        return current + amount
+
+    async def set(self, key: str, value: float, ttl: float):
+        self._maybe_prune()
+        self._values[key] = (value, self._clock() + ttl)
+
+
+class RedisCounterStore:
+    """
+    Bộ đếm dùng chung trên Redis để nhiều worker chia sẻ cùng một giới hạn.
+
+    Yêu cầu cài đặt gói redis (redis.asyncio).
+    """
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "aitutor:ratelimit:"):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+
+        self._redis = redis_asyncio.from_url(url)
+        self._prefix = prefix
+
+    async def get(self, key: str) -> float:
+        value = await self._redis.get(self._prefix + key)
+        return float(value) if value is not None else 0
+
+    async def incr(self, key: str, amount: float, ttl: float) -> float:
+        pipe = self._redis.pipeline()
+        pipe.incrbyfloat(self._prefix + key, amount)
+        pipe.expire(self._prefix + key, int(math.ceil(ttl)))
+        value, _ = await pipe.execute()
+        return float(value)
+
+    async def set(self, key: str, value: float, ttl: float):
+        await self._redis.set(self._prefix + key, value, ex=int(math.ceil(ttl)))
+
+
+class BaseLimiter:
+    """Phần chung của các thuật toán giới hạn request."""
+
+    def __init__(self, store, limit: int, window: float, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        # Khóa đã khôi phục theo cửa sổ; chỉ giữ cửa sổ hiện tại trở đi
+        self._seeded: Dict[int, set] = {}
+
+    def _seeded_keys(self) -> set:
+        index = int(self._clock() // self.window)
+        seeded = self._seeded.get(index)
+        if seeded is None:
+            # Sang cửa sổ mới: bỏ đánh dấu của các cửa sổ trước
+            for old_index in [seeded_index for seeded_index in self._seeded if seeded_index < index]:
+                del self._seeded[old_index]
+            seeded = self._seeded[index] = set()
+        return seeded
+
+    def needs_seed(self, key: str) -> bool:
+        """
+        Kiểm tra khóa có cần khôi phục từ database hay không (một lần mỗi cửa sổ).
+
+        Bộ đếm dùng chung (Redis) tồn tại qua các lần khởi động lại nên không cần khôi phục.
+        """
+        return not self.store.shared and key not in self._seeded_keys()
+
+    async def seed(self, key: str, used: int):
+        """Khôi phục số request đã dùng (vd: đọc từ database sau khi khởi động lại)."""
+        self._seeded_keys().add(key)
+        await self._seed(key, used)
+
+    async def _seed(self, key: str, used: int):
+        raise NotImplementedError
+
+    async def hit(self, key: str) -> RateLimitResult:
+        raise NotImplementedError
+
+
+class SlidingWindowLimiter(BaseLimiter):
+    """
+    Sliding window counter: ước lượng số request trong `window` giây gần nhất
+    bằng cửa sổ hiện tại cộng phần còn hiệu lực của cửa sổ trước.
+    """
+
+    def _window_key(self, key: str, index: int) -> str:
+        return f"{key}:{index}"
+
+    async def hit(self, key: str) -> RateLimitResult:
+        """
+        Ghi nhận một request và kiểm tra giới hạn.
+
+        Cộng vào cửa sổ hiện tại trước rồi kiểm tra giá trị trả về của phép cộng nguyên tử, hoàn lại
+        nếu vượt giới hạn: các request đồng thời không thể cùng đọc một giá trị cũ rồi cùng được chấp nhận.
+
+        Args:
+            key (str): Khóa giới hạn (vd: user:1)
+
+        Returns:
+            RateLimitResult: Kết quả kiểm tra
+        """
+        now = self._clock()
+        index = int(now // self.window)
+        elapsed = now - index * self.window
+        reset_at = (index + 1) * self.window
+        window_key = self._window_key(key, index)
+
+        current = await self.store.incr(window_key, 1, ttl=2 * self.window)
+        previous = await self.store.get(self._window_key(key, index - 1))
+        estimated = previous * (self.window - elapsed) / self.window + current
+
+        if estimated > self.limit:
+            await self.store.incr(window_key, -1, ttl=2 * self.window)
+            return RateLimitResult(False, self.limit, int(math.ceil(estimated - 1)), 0, reset_at)
+
+        count = int(math.ceil(estimated))
+        return RateLimitResult(True, self.limit, count, max(self.limit - count, 0), reset_at)
+
+    async def _seed(self, key: str, used: int):
+        index = int(self._clock() // self.window)
+        window_key = self._window_key(key, index)
+        current = await self.store.get(window_key)
+        if used > current:
+            await self.store.set(window_key, used, ttl=2 * self.window)
+
+
+class TokenBucketLimiter(BaseLimiter):
+    """
+    Token bucket: mỗi người dùng có tối đa `limit` token, được nạp lại đều đặn
+    với tốc độ limit / window token mỗi giây.
+    """
+
+    def __init__(self, store, limit: int, window: float, clock: Callable[[], float] = time.time):
+        if store.shared:
+            raise ValueError("Token bucket limiter only supports the in-memory counter store")
+        super().__init__(store, limit, window, clock)
+        self.rate = limit / window
+
+    async def _refill(self, key: str, now: float) -> float:
+        # Bucket hết hạn sau một cửa sổ không hoạt động, khi đó nó đã đầy trở lại
+        updated_at = await self.store.get(f"{key}:ts")
+        if not updated_at:
+            return self.limit
+        return min(self.limit, await self.store.get(key) + (now - updated_at) * self.rate)
+
+    async def _save(self, key: str, tokens: float, now: float):
+        await self.store.set(key, tokens, ttl=self.window)
+        await self.store.set(f"{key}:ts", now, ttl=self.window)
+
+    async def hit(self, key: str) -> RateLimitResult:
+        """
+        Lấy một token cho request và kiểm tra giới hạn.
+
+        Args:
+            key (str): Khóa giới hạn (vd: user:1)
+
+        Returns:
+            RateLimitResult: Kết quả kiểm tra
+        """
+        now = self._clock()
+        tokens = await self._refill(key, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        await self._save(key, tokens, now)
+
+        reset_at = now + (self.limit - tokens) / self.rate
+        remaining = int(tokens)
+        return RateLimitResult(allowed, self.limit, self.limit - remaining, remaining, reset_at)
+
+    async def _seed(self, key: str, used: int):
+        now = self._clock()
+        tokens = await self._refill(key, now)
+        await self._save(key, min(tokens, max(self.limit - used, 0)), now)
+
+
+LIMITER_ALGORITHMS = {
+    "sliding_window": SlidingWindowLimiter,
+    "token_bucket": TokenBucketLimiter,
+}
+
+
+def build_counter_store(backend: str = RATE_LIMIT_BACKEND, prefix: str = "aitutor:ratelimit:"):
+    """
+    Tạo bộ đếm theo cấu hình.
+
+    Args:
+        backend (str): 'memory' hoặc 'redis'
+        prefix (str): Tiền tố khóa trên Redis
+
+    Returns:
+        MemoryCounterStore | RedisCounterStore: Bộ đếm đã cấu hình
+    """
+    if backend == "memory":
+        return MemoryCounterStore()
+    if backend == "redis":
+        return RedisCounterStore(prefix=prefix)
+    raise ValueError(f"Unknown rate limit backend '{backend}'")
+
+
+def build_rate_limiter(algorithm: str = RATE_LIMIT_ALGORITHM, backend: str = RATE_LIMIT_BACKEND,
+                       limit: int = DAILY_REQUEST_LIMIT, window: float = RATE_LIMIT_WINDOW_SECONDS):
+    """
+    Tạo limiter theo cấu hình.
+
+    Args:
+        algorithm (str): 'sliding_window' hoặc 'token_bucket'
+        backend (str): 'memory' hoặc 'redis'
+        limit (int): Số request tối đa trong một cửa sổ
+        window (float): Độ dài cửa sổ (giây)
+
+    Returns:
+        SlidingWindowLimiter | TokenBucketLimiter: Limiter đã cấu hình
+    """
+    if algorithm not in LIMITER_ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm '{algorithm}'")
+
+    return LIMITER_ALGORITHMS[algorithm](build_counter_store(backend), limit, window)
+
+
+# Limiter cho giới hạn request hằng ngày của người dùng
+request_limiter = build_rate_limiter()
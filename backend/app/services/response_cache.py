@@ -0,0 +1,308 @@
+"""
+backend/app/services/response_cache.py
+------------------
+Mục đích:
+- Cache câu trả lời cho các câu hỏi lặp lại của học sinh (vd: in "Hello, world!" trong C/C++),
+  tránh gọi lại mô hình LLM cho cùng một câu hỏi trong cùng một ngữ cảnh.
+- Chỉ bật khi cấu hình RESPONSE_CACHE_ENABLED=true.
+
+Chức năng chính:
+- Chuẩn hóa văn bản (Unicode, chữ thường, khoảng trắng) trước khi so khớp.
+- Khóa ngữ cảnh là hash của cửa sổ lịch sử đã chuẩn hóa (trừ câu hỏi cuối) và tên mô hình.
+- So khớp gần đúng câu hỏi cuối bằng MinHash trên n-gram ký tự (ước lượng độ tương đồng Jaccard).
+- Loại bỏ theo LRU (số ngữ cảnh, số câu trả lời mỗi ngữ cảnh) và theo TTL.
+- Hàm cached_response_stream() đứng trước single_flight/generate_response_stream(): khi hit thì phát lại
+  đúng các chunk đã lưu, khi miss thì stream từ LLM và chỉ lưu câu trả lời đã hoàn tất.
+- Thống kê tỉ lệ hit/miss.
+"""
+import hashlib
+import random
+import re
+import time
+import unicodedata
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from app.config import (
+    DEFAULT_MODEL,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_CONTEXTS,
+    RESPONSE_CACHE_MAX_PER_CONTEXT,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_MAX_QUESTION_CHARS
+)
+from app.services.llm_client import StreamUsage
+from app.services.single_flight import single_flight
+from app.utils.ttl_cache import TTLCache
+
+# Số nguyên tố Mersenne 2^61 - 1 dùng cho các hàm hash hoán vị của MinHash
+_MERSENNE_PRIME = (1 << 61) - 1
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa văn bản để so khớp: Unicode NFKC, chữ thường, gộp khoảng trắng, bỏ dấu câu ở hai đầu.
+
+    Args:
+        text (str): Văn bản gốc
+
+    Returns:
+        str: Văn bản đã chuẩn hóa
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE.sub(" ", text).strip(" ?!.")
+
+
+class MinHasher:
+    """
+    Tạo chữ ký MinHash từ tập n-gram ký tự của văn bản.
+
+    Tỉ lệ vị trí trùng nhau giữa hai chữ ký là ước lượng độ tương đồng Jaccard của hai tập n-gram.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = random.Random(seed)
+        self.shingle_size = shingle_size
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def shingles(self, text: str) -> set:
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """
+        Tính chữ ký MinHash của văn bản (đã chuẩn hóa).
+
+        Args:
+            text (str): Văn bản
+
+        Returns:
+            Tuple[int, ...]: Chữ ký gồm num_perm giá trị
+        """
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in self.shingles(text)
+        ]
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms)
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Ước lượng độ tương đồng Jaccard từ hai chữ ký."""
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+@dataclass
+class CachedResponse:
+    """Một câu trả lời đã lưu, cùng các chunk theo đúng thứ tự đã stream"""
+    question: str
+    signature: Tuple[int, ...]
+    chunks: Tuple[str, ...]
+    completion_tokens: int
+    created_at: float
+
+
+class ResponseCache:
+    """
+    Cache câu trả lời theo ngữ cảnh hội thoại và câu hỏi cuối (so khớp gần đúng).
+
+    Thuộc tính:
+        enabled (bool): Cache có đang bật hay không.
+        threshold (float): Độ tương đồng tối thiểu để coi hai câu hỏi là một.
+    """
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE_ENABLED, max_contexts: int = RESPONSE_CACHE_MAX_CONTEXTS,
+                 max_per_context: int = RESPONSE_CACHE_MAX_PER_CONTEXT, ttl: float = RESPONSE_CACHE_TTL,
+                 threshold: float = RESPONSE_CACHE_SIMILARITY,
+                 max_question_chars: int = RESPONSE_CACHE_MAX_QUESTION_CHARS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.enabled = enabled
+        self.max_per_context = max_per_context
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_question_chars = max_question_chars
+        self._clock = clock
+        self._contexts = TTLCache(max_contexts, ttl, clock)
+        self._hasher = MinHasher()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+
+    def clear(self):
+        """Xóa toàn bộ câu trả lời đã lưu."""
+        self._contexts.clear()
+
+    def _split(self, history: List[dict]) -> Optional[Tuple[List[dict], str]]:
+        # Chỉ cache khi lượt cuối là câu hỏi ngắn của người dùng (không phải code dán vào)
+        if not history or history[-1]["role"] != "user":
+            return None
+        question = normalize_text(history[-1]["content"])
+        if not question or len(question) > self.max_question_chars:
+            return None
+        return history[:-1], question
+
+    def context_key(self, context: List[dict], model: str) -> str:
+        """
+        Khóa của ngữ cảnh: hash của mô hình và các lượt chat trước câu hỏi cuối (đã chuẩn hóa).
+
+        Args:
+            context (List[dict]): Các tin nhắn trước câu hỏi cuối
+            model (str): Tên mô hình
+
+        Returns:
+            str: Khóa ngữ cảnh
+        """
+        digest = hashlib.sha1(model.encode("utf-8"))
+        for entry in context:
+            digest.update(f"\n{entry['role']}:{normalize_text(entry['content'])}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _live_entries(self, key: str) -> List[CachedResponse]:
+        bucket = self._contexts.get(key) or []
+        now = self._clock()
+        return [entry for entry in bucket if entry.created_at + self.ttl > now]
+
+    def lookup(self, history: List[dict], model: str = DEFAULT_MODEL) -> Optional[CachedResponse]:
+        """
+        Tìm câu trả lời đã lưu cho lượt chat hiện tại.
+
+        Args:
+            history (List[dict]): Lịch sử đưa vào prompt, lượt cuối là câu hỏi của người dùng
+            model (str): Tên mô hình
+
+        Returns:
+            CachedResponse | None: Câu trả lời giống nhất vượt ngưỡng, hoặc None
+        """
+        split = self._split(history)
+        if split is None:
+            self.bypassed += 1
+            return None
+        context, question = split
+
+        entries = self._live_entries(self.context_key(context, model))
+        best, best_score = None, self.threshold
+        signature = None
+        for entry in entries:
+            if entry.question == question:
+                best = entry
+                break
+            if signature is None:
+                signature = self._hasher.signature(question)
+            score = MinHasher.similarity(signature, entry.signature)
+            if score >= best_score:
+                best, best_score = entry, score
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def store(self, history: List[dict], chunks: List[str], completion_tokens: int, model: str = DEFAULT_MODEL):
+        """
+        Lưu câu trả lời đã stream xong cho lượt chat hiện tại.
+
+        Args:
+            history (List[dict]): Lịch sử đưa vào prompt
+            chunks (List[str]): Các chunk của câu trả lời theo thứ tự
+            completion_tokens (int): Số token của câu trả lời
+            model (str): Tên mô hình
+        """
+        split = self._split(history)
+        if split is None or not chunks:
+            return
+        context, question = split
+
+        key = self.context_key(context, model)
+        entries = [entry for entry in self._live_entries(key) if entry.question != question]
+        entries.append(CachedResponse(
+            question=question,
+            signature=self._hasher.signature(question),
+            chunks=tuple(chunks),
+            completion_tokens=completion_tokens,
+            created_at=self._clock()
+        ))
+        self._contexts.set(key, entries[-self.max_per_context:])
+        self.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss của cache câu trả lời."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "contexts": len(self._contexts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache()
+
+
+async def cached_response_stream(prompt: str, history: List[dict], model: str = DEFAULT_MODEL,
+                                 usage: Optional[StreamUsage] = None,
+                                 prompt_tokens: Optional[int] = None,
+                                 on_shared: Optional[Callable[[], None]] = None) -> AsyncGenerator[str, None]:
+    """
+    Stream câu trả lời, ưu tiên phát lại từ cache nếu câu hỏi đã được trả lời trong cùng ngữ cảnh.
+
+    Khi hit, không gọi LLM nên chỉ tính số token của câu trả lời (prompt_tokens = 0).
+
+    Args:
+        prompt (str): Prompt đầu vào cho mô hình
+        history (List[dict]): Lịch sử đã đưa vào prompt
+        model (str): Tên mô hình sử dụng
+        usage (StreamUsage, optional): Đối tượng nhận số token prompt/completion
+        prompt_tokens (int, optional): Số token prompt đã biết trước
+        on_shared (Callable, optional): Gọi khi câu trả lời không cần một lần gọi upstream riêng
+            (hit cache hoặc nhập vào một flight có sẵn), vd: để trả chỗ trong hàng đợi LLM
+
+    Yields:
+        str: Từng phần của phản hồi
+    """
+    cache = response_cache
+    if not cache.enabled:
+        async with aclosing(single_flight.stream(prompt, model, usage=usage, prompt_tokens=prompt_tokens,
+                                                 on_shared=on_shared)) as stream:
+            async for chunk in stream:
+                yield chunk
+        return
+
+    cached = cache.lookup(history, model)
+    if cached is not None:
+        if on_shared is not None:
+            on_shared()
+        if usage is not None:
+            usage.prompt_tokens = 0
+            usage.completion_tokens = cached.completion_tokens
+            usage.finish_reason = "stop"
+        for chunk in cached.chunks:
+            yield chunk
+        return
+
+    usage = usage if usage is not None else StreamUsage()
+    chunks = []
+    async with aclosing(single_flight.stream(prompt, model, usage=usage, prompt_tokens=prompt_tokens,
+                                             on_shared=on_shared)) as stream:
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+
+    # Chỉ tới được đây khi stream hoàn tất (client ngắt kết nối sẽ dừng generator ở yield);
+    # câu trả lời bị cắt do max_tokens không được lưu
+    if usage.finish_reason != "length":
+        cache.store(history, chunks, usage.completion_tokens, model)
@@ -0,0 +1,220 @@
+"""
+backend/app/services/schema_verifier.py
+------------------
+Mục đích:
+- Kiểm tra khi khởi động rằng database có đủ các index mà các truy vấn nóng cần,
+  để hiệu năng không âm thầm phụ thuộc vào DDL viết tay.
+
+Chức năng chính:
+- REQUIRED_INDEXES: các index bắt buộc (messages.conversation_id, conversations(user_id, updated_at),
+  users.email, token_usage/request_count theo (user_id, date)).
+- Hàm verify_schema(): so sánh schema thực tế với model (bảng, cột, index) và chạy EXPLAIN
+  cho các truy vấn nóng để phát hiện kế hoạch quét toàn bảng.
+- SchemaReport: kết quả kiểm tra, được ghi log khi khởi động và trả về qua API monitoring.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import create_engine, func, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool
+
+from app.database import engine
+from app.models.base import load_models
+from app.models.token_usage import RequestCount, TokenUsage
+from app.models.user import User
+from app.services.conversation_service import conversation_page_query, message_page_query
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RequiredIndex:
+    """Một index bắt buộc: các cột đầu tiên của index phải trùng với `columns`."""
+    table: str
+    columns: Tuple[str, ...]
+    used_by: str
+
+    def describe(self) -> str:
+        return f"{self.table}({', '.join(self.columns)}) - {self.used_by}"
+
+
+REQUIRED_INDEXES: List[RequiredIndex] = [
+    RequiredIndex("messages", ("conversation_id",), "lịch sử và trang tin nhắn của hội thoại"),
+    RequiredIndex("conversations", ("user_id", "updated_at"), "danh sách hội thoại của người dùng"),
+    RequiredIndex("users", ("email",), "đăng nhập và xác thực theo email"),
+    RequiredIndex("token_usage", ("user_id", "date"), "kiểm tra quota token"),
+    RequiredIndex("request_count", ("user_id", "date"), "đồng bộ số request hằng ngày"),
+]
+
+
+def hot_queries() -> Dict[str, Any]:
+    """
+    Các truy vấn nóng cần kiểm tra kế hoạch thực thi (giá trị tham số chỉ mang tính đại diện).
+
+    Returns:
+        Dict[str, Select]: Tên truy vấn -> câu lệnh
+    """
+    return {
+        "message_page": message_page_query(conversation_id=1, limit=50),
+        "conversation_page": conversation_page_query(user_id=1, limit=21),
+        "user_by_email": select(User.id).where(User.email == "student@example.com"),
+        "token_usage_today": select(TokenUsage.tokens_used)
+        .where(TokenUsage.user_id == 1, TokenUsage.date == func.current_date()),
+        "request_count_today": select(RequestCount.request_count)
+        .where(RequestCount.user_id == 1, RequestCount.date == func.current_date()),
+    }
+
+
+@dataclass
+class SchemaReport:
+    """Kết quả kiểm tra schema."""
+    missing_tables: List[str] = field(default_factory=list)
+    missing_columns: List[str] = field(default_factory=list)
+    missing_indexes: List[str] = field(default_factory=list)
+    slow_queries: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing_tables or self.missing_columns or self.missing_indexes or self.slow_queries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "missing_tables": self.missing_tables,
+            "missing_columns": self.missing_columns,
+            "missing_indexes": self.missing_indexes,
+            "slow_queries": self.slow_queries,
+        }
+
+
+def _index_column_lists(inspector, table: str) -> List[List[str]]:
+    """Danh sách cột của mọi index và ràng buộc unique/khóa chính trên bảng."""
+    columns = [index["column_names"] for index in inspector.get_indexes(table)]
+    columns += [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+    primary_key = inspector.get_pk_constraint(table).get("constrained_columns")
+    if primary_key:
+        columns.append(primary_key)
+    return columns
+
+
+def find_missing_indexes(inspector, required: List[RequiredIndex] = REQUIRED_INDEXES) -> List[str]:
+    """
+    Tìm các index bắt buộc chưa có trong database.
+
+    Args:
+        inspector: SQLAlchemy Inspector của kết nối
+        required (List[RequiredIndex]): Các index bắt buộc
+
+    Returns:
+        List[str]: Mô tả các index còn thiếu
+    """
+    tables = set(inspector.get_table_names())
+    missing = []
+    for index in required:
+        if index.table not in tables:
+            continue
+        prefixes = [tuple(columns[:len(index.columns)]) for columns in _index_column_lists(inspector, index.table)]
+        if index.columns not in prefixes:
+            missing.append(index.describe())
+    return missing
+
+
+def explain(conn: Connection, statement) -> List[str]:
+    """
+    Lấy kế hoạch thực thi của một câu lệnh.
+
+    Args:
+        conn (Connection): Kết nối database
+        statement: Câu lệnh SQLAlchemy
+
+    Returns:
+        List[str]: Các dòng của kế hoạch thực thi
+    """
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    return [row[0] for row in conn.exec_driver_sql(f"EXPLAIN {sql}")]
+
+
+def full_scans(dialect: str, plan: List[str], tables: set) -> List[str]:
+    """
+    Tìm các bảng bị quét toàn bộ trong kế hoạch thực thi.
+
+    Args:
+        dialect (str): Tên dialect ('sqlite' hoặc 'postgresql')
+        plan (List[str]): Các dòng của kế hoạch thực thi
+        tables (set): Tên các bảng của ứng dụng
+
+    Returns:
+        List[str]: Tên các bảng bị quét toàn bộ
+    """
+    pattern = re.compile(r"^\s*SCAN (\w+)(?! USING)") if dialect == "sqlite" else re.compile(r"Seq Scan on (\w+)")
+    scanned = []
+    for line in plan:
+        match = pattern.search(line)
+        if match and match.group(1) in tables:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def verify_schema(bind: Engine = engine, check_plans: bool = True) -> SchemaReport:
+    """
+    So sánh schema của database với các model và kiểm tra kế hoạch của các truy vấn nóng.
+
+    Args:
+        bind (Engine): Engine đồng bộ của database
+        check_plans (bool): Có chạy EXPLAIN cho các truy vấn nóng hay không
+
+    Returns:
+        SchemaReport: Các bảng/cột/index còn thiếu và các truy vấn quét toàn bảng
+    """
+    metadata = load_models()
+    report = SchemaReport()
+
+    # Dùng kết nối riêng ngoài pool: SQLite giữ kế hoạch EXPLAIN cũ trong cache statement của
+    # từng kết nối và không lập lại kế hoạch khi index vừa được tạo/xóa
+    verifier_engine = create_engine(bind.url, poolclass=NullPool)
+    with verifier_engine.connect() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                report.missing_tables.append(table.name)
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            report.missing_columns += [f"{table.name}.{column.name}" for column in table.columns
+                                       if column.name not in existing_columns]
+
+        report.missing_indexes = find_missing_indexes(inspector)
+
+        if check_plans and not report.missing_tables and not report.missing_columns:
+            if conn.dialect.name == "postgresql":
+                # Bảng nhỏ luôn được quét tuần tự; tắt seq scan để kiểm tra index có dùng được hay không
+                conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for name, statement in hot_queries().items():
+                plan = explain(conn, statement)
+                if full_scans(conn.dialect.name, plan, existing_tables):
+                    report.slow_queries[name] = plan
+        conn.rollback()
+    verifier_engine.dispose()
+
+    return report
+
+
+def log_schema_report(report: SchemaReport):
+    """Ghi log kết quả kiểm tra schema."""
+    if report.ok:
+        logger.info("Schema verification passed: required indexes present, hot queries use indexes")
+        return
+    for table in report.missing_tables:
+        logger.warning(f"Schema verification: missing table {table}")
+    for column in report.missing_columns:
+        logger.warning(f"Schema verification: missing column {column}")
+    for index in report.missing_indexes:
+        logger.warning(f"Schema verification: missing index on {index}")
+    for name, plan in report.slow_queries.items():
+        logger.warning(f"Schema verification: hot query '{name}' scans a full table: {' | '.join(plan)}")
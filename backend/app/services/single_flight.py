@@ -0,0 +1,206 @@
+"""
+backend/app/services/single_flight.py
+------------------
+Mục đích:
+- Gộp các request LLM giống hệt nhau đang chạy đồng thời (vd: cả lớp dán cùng một bài tập)
+  thành một lần gọi upstream duy nhất.
+
+Chức năng chính:
+- Khóa là hash của prompt cuối cùng, tên mô hình và max_tokens.
+- Request đầu tiên tạo một "flight": một task nền đọc stream từ LLM và lưu các chunk vào bộ đệm.
+- Các request cùng khóa nhận cùng chuỗi token; request đến muộn được phát lại các chunk đã có trước.
+- Khi không còn ai đọc, request upstream bị hủy để không tốn token vô ích.
+- Thống kê số lần gọi upstream và số lần gọi tiết kiệm được.
+"""
+import asyncio
+import hashlib
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from app.config import DEFAULT_MODEL, MAX_TOKENS, LLM_SINGLE_FLIGHT_ENABLED
+from app.services.llm_client import generate_response_stream, StreamUsage
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    Một lần gọi upstream dùng chung cho nhiều người nhận.
+
+    Thuộc tính:
+        chunks (List[str]): Các chunk đã nhận theo thứ tự.
+        usage (StreamUsage): Số token của lần gọi upstream.
+        done (bool): Stream upstream đã kết thúc (thành công hoặc lỗi).
+        subscribers (int): Số người đang đọc.
+    """
+
+    def __init__(self, key: str, registry: Dict[str, "Flight"]):
+        self.key = key
+        self._registry = registry
+        self.chunks: List[str] = []
+        # Số token completion luỹ kế sau mỗi chunk, để tính đúng cho người ngừng đọc giữa chừng
+        self.completion_tokens: List[int] = []
+        self.usage = StreamUsage()
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _detach(self):
+        # Request mới với cùng khóa sẽ tạo flight mới thay vì nhận phản hồi dở dang
+        if self._registry.get(self.key) is self:
+            del self._registry[self.key]
+
+    async def run(self, prompt: str, model: str, max_tokens: int, prompt_tokens: Optional[int]):
+        """Đọc stream upstream vào bộ đệm (chạy trong task nền, không gắn với request nào)."""
+        try:
+            async with aclosing(generate_response_stream(prompt, model, max_tokens, usage=self.usage,
+                                                         prompt_tokens=prompt_tokens)) as stream:
+                async for chunk in stream:
+                    self.chunks.append(chunk)
+                    self.completion_tokens.append(self.usage.completion_tokens)
+                    self._notify()
+        except Exception as e:
+            logger.warning(f"Shared LLM stream failed for {self.subscribers} subscriber(s): {e}")
+            self.error = e
+        finally:
+            self.done = True
+            self._detach()
+            self._notify()
+
+    async def subscribe(self, usage: Optional[StreamUsage] = None) -> AsyncGenerator[str, None]:
+        """
+        Đọc các chunk của flight, bắt đầu bằng phần đã có trong bộ đệm.
+
+        Args:
+            usage (StreamUsage, optional): Nhận số token tương ứng với phần đã đọc
+
+        Yields:
+            str: Từng chunk của phản hồi
+        """
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    if usage is not None:
+                        usage.prompt_tokens = self.usage.prompt_tokens
+                        usage.completion_tokens = self.completion_tokens[index]
+                    index += 1
+                    yield chunk
+                elif self.done:
+                    break
+                else:
+                    await self._changed.wait()
+
+            if self.error is not None:
+                raise self.error
+            if usage is not None:
+                usage.prompt_tokens = self.usage.prompt_tokens
+                usage.completion_tokens = self.usage.completion_tokens
+                usage.finish_reason = self.usage.finish_reason
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Không còn ai đọc: dừng request upstream
+                self._detach()
+                self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Gộp các request stream giống hệt nhau đang chạy đồng thời.
+
+    Thuộc tính:
+        enabled (bool): Có gộp request hay không.
+        upstream_calls (int): Số lần thực sự gọi upstream.
+        saved_calls (int): Số request đã được phục vụ từ một flight có sẵn.
+    """
+
+    def __init__(self, enabled: bool = LLM_SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._flights: Dict[str, Flight] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.upstream_calls = 0
+        self.saved_calls = 0
+
+    @staticmethod
+    def make_key(prompt: str, model: str, max_tokens: int) -> str:
+        """
+        Khóa của request: hash của mô hình, max_tokens và prompt.
+
+        Args:
+            prompt (str): Prompt cuối cùng gửi tới LLM
+            model (str): Tên mô hình
+            max_tokens (int): Số token tối đa
+
+        Returns:
+            str: Khóa single-flight
+        """
+        digest = hashlib.sha256(f"{model}\0{max_tokens}\0".encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    async def stream(self, prompt: str, model: str = DEFAULT_MODEL, max_tokens: int = MAX_TOKENS,
+                     usage: Optional[StreamUsage] = None, prompt_tokens: Optional[int] = None,
+                     on_shared: Optional[Callable[[], None]] = None) -> AsyncGenerator[str, None]:
+        """
+        Stream phản hồi, dùng chung lần gọi upstream với các request giống hệt đang chạy.
+
+        Args:
+            prompt (str): Prompt đầu vào cho mô hình
+            model (str): Tên mô hình sử dụng
+            max_tokens (int): Số token tối đa trong phản hồi
+            usage (StreamUsage, optional): Đối tượng nhận số token prompt/completion
+            prompt_tokens (int, optional): Số token prompt đã biết trước
+            on_shared (Callable, optional): Gọi khi request nhập vào một flight có sẵn (không mở upstream mới)
+
+        Yields:
+            str: Từng phần của phản hồi
+        """
+        if not self.enabled:
+            async with aclosing(generate_response_stream(prompt, model, max_tokens, usage=usage,
+                                                         prompt_tokens=prompt_tokens)) as stream:
+                async for chunk in stream:
+                    yield chunk
+            return
+
+        key = self.make_key(prompt, model, max_tokens)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(key, self._flights)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(flight.run(prompt, model, max_tokens, prompt_tokens))
+            self.upstream_calls += 1
+        else:
+            self.saved_calls += 1
+            if on_shared is not None:
+                on_shared()
+
+        async with aclosing(flight.subscribe(usage)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê số lần gọi upstream và số lần tiết kiệm được."""
+        requests = self.upstream_calls + self.saved_calls
+        return {
+            "enabled": self.enabled,
+            "active_flights": len(self._flights),
+            "subscribers": sum(flight.subscribers for flight in self._flights.values()),
+            "upstream_calls": self.upstream_calls,
+            "saved_calls": self.saved_calls,
+            "saved_ratio": self.saved_calls / requests if requests else 0.0
+        }
+
+
+single_flight = SingleFlight()
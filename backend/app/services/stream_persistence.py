@@ -0,0 +1,97 @@
+"""
+backend/app/services/stream_persistence.py
+------------------
+Mục đích:
+- Lưu câu trả lời của assistant trong lúc stream, không đợi tới khi stream kết thúc,
+  để khi tiến trình lỗi hoặc client ngắt kết nối vẫn còn nội dung đã sinh trong database.
+- Giữ số lần ghi database trên mỗi stream ở mức giới hạn.
+
+Chức năng chính:
+- Định nghĩa class MessageStreamWriter:
+  + Gom các chunk vào list (ghép chuỗi một lần, thời gian tuyến tính).
+  + Checkpoint nội dung sau mỗi STREAM_CHECKPOINT_TOKENS token hoặc STREAM_CHECKPOINT_INTERVAL giây,
+    nhưng không ghi dày hơn STREAM_CHECKPOINT_MIN_INTERVAL giây một lần.
+  + Kết thúc tin nhắn với trạng thái complete/truncated/failed.
+"""
+import time
+from typing import Callable, List, Optional
+
+from app.config import STREAM_CHECKPOINT_TOKENS, STREAM_CHECKPOINT_INTERVAL, STREAM_CHECKPOINT_MIN_INTERVAL
+from app.models.chat import Message, MESSAGE_STATUS_STREAMING
+from app.utils.token_counter import count_tokens
+
+
+class MessageStreamWriter:
+    """
+    Ghi dần nội dung stream vào một tin nhắn assistant.
+
+    Thuộc tính:
+        message (Message): Tin nhắn assistant đang được sinh.
+        checkpoints (int): Số lần đã checkpoint xuống database.
+    """
+
+    def __init__(self, db, message: Message, checkpoint_tokens: int = STREAM_CHECKPOINT_TOKENS,
+                 checkpoint_interval: float = STREAM_CHECKPOINT_INTERVAL,
+                 min_interval: float = STREAM_CHECKPOINT_MIN_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.db = db
+        self.message = message
+        self.checkpoint_tokens = checkpoint_tokens
+        self.checkpoint_interval = checkpoint_interval
+        self.min_interval = min_interval
+        self._clock = clock
+        self._chunks: List[str] = []
+        self._pending_tokens = 0
+        self._last_checkpoint = clock()
+        self.checkpoints = 0
+
+    @property
+    def content(self) -> str:
+        """Nội dung đã nhận được tới hiện tại."""
+        return "".join(self._chunks)
+
+    def _checkpoint_due(self) -> bool:
+        elapsed = self._clock() - self._last_checkpoint
+        if elapsed < self.min_interval:
+            return False
+        return self._pending_tokens >= self.checkpoint_tokens or elapsed >= self.checkpoint_interval
+
+    async def write(self, chunk: str, token_count: Optional[int] = None):
+        """
+        Thêm một chunk vào câu trả lời, checkpoint nếu đã tới hạn.
+
+        Args:
+            chunk (str): Phần văn bản mới từ LLM
+            token_count (int, optional): Số token của chunk nếu người gọi đã đếm (tránh đếm lại)
+        """
+        self._chunks.append(chunk)
+        self._pending_tokens += count_tokens(chunk) if token_count is None else token_count
+        if self._checkpoint_due():
+            await self.checkpoint()
+
+    async def checkpoint(self):
+        """Ghi nội dung một phần xuống database, tin nhắn vẫn ở trạng thái streaming."""
+        self.message.content = self.content
+        self.message.status = MESSAGE_STATUS_STREAMING
+        await self.db.commit()
+        self._pending_tokens = 0
+        self._last_checkpoint = self._clock()
+        self.checkpoints += 1
+
+    async def finish(self, status: str, token_count: Optional[int] = None) -> str:
+        """
+        Ghi nội dung cuối cùng và trạng thái của tin nhắn.
+
+        Args:
+            status (str): complete, truncated hoặc failed
+            token_count (int, optional): Số token của câu trả lời
+
+        Returns:
+            str: Nội dung đầy đủ của câu trả lời
+        """
+        content = self.content
+        self.message.content = content
+        self.message.status = status
+        self.message.token_count = token_count
+        await self.db.commit()
+        return content
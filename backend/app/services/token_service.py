@@ -7,182 +7,209 @@ Mục đích:
 - Theo dõi và báo cáo thống kê sử dụng.
 
 Chức năng chính:
-- Tăng và theo dõi số lượng token đã sử dụng của người dùng theo ngày.
-- Kiểm tra quota token còn lại của người dùng.
-- Đếm và giới hạn số lượng request API theo ngày.
+- Giữ trước token cho mỗi lượt chat trên sổ quota trong bộ nhớ (app.services.quota_ledger) và chốt theo
+  số token thực tế khi stream kết thúc, nên các stream đồng thời không thể cùng vượt quota.
+- Kiểm tra quota token còn lại của người dùng (không truy vấn database sau lần khôi phục đầu tiên).
+- Đếm và giới hạn số lượng request API theo ngày bằng limiter trong bộ nhớ.
+- Ghi số request và số token đã dùng xuống database theo lô qua usage_aggregator (write-behind).
 - Cung cấp API để lấy thống kê sử dụng của người dùng.
-- Xử lý exception khi vượt quá giới hạn.
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from datetime import date
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
 from app.models.token_usage import TokenUsage, RequestCount
 from app.models.user import User
-from app.config import TOKEN_QUOTA_PER_USER, DAILY_REQUEST_LIMIT
+from app.config import TOKEN_QUOTA_PER_USER, DAILY_REQUEST_LIMIT, RATE_LIMIT_BACKEND
+from app.database import db_session
+from app.services.quota_ledger import QuotaLedger, Reservation
+from app.services.rate_limiter import build_counter_store, request_limiter
+from app.services.usage_aggregator import KIND_REQUESTS, KIND_TOKENS, usage_aggregator
+from app.utils.tracing import span
 
 
-async def increment_token_usage(db: Session, user_id: int, token_count: int) -> Dict[str, Any]:
+
+async def _get_token_usage(db: AsyncSession, user_id: int, day: date):
+    """Lấy record TokenUsage của người dùng trong ngày (nếu có)."""
+    result = await db.execute(
+        select(TokenUsage).where(TokenUsage.user_id == user_id, TokenUsage.date == day)
+    )
+    return result.scalars().first()
+
+
+async def _get_request_count(db: AsyncSession, user_id: int, day: date):
+    """Lấy record RequestCount của người dùng trong ngày (nếu có)."""
+    result = await db.execute(
+        select(RequestCount).where(RequestCount.user_id == user_id, RequestCount.date == day)
+    )
+    return result.scalars().first()
+
+
+async def _load_tokens_used(user_id: int, day: date) -> int:
+    """Số token đã dùng trong ngày theo database (kể cả phần chưa kịp ghi), để khôi phục sổ quota."""
+    async def load_committed() -> int:
+        async with db_session() as db:
+            token_usage = await _get_token_usage(db, user_id, day)
+        return token_usage.tokens_used if token_usage else 0
+
+    return await usage_aggregator.total(KIND_TOKENS, user_id, day, load_committed)
+
+
+quota_ledger = QuotaLedger(build_counter_store(RATE_LIMIT_BACKEND, prefix="aitutor:quota:"),
+                           TOKEN_QUOTA_PER_USER, _load_tokens_used)
+
+
+async def reserve_tokens(user_id: int, amount: int) -> Reservation:
     """
-    Tăng số lượng token đã sử dụng cho một người dùng.
+    Giữ trước token cho một lượt chat, trước khi gọi LLM.
 
     Args:
-        db (Session): Database session
         user_id (int): ID của người dùng
-        token_count (int): Số lượng token sử dụng
+        amount (int): Số token tối đa lượt chat có thể dùng (prompt + max_tokens)
 
     Returns:
-        Dict: Thông tin về việc sử dụng token
+        Reservation: Phần giữ trước, cần chốt bằng settle_token_usage() hoặc hủy bằng release_tokens()
 
     Raises:
-        HTTPException: Nếu người dùng đã vượt quá quota
+        QuotaExceeded: Nếu không đủ quota
     """
-    today = date.today()
+    with span("quota"):
+        return await quota_ledger.reserve(user_id, amount)
 
-    # Tìm hoặc tạo record cho ngày hôm nay
-    token_usage = db.query(TokenUsage).filter(
-        TokenUsage.user_id == user_id,
-        TokenUsage.date == today
-    ).first()
-
-    if not token_usage:
-        token_usage = TokenUsage(user_id=user_id, tokens_used=0, date=today)
-        db.add(token_usage)
-        db.commit()
-        db.refresh(token_usage)
-
-    # Kiểm tra nếu đã vượt quá hạn mức
-    if token_usage.tokens_used + token_count > TOKEN_QUOTA_PER_USER:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Token quota exceeded for today"
-        )
-
-    # Cập nhật số lượng token đã sử dụng
-    token_usage.tokens_used += token_count
-    db.commit()
-    db.refresh(token_usage)
 
-    return {
-        "user_id": user_id,
-        "tokens_used": token_usage.tokens_used,
-        "token_quota": TOKEN_QUOTA_PER_USER,
-        "tokens_remaining": TOKEN_QUOTA_PER_USER - token_usage.tokens_used,
-        "date": today
-    }
+async def settle_token_usage(reservation: Reservation, token_count: int):
+    """
+    Chốt số token thực tế của lượt chat và trả lại phần giữ thừa.
 
+    Sổ quota được cập nhật ngay (không có round trip tới database); số token được ghi xuống
+    bảng token_usage ở lần ghi theo lô tiếp theo của usage_aggregator. Số token đã tiêu thụ luôn được ghi nhận,
+    kể cả khi vượt phần giữ trước.
 
-async def check_token_quota(db: Session, user_id: int) -> Dict[str, Any]:
+    Args:
+        reservation (Reservation): Phần giữ trước của lượt chat
+        token_count (int): Số lượng token thực tế (prompt + completion)
+    """
+    with span("usage_commit"):
+        if not await quota_ledger.settle(reservation, token_count) or token_count <= 0:
+            return
+    usage_aggregator.add(KIND_TOKENS, reservation.user_id, reservation.day, token_count)
+
+
+async def release_tokens(reservation: Reservation):
+    """Hủy phần giữ trước của lượt chat kết thúc trước khi gọi LLM (không làm gì nếu đã chốt)."""
+    await quota_ledger.release(reservation)
+
+
+async def check_token_quota(user_id: int) -> Dict[str, Any]:
     """
     Kiểm tra quota token của người dùng.
 
     Args:
-        db (Session): Database session
         user_id (int): ID của người dùng
 
     Returns:
-        Dict: Thông tin về quota token
+        Dict: Thông tin về quota token (tokens_reserved là phần đang giữ trước cho các stream chưa xong)
     """
     today = date.today()
 
-    # Tìm record cho ngày hôm nay
-    token_usage = db.query(TokenUsage).filter(
-        TokenUsage.user_id == user_id,
-        TokenUsage.date == today
-    ).first()
-
-    tokens_used = token_usage.tokens_used if token_usage else 0
+    with span("quota"):
+        usage = await quota_ledger.usage(user_id, today)
 
     return {
         "user_id": user_id,
-        "tokens_used": tokens_used,
+        "tokens_used": usage["tokens_used"],
+        "tokens_reserved": usage["tokens_reserved"],
         "token_quota": TOKEN_QUOTA_PER_USER,
-        "tokens_remaining": TOKEN_QUOTA_PER_USER - tokens_used,
+        "tokens_remaining": usage["tokens_remaining"],
         "date": today
     }
 
 
-async def increment_request_count(db: Session, user_id: int) -> Tuple[bool, Dict[str, Any]]:
+async def increment_request_count(user_id: int, db: Optional[AsyncSession] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     Tăng số lượng request đã sử dụng và kiểm tra giới hạn.
 
+    Việc kiểm tra chạy hoàn toàn trong bộ nhớ (request_limiter). Database chỉ được đọc
+    một lần cho mỗi người dùng để khôi phục bộ đếm, còn số request được ghi xuống
+    theo lô bởi usage_aggregator.
+
     Args:
-        db (Session): Database session
         user_id (int): ID của người dùng
+        db (AsyncSession, optional): Database session, chỉ dùng khi cần khôi phục bộ đếm
 
     Returns:
         Tuple[bool, Dict]: (Có vượt quá giới hạn không, Thông tin request count)
     """
     today = date.today()
+    key = f"user:{user_id}"
 
-    # Tìm hoặc tạo record cho ngày hôm nay
-    request_count = db.query(RequestCount).filter(
-        RequestCount.user_id == user_id,
-        RequestCount.date == today
-    ).first()
-
-    if not request_count:
-        request_count = RequestCount(user_id=user_id, request_count=0, date=today)
-        db.add(request_count)
-        db.commit()
-        db.refresh(request_count)
-
-    # Kiểm tra nếu đã vượt quá giới hạn
-    if request_count.request_count >= DAILY_REQUEST_LIMIT:
-        return False, {
-            "user_id": user_id,
-            "request_count": request_count.request_count,
-            "daily_limit": DAILY_REQUEST_LIMIT,
-            "requests_remaining": 0,
-            "date": today
-        }
+    # Khôi phục bộ đếm từ database lần đầu gặp người dùng trong tiến trình này
+    if request_limiter.needs_seed(key):
+        async def load_committed() -> int:
+            if db is None:
+                async with db_session() as seed_db:
+                    request_count = await _get_request_count(seed_db, user_id, today)
+            else:
+                request_count = await _get_request_count(db, user_id, today)
+            return request_count.request_count if request_count else 0
 
-    # Tăng số lượng request
-    request_count.request_count += 1
-    db.commit()
-    db.refresh(request_count)
+        await request_limiter.seed(key, await usage_aggregator.total(KIND_REQUESTS, user_id, today, load_committed))
 
-    return True, {
+    result = await request_limiter.hit(key)
+
+    request_info = {
         "user_id": user_id,
-        "request_count": request_count.request_count,
-        "daily_limit": DAILY_REQUEST_LIMIT,
-        "requests_remaining": DAILY_REQUEST_LIMIT - request_count.request_count,
+        "request_count": result.count,
+        "daily_limit": result.limit,
+        "requests_remaining": result.remaining,
+        "reset_at": result.reset_at,
         "date": today
     }
 
+    if not result.allowed:
+        return False, request_info
+
+    # Ghi nhận để ghi xuống database ở lần ghi theo lô tiếp theo
+    usage_aggregator.add(KIND_REQUESTS, user_id, today)
+
+    return True, request_info
+
 
-async def get_user_statistics(db: Session, user_id: int) -> Dict[str, Any]:
+async def get_user_statistics(db: AsyncSession, user_id: int) -> Dict[str, Any]:
     """
     Lấy thống kê sử dụng của người dùng.
 
     Args:
-        db (Session): Database session
+        db (AsyncSession): Database session
         user_id (int): ID của người dùng
 
     Returns:
         Dict: Thống kê sử dụng
     """
-    # Tổng số token đã sử dụng
-    total_tokens = db.query(func.sum(TokenUsage.tokens_used)).filter(
-        TokenUsage.user_id == user_id
-    ).scalar() or 0
+    async def sum_tokens() -> int:
+        return await db.scalar(
+            select(func.sum(TokenUsage.tokens_used)).where(TokenUsage.user_id == user_id)
+        ) or 0
 
-    # Tổng số request
-    total_requests = db.query(func.sum(RequestCount.request_count)).filter(
-        RequestCount.user_id == user_id
-    ).scalar() or 0
+    async def sum_requests() -> int:
+        return await db.scalar(
+            select(func.sum(RequestCount.request_count)).where(RequestCount.user_id == user_id)
+        ) or 0
 
-    # Thông tin quota hiện tại
-    token_quota = await check_token_quota(db, user_id)
+    async def count_requests_today() -> int:
+        request_count = await _get_request_count(db, user_id, today)
+        return request_count.request_count if request_count else 0
 
     today = date.today()
-    request_count = db.query(RequestCount).filter(
-        RequestCount.user_id == user_id,
-        RequestCount.date == today
-    ).first()
 
-    current_requests = request_count.request_count if request_count else 0
+    # Tổng số token và số request đã sử dụng (kể cả phần chưa kịp ghi xuống database)
+    total_tokens = await usage_aggregator.total(KIND_TOKENS, user_id, None, sum_tokens)
+    total_requests = await usage_aggregator.total(KIND_REQUESTS, user_id, None, sum_requests)
+
+    # Thông tin quota hiện tại
+    token_quota = await check_token_quota(user_id)
+
+    current_requests = await usage_aggregator.total(KIND_REQUESTS, user_id, today, count_requests_today)
 
     return {
         "user_id": user_id,
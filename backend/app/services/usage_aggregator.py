@@ -0,0 +1,265 @@
+"""
+backend/app/services/usage_aggregator.py
+------------------
+Mục đích:
+- Không ghi database cho từng request: số request và số token đã dùng được cộng dồn trong bộ nhớ
+  theo (người dùng, ngày) rồi ghi xuống theo lô (write-behind), tránh hàng nghìn transaction nhỏ
+  tranh nhau cùng các dòng request_count/token_usage khi cả lớp học dùng cùng lúc.
+
+Chức năng chính:
+- Class UsageAggregator: gom số liệu, ghi xuống mỗi USAGE_FLUSH_INTERVAL giây hoặc sớm hơn khi đã gom
+  USAGE_FLUSH_MAX_EVENTS sự kiện, bằng một transaction duy nhất (một câu lệnh upsert cho mỗi bảng).
+- Khi tắt ứng dụng, stop() ghi nốt phần còn lại. Khi tiến trình bị kill đột ngột, số liệu mất tối đa là
+  phần gom được kể từ lần ghi cuối: không quá USAGE_FLUSH_INTERVAL giây và USAGE_FLUSH_MAX_EVENTS sự kiện
+  (cộng thêm thời gian của một lần ghi đang chạy). Quota và rate limit không bị ảnh hưởng vì được kiểm tra
+  trên bộ đếm trong bộ nhớ/Redis; chỉ bản ghi trong database bị thiếu.
+- total(): giá trị trong database cộng phần chưa ghi, không đếm trùng hay thiếu lô đang ghi (đọc lại nếu
+  có lần ghi chạy xen giữa); dùng khi khôi phục bộ đếm và khi thống kê.
+- Số liệu: usage_events_total (trước đây mỗi sự kiện là một transaction) so với usage_flushes_total
+  (số transaction thực tế) cho biết số transaction tiết kiệm được.
+"""
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import USAGE_FLUSH_INTERVAL, USAGE_FLUSH_MAX_EVENTS
+from app.database import db_session, dialect_insert
+from app.models.token_usage import RequestCount, TokenUsage
+from app.utils.metrics import USAGE_EVENTS, USAGE_FLUSHES, USAGE_FLUSH_DURATION
+
+logger = logging.getLogger(__name__)
+
+KIND_REQUESTS = "requests"
+KIND_TOKENS = "tokens"
+
+# Bảng và cột được cộng dồn của từng loại số liệu
+_TABLES = {
+    KIND_REQUESTS: (RequestCount, "request_count"),
+    KIND_TOKENS: (TokenUsage, "tokens_used"),
+}
+
+
+class UsageAggregator:
+    """
+    Gom số liệu sử dụng trong bộ nhớ và ghi xuống database theo lô.
+
+    Thuộc tính:
+        flush_interval (float): Chu kỳ ghi (giây)
+        max_events (int): Số sự kiện tối đa được gom trước khi ghi sớm
+    """
+
+    def __init__(self, flush_interval: float = USAGE_FLUSH_INTERVAL, max_events: int = USAGE_FLUSH_MAX_EVENTS):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.clear()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # Số lần bắt đầu/kết thúc ghi theo lô: số lẻ là đang ghi (để total() biết lần đọc có bị xen ngang)
+        self._writes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.events_total = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_flushed = 0
+        self.last_flush_at: Optional[float] = None
+
+    def clear(self):
+        """Bỏ toàn bộ số liệu đang chờ (không ghi xuống database)."""
+        self._pending = {kind: {} for kind in _TABLES}
+        self._events = 0
+
+    def add(self, kind: str, user_id: int, day: date, amount: int = 1):
+        """
+        Cộng dồn một sự kiện sử dụng (không chạm tới database).
+
+        Args:
+            kind (str): KIND_REQUESTS hoặc KIND_TOKENS
+            user_id (int): ID của người dùng
+            day (date): Ngày tính số liệu
+            amount (int): Số lượng cộng thêm
+        """
+        pending = self._pending[kind]
+        pending[(user_id, day)] = pending.get((user_id, day), 0) + amount
+        self._events += 1
+        self.events_total += 1
+        USAGE_EVENTS.inc(kind=kind)
+        # Gom đủ số sự kiện: đánh thức tác vụ nền để ghi sớm, giới hạn lượng số liệu có thể mất
+        if self._events >= self.max_events and self._wake is not None:
+            self._wake.set()
+
+    def pending(self, kind: str, user_id: int, day: Optional[date] = None) -> int:
+        """
+        Số lượng chưa ghi xuống database của người dùng (trong ngày, hoặc mọi ngày nếu day là None).
+
+        Không tính lô đang được ghi; để cộng với giá trị đọc từ database hãy dùng total().
+        """
+        pending = self._pending[kind]
+        if day is not None:
+            return pending.get((user_id, day), 0)
+        return sum(count for (pending_user, _), count in pending.items() if pending_user == user_id)
+
+    async def total(self, kind: str, user_id: int, day: Optional[date],
+                    load_committed: Callable[[], Awaitable[int]]) -> int:
+        """
+        Giá trị đã ghi trong database cộng phần chưa ghi.
+
+        Không giữ khóa trong lúc đọc database: nếu có lần ghi theo lô bắt đầu hoặc đang chạy trong lúc đọc
+        (không biết lần đọc có thấy lô đó hay không) thì chờ lần ghi xong rồi đọc lại. Nhờ vậy một lô hoặc
+        nằm trong database, hoặc vẫn nằm trong phần chưa ghi, không bao giờ cả hai.
+
+        Args:
+            kind (str): KIND_REQUESTS hoặc KIND_TOKENS
+            user_id (int): ID của người dùng
+            day (date, optional): Ngày (None: mọi ngày)
+            load_committed (Callable): Hàm async đọc giá trị trong database
+
+        Returns:
+            int: Tổng số lượng
+        """
+        while True:
+            writes = self._writes
+            if writes % 2:
+                # Đang ghi: chờ lần ghi kết thúc
+                async with self._lock:
+                    pass
+                continue
+            committed = await load_committed()
+            if self._writes == writes:
+                return committed + self.pending(kind, user_id, day)
+
+    def pending_rows(self) -> int:
+        """Số bản ghi (loại, người dùng, ngày) đang chờ ghi."""
+        return sum(len(pending) for pending in self._pending.values())
+
+    async def flush(self, db: Optional[AsyncSession] = None) -> int:
+        """
+        Ghi toàn bộ số liệu đang chờ trong một transaction.
+
+        Lỗi khi ghi thì số liệu được trả lại để thử lại ở lần ghi sau.
+
+        Args:
+            db (AsyncSession, optional): Database session (mặc định mở session mới)
+
+        Returns:
+            int: Số bản ghi (loại, người dùng, ngày) đã được cập nhật
+        """
+        # Không cho hai lần ghi chạy song song (vd: tác vụ nền và lúc tắt ứng dụng)
+        async with self._lock:
+            if not any(self._pending.values()):
+                return 0
+
+            batch = self._pending
+            self._pending = {kind: {} for kind in _TABLES}
+            self._events = 0
+            self._writes += 1
+
+            start = time.perf_counter()
+            try:
+                if db is None:
+                    async with db_session() as session:
+                        await self._write(session, batch)
+                else:
+                    await self._write(db, batch)
+            except BaseException:
+                self._restore(batch)
+                self.failed_flushes += 1
+                USAGE_FLUSHES.inc(result="error")
+                raise
+            finally:
+                self._writes += 1
+
+            rows = sum(len(pending) for pending in batch.values())
+            self.flushes += 1
+            self.rows_flushed += rows
+            self.last_flush_at = time.time()
+            USAGE_FLUSHES.inc(result="ok")
+            USAGE_FLUSH_DURATION.observe(time.perf_counter() - start)
+            return rows
+
+    @staticmethod
+    async def _write(db: AsyncSession, batch: Dict[str, Dict[Tuple[int, date], int]]):
+        try:
+            for kind, pending in batch.items():
+                if not pending:
+                    continue
+                model, column = _TABLES[kind]
+                stmt = dialect_insert(db, model).values([
+                    {"user_id": user_id, "date": day, column: count}
+                    for (user_id, day), count in sorted(pending.items())
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[model.user_id, model.date],
+                    set_={
+                        column: getattr(model, column) + getattr(stmt.excluded, column),
+                        "updated_at": func.now()
+                    }
+                )
+                await db.execute(stmt)
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+    def _restore(self, batch: Dict[str, Dict[Tuple[int, date], int]]):
+        for kind, pending in batch.items():
+            current = self._pending[kind]
+            for row_key, count in pending.items():
+                current[row_key] = current.get(row_key, 0) + count
+                self._events += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush usage counters: {e}")
+
+    def start(self):
+        """Bắt đầu tác vụ nền ghi số liệu định kỳ."""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng tác vụ nền và ghi nốt số liệu còn lại."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wake = None
+
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events_total": self.events_total,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_flushed": self.rows_flushed,
+            "pending_rows": self.pending_rows(),
+            "pending_events": self._events,
+            # Số transaction tránh được so với việc ghi database cho từng sự kiện
+            "transactions_saved": max(self.events_total - self.flushes - self.failed_flushes, 0),
+            "last_flush_at": self.last_flush_at,
+            "flush_interval": self.flush_interval,
+            "max_events": self.max_events
+        }
+
+
+usage_aggregator = UsageAggregator()
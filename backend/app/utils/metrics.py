@@ -0,0 +1,259 @@
+"""
+backend/app/utils/metrics.py
+------------------
+Mục đích:
+- Thu thập số liệu vận hành trong tiến trình và xuất theo định dạng văn bản của Prometheus,
+  không cần thư viện ngoài.
+- Chi phí ghi nhận trên đường xử lý request thấp: mỗi lần ghi chỉ là cộng số vào dict.
+
+Chức năng chính:
+- Class Counter, Gauge, Histogram: số liệu có nhãn (labels).
+- Class MetricsRegistry: đăng ký số liệu và collector (hàm đọc số liệu sẵn có lúc scrape, vd: thống kê cache),
+  render() ra định dạng text exposition 0.0.4.
+- Các số liệu dùng chung của ứng dụng: độ trễ HTTP theo route, TTFB, TTFT và thời lượng stream LLM,
+  tokens/s, số stream đang chạy, số lần thử theo backend, số hedge, thời gian chờ và số lần từ chối của hàng đợi LLM,
+  DB pool (số lần checkout, thời gian chờ), quyết định của rate limiter, số sự kiện sử dụng và số lần
+  ghi theo lô xuống database, thời gian chờ và số lần từ chối của executor hash mật khẩu.
+"""
+import math
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket mặc định (giây) cho độ trễ request và stream
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+@dataclass
+class MetricFamily:
+    """Một nhóm mẫu số liệu cùng tên, do collector trả về lúc scrape."""
+    name: str
+    kind: str
+    documentation: str
+    samples: List[Tuple[Dict[str, str], float]] = field(default_factory=list)
+
+    def add(self, value: float, **labels):
+        self.samples.append((labels, value))
+        return self
+
+
+class Metric:
+    """Phần chung của các loại số liệu có nhãn."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def clear(self):
+        self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Bộ đếm chỉ tăng."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Giá trị tăng giảm tùy ý (vd: số stream đang chạy)."""
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """
+    Phân phối giá trị theo bucket cố định.
+
+    Mỗi lần observe chỉ tăng một bucket (không luỹ kế); số luỹ kế được tính lúc render.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [số đếm theo từng bucket (+ bucket +Inf), tổng, số lần]
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Tập hợp các số liệu và collector của ứng dụng."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """Đăng ký hàm trả về các MetricFamily, được gọi mỗi lần scrape."""
+        self._collectors.append(collector)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        """Xóa giá trị của mọi số liệu (dùng trong test)."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self) -> str:
+        """
+        Xuất toàn bộ số liệu theo định dạng text của Prometheus.
+
+        Returns:
+            str: Nội dung cho endpoint /metrics
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for family in collector():
+                lines.append(f"# HELP {family.name} {family.documentation}")
+                lines.append(f"# TYPE {family.name} {family.kind}")
+                for labels, value in family.samples:
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request tới khi gửi xong body (kể cả response stream).",
+    ("method", "route", "status"))
+HTTP_TIME_TO_FIRST_BYTE = registry.histogram(
+    "http_time_to_first_byte_seconds", "Thời gian từ khi nhận request tới khi gửi phần body đầu tiên.",
+    ("method", "route"))
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("http_requests_in_flight", "Số request HTTP đang được xử lý.")
+
+LLM_TIME_TO_FIRST_TOKEN = registry.histogram(
+    "llm_time_to_first_token_seconds", "Thời gian từ khi gọi LLM tới token đầu tiên.", ("connection",))
+LLM_STREAM_DURATION = registry.histogram(
+    "llm_stream_duration_seconds", "Thời lượng toàn bộ một stream từ LLM.", ("outcome",))
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "llm_tokens_per_second", "Tốc độ sinh token của upstream sau token đầu tiên.", (),
+    (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500))
+LLM_COMPLETION_TOKENS = registry.counter("llm_completion_tokens_total", "Tổng số token LLM đã sinh.")
+LLM_STREAMS_IN_FLIGHT = registry.gauge("llm_streams_in_flight", "Số stream tới LLM đang mở.")
+LLM_BACKEND_ATTEMPTS = registry.counter(
+    "llm_backend_attempts_total", "Số lần mở stream tới từng backend LLM theo kết quả.", ("backend", "result"))
+LLM_HEDGES = registry.counter(
+    "llm_hedges_total", "Request dự phòng (hedge) theo kết quả: fired, won, budget_exhausted.", ("outcome",))
+LLM_ADMISSION_WAIT = registry.histogram(
+    "llm_admission_wait_seconds", "Thời gian chờ trong hàng đợi trước khi được gọi LLM.")
+LLM_ADMISSION_REJECTIONS = registry.counter(
+    "llm_admission_rejections_total", "Số request bị từ chối bởi hàng đợi LLM theo lý do.", ("reason",))
+
+DB_POOL_CHECKOUTS = registry.counter("db_pool_checkouts_total", "Số lần lấy kết nối từ DB pool.", ("pool",))
+DB_POOL_WAIT = registry.histogram(
+    "db_pool_wait_seconds", "Thời gian chờ lấy kết nối từ DB pool.", ("pool",),
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+
+RATE_LIMIT_DECISIONS = registry.counter(
+    "rate_limit_decisions_total", "Quyết định của rate limiter theo kết quả.", ("result",))
+
+PASSWORD_HASH_WAIT = registry.histogram(
+    "password_hash_wait_seconds", "Thời gian chờ tới lượt chạy bcrypt trên executor.", ("operation",))
+PASSWORD_HASH_REJECTIONS = registry.counter(
+    "password_hash_rejections_total", "Số thao tác hash mật khẩu bị từ chối vì chờ quá lâu.", ("operation",))
+
+USAGE_EVENTS = registry.counter(
+    "usage_events_total", "Sự kiện sử dụng (request, token) được gom trong bộ nhớ; trước đây mỗi sự kiện là một "
+    "transaction.", ("kind",))
+USAGE_FLUSHES = registry.counter(
+    "usage_flushes_total", "Số transaction ghi số liệu sử dụng theo lô xuống database theo kết quả.", ("result",))
+USAGE_FLUSH_DURATION = registry.histogram(
+    "usage_flush_duration_seconds", "Thời gian một lần ghi số liệu sử dụng theo lô.")
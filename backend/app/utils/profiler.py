@@ -0,0 +1,105 @@
+"""
+backend/app/utils/profiler.py
+------------------
+Mục đích:
+- Profiling ứng dụng đang chạy với traffic thật mà không cần khởi động lại hay cài thêm công cụ.
+
+Chức năng chính:
+- Class SamplingProfiler: một thread lấy mẫu stack (sys._current_frames) theo chu kỳ cố định, mặc định chỉ
+  lấy thread của event loop; chi phí chỉ phát sinh trong lúc profiling.
+- Kết quả ở định dạng "folded stacks" (mỗi dòng "frame;frame;... số mẫu"), dùng trực tiếp được với
+  flamegraph.pl, speedscope hoặc inferno.
+- Mỗi thời điểm chỉ chạy một lần profiling (ProfilerBusyError nếu đang có lần khác).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+
+class ProfilerBusyError(RuntimeError):
+    """Đang có một lần profiling khác chạy."""
+
+
+_run_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    # ';' là ký tự phân tách frame của định dạng folded, ' ' phân tách số mẫu ở cuối dòng
+    return f"{code.co_name} ({filename}:{frame.f_lineno})".replace(";", ":")
+
+
+def _fold(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu stack định kỳ.
+
+    Thuộc tính:
+        interval (float): Khoảng cách giữa hai lần lấy mẫu (giây)
+        thread_ids (Optional[Iterable[int]]): Các thread cần lấy mẫu; None là mọi thread (trừ thread profiler)
+        samples (int): Số lần lấy mẫu đã thực hiện
+    """
+
+    def __init__(self, interval: float, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.samples = 0
+        self._stacks: Counter = Counter()
+
+    def sample(self):
+        """Lấy một mẫu stack của các thread cần theo dõi."""
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            self._stacks[_fold(frame)] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "SamplingProfiler":
+        """
+        Lấy mẫu liên tục trong một khoảng thời gian (chặn thread gọi, nên chạy bằng asyncio.to_thread).
+
+        Args:
+            seconds (float): Thời gian profiling
+
+        Returns:
+            SamplingProfiler: Chính profiler này (để đọc kết quả)
+
+        Raises:
+            ProfilerBusyError: Nếu đang có một lần profiling khác chạy
+        """
+        if not _run_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another profiling session is running")
+        try:
+            deadline = time.monotonic() + seconds
+            next_sample = time.monotonic()
+            while next_sample < deadline:
+                self.sample()
+                next_sample += self.interval
+                time.sleep(max(next_sample - time.monotonic(), 0))
+        finally:
+            _run_lock.release()
+        return self
+
+    def stacks(self) -> Dict[str, int]:
+        return dict(self._stacks)
+
+    def folded(self) -> str:
+        """
+        Kết quả theo định dạng folded stacks, stack nhiều mẫu nhất đứng trước.
+
+        Returns:
+            str: Mỗi dòng "frame;frame;... số mẫu"
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
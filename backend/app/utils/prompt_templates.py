@@ -1,18 +1,112 @@
-class AITutorPrompt:
+"""
+backend/app/utils/prompt_templates.py
+------------------
+Mục đích:
+- Nơi duy nhất định nghĩa các prompt template cho LLM.
+- Giữ phần đầu prompt (system prompt) cố định từng byte giữa các lượt chat,
+  để server LLM có thể tái sử dụng prefix/KV cache và giảm thời gian tới token đầu tiên.
+
+Chức năng chính:
+- Định nghĩa class PromptTemplate: biên dịch một lần phần prefix tĩnh và đếm sẵn số token của nó.
+- Lịch sử hội thoại được nối vào sau prefix dưới dạng các lượt chat Llama 3, không chèn vào giữa system prompt.
+- Registry PROMPT_TEMPLATES với các hàm register_template(), get_template() và compile_templates().
+- Giữ class AITutorPrompt để tương thích với code cũ.
+"""
+from typing import Dict, List
+
+from app.utils.reflection import message_tokens
+from app.utils.token_counter import count_tokens
+
+BEGIN_OF_TEXT = "<|begin_of_text|>"
+END_OF_TURN = "<|eot_id|>"
+
+
+def turn_header(role: str) -> str:
+    """Phần mở đầu một lượt chat theo định dạng Llama 3."""
+    return f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+
+
+class PromptTemplate:
     """
-    Lớp tạo prompt cho AI Tutor.
+    Prompt template đã biên dịch.
+
+    Thuộc tính:
+        name (str): Tên template trong registry.
+        prefix (str): Phần đầu prompt cố định (system prompt), giống hệt nhau ở mọi lượt chat.
+        prefix_tokens (int): Số token của prefix, được đếm một lần khi biên dịch.
     """
 
-    def __init__(self, history: list):
+    def __init__(self, name: str, system_prompt: str):
+        self.name = name
+        self.prefix = BEGIN_OF_TEXT + turn_header("system") + system_prompt + END_OF_TURN
+        self.suffix = turn_header("assistant")
+        self.compile()
+
+    def compile(self):
+        """Đếm lại số token của phần tĩnh (gọi lại sau khi tokenizer được nạp)."""
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.suffix_tokens = count_tokens(self.suffix)
+
+    def render(self, history: List[dict]) -> str:
         """
-        Khởi tạo với lịch sử chat.
+        Tạo prompt hoàn chỉnh: prefix cố định, các lượt chat trong lịch sử, rồi lượt của assistant.
 
         Args:
-            history: Danh sách tin nhắn trong lịch sử chat.
+            history (List[dict]): Danh sách tin nhắn {"role", "content"} từ cũ đến mới
+
+        Returns:
+            str: Chuỗi prompt hoàn chỉnh
         """
-        self.history = history
-    template = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-You are an AI tutor teaching programming to children in **Vietnamese**. Your task is to guide students step by step, helping them discover answers on their own instead of providing direct solutions.
+        turns = "".join(
+            turn_header(entry["role"]) + entry["content"] + END_OF_TURN for entry in history
+        )
+        return self.prefix + turns + self.suffix
+
+    def count_prompt_tokens(self, history: List[dict]) -> int:
+        """
+        Ước lượng số token của prompt mà không phải mã hóa lại prefix hay lịch sử.
+
+        Args:
+            history (List[dict]): Danh sách tin nhắn (dùng token_count đã lưu nếu có)
+
+        Returns:
+            int: Số token của prompt
+        """
+        return self.prefix_tokens + sum(message_tokens(entry) for entry in history) + self.suffix_tokens
+
+
+# Registry các template đã biên dịch, theo tên
+PROMPT_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_template(template: PromptTemplate) -> PromptTemplate:
+    """Đăng ký template vào registry."""
+    PROMPT_TEMPLATES[template.name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    """
+    Lấy template đã biên dịch theo tên.
+
+    Args:
+        name (str): Tên template
+
+    Returns:
+        PromptTemplate: Template tương ứng
+    """
+    if name not in PROMPT_TEMPLATES:
+        raise KeyError(f"Unknown prompt template '{name}'")
+    return PROMPT_TEMPLATES[name]
+
+
+def compile_templates():
+    """Biên dịch lại toàn bộ template (vd: sau khi tokenizer được nạp lúc khởi động)."""
+    for template in PROMPT_TEMPLATES.values():
+        template.compile()
+
+
+AI_TUTOR_SYSTEM_PROMPT = """You are an AI tutor teaching programming to children in **Vietnamese**. Your task is to guide students step by step, helping them discover answers on their own instead of providing direct solutions.
 
 ### **Guiding Rules:**
 1. **Step-by-step guidance:** When a student asks a question, do not provide the answer immediately. Instead, break down the problem, ask leading questions, and encourage critical thinking.
@@ -50,15 +144,24 @@ AI Tutor: Chính xác! Đừng quên thêm #include <iostream> ở đầu chươ
 ### **Important Notes:**
 - **Only restart guidance if the student abandons the current question before completing it.**
 - **If the student finishes one question and asks another, continue answering without restarting.**
-- **All responses must be in Vietnamese.**
+- **All responses must be in Vietnamese.**"""
 
-### **Conversation History:**
-{history}
+AI_TUTOR_TEMPLATE = register_template(PromptTemplate("ai_tutor", AI_TUTOR_SYSTEM_PROMPT))
 
-### **Response:**
-<|eot_id|><|start_header_id|>user<|end_header_id|>
-<|eot_id|><|start_header_id|>assistant<|end_header_id|>
-"""
+
+class AITutorPrompt:
+    """
+    Lớp tạo prompt cho AI Tutor (giữ để tương thích, dùng AI_TUTOR_TEMPLATE).
+    """
+
+    def __init__(self, history: list):
+        """
+        Khởi tạo với lịch sử chat.
+
+        Args:
+            history: Danh sách tin nhắn trong lịch sử chat.
+        """
+        self.history = history
 
     def format(self) -> str:
         """
@@ -67,7 +170,4 @@ AI Tutor: Chính xác! Đừng quên thêm #include <iostream> ở đầu chươ
         Returns:
             str: Chuỗi prompt hoàn chỉnh.
         """
-        formatted_history = "\n".join(
-            [f"{entry['role']}: {entry['content']}" for entry in self.history]
-        )
-        return self.template.format(history=formatted_history)
\ No newline at end of file
+        return AI_TUTOR_TEMPLATE.render(self.history)
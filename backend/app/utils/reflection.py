@@ -3,32 +3,72 @@ backend/app/utils/reflection.py
 ------------------
 Mục đích:
 - Trích xuất và xử lý lịch sử hội thoại cho mô hình LLM.
-- Giới hạn số lượng tin nhắn trong lịch sử để tránh vượt quá token limit.
+- Giới hạn lịch sử theo ngân sách token để tránh vượt quá context của mô hình.
 
 Chức năng chính:
 - Định nghĩa class Reflection với phương thức __call__ để có thể sử dụng như một hàm.
-- Trích xuất N tin nhắn gần nhất từ lịch sử chat.
-- Giúp tối ưu hóa độ dài của prompt gửi đến LLM.
+- Chọn tin nhắn từ mới đến cũ cho tới khi lấp đầy ngân sách token (token_budget).
+- Dùng số token đã lưu sẵn của từng tin nhắn nên không phải mã hóa lại lịch sử.
+- Vẫn hỗ trợ giới hạn theo N tin nhắn gần nhất khi không có ngân sách token.
 """
+from app.utils.token_counter import count_tokens
+
+# Số token phụ cho mỗi tin nhắn khi đưa vào prompt (vai trò, ký tự phân tách)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def message_tokens(entry: dict) -> int:
+    """
+    Số token một tin nhắn chiếm trong prompt.
+
+    Args:
+        entry (dict): Tin nhắn {"role", "content", "token_count"}
+
+    Returns:
+        int: Số token (dùng token_count đã lưu, chỉ đếm lại với dữ liệu cũ chưa có)
+    """
+    token_count = entry.get("token_count")
+    if token_count is None:
+        token_count = count_tokens(entry.get("content", ""))
+    return token_count + MESSAGE_TOKEN_OVERHEAD
 
 
 class Reflection:
     """
-    Trích xuất N item gần nhất từ lịch sử chat.
+    Trích xuất các tin nhắn gần nhất từ lịch sử chat.
 
     Thuộc tính:
-        lastItemsConsidereds (int): Số lượng tin nhắn gần nhất cần giữ lại.
+        lastItemsConsidereds (int): Số lượng tin nhắn gần nhất tối đa cần giữ lại.
+        token_budget (int): Ngân sách token cho phần lịch sử.
     """
 
-    def __call__(self, chat_history, lastItemsConsidereds=8):
+    def __call__(self, chat_history, lastItemsConsidereds=8, token_budget=None):
         """
-        Trích xuất `lastItemsConsidereds` tin nhắn gần nhất từ lịch sử chat.
+        Trích xuất các tin nhắn gần nhất từ lịch sử chat.
+
+        Khi có token_budget, tin nhắn được chọn từ mới đến cũ cho tới khi vượt ngân sách;
+        tin nhắn mới nhất luôn được giữ lại.
 
         Args:
-            chat_history: Danh sách các tin nhắn chat.
-            lastItemsConsidereds: Số lượng tin nhắn gần đây cần giữ lại.
+            chat_history: Danh sách các tin nhắn chat (từ cũ đến mới).
+            lastItemsConsidereds: Số lượng tin nhắn gần đây tối đa cần giữ lại.
+            token_budget: Ngân sách token cho lịch sử (None: chỉ giới hạn theo số tin nhắn).
 
         Returns:
-            Lịch sử chat đã được cắt bớt chỉ còn `lastItemsConsidereds` tin nhắn gần nhất.
+            Lịch sử chat đã được cắt bớt, theo thứ tự từ cũ đến mới.
         """
-        return chat_history[-lastItemsConsidereds:]
\ No newline at end of file
+        recent = chat_history[-lastItemsConsidereds:] if lastItemsConsidereds else chat_history
+        if token_budget is None:
+            return recent
+
+        selected = []
+        used = 0
+        for entry in reversed(recent):
+            cost = message_tokens(entry)
+            if selected and used + cost > token_budget:
+                break
+            selected.append(entry)
+            used += cost
+
+        selected.reverse()
+        return selected
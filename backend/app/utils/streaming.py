@@ -0,0 +1,96 @@
+"""
+backend/app/utils/streaming.py
+------------------
+Mục đích:
+- Phát hiện client ngắt kết nối trong lúc stream để dừng ngay việc đọc token từ LLM.
+- Đảm bảo generator của response luôn được đóng (chạy phần dọn dẹp) khi stream kết thúc.
+
+Chức năng chính:
+- Định nghĩa class DisconnectAwareStreamingResponse: luôn lắng nghe http.disconnect (với mọi phiên bản ASGI),
+  hủy việc stream khi client ngắt kết nối và đóng body_iterator trong vùng được che chắn khỏi việc hủy;
+  on_close (tùy chọn) luôn được gọi sau cùng, kể cả khi generator chưa từng chạy.
+- Hàm sse_event() định dạng một sự kiện Server-Sent Events.
+"""
+import inspect
+import json
+from typing import Any, Callable, Optional
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse hủy việc stream ngay khi client ngắt kết nối.
+
+    Khi bị hủy, generator nhận CancelledError (đang chờ token từ upstream) hoặc GeneratorExit
+    (đang chờ gửi chunk), nhờ đó có thể đóng request upstream, lưu phần trả lời dở
+    và chỉ tính số token thực sự đã sinh.
+    Mỗi chunk chỉ được lấy tiếp sau khi chunk trước đã được gửi đi, nên tốc độ đọc upstream
+    tự điều chỉnh theo tốc độ nhận của client (backpressure).
+
+    Thuộc tính:
+        client_disconnected (bool): Client đã ngắt kết nối trước khi stream xong.
+        on_close (Callable, optional): Hàm dọn dẹp (thường hoặc async) luôn được gọi khi response kết thúc (vd: trả
+            chỗ trong hàng đợi LLM); cần thiết vì generator chưa từng chạy thì đóng lại cũng không chạy khối finally.
+    """
+
+    client_disconnected = False
+
+    def __init__(self, *args, on_close: Optional[Callable[[], Any]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await super().__call__(scope, receive, send)
+            return
+
+        finished = False
+
+        async def stream(cancel_scope: anyio.CancelScope):
+            nonlocal finished
+            try:
+                await self.stream_response(send)
+                finished = True
+            except OSError:
+                # ASGI 2.4: server báo client đã ngắt kết nối khi gửi dữ liệu
+                self.client_disconnected = True
+            cancel_scope.cancel()
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(stream, task_group.cancel_scope)
+                await self.listen_for_disconnect(receive)
+                if not finished:
+                    self.client_disconnected = True
+                task_group.cancel_scope.cancel()
+        finally:
+            # Đóng generator kể cả khi bị hủy, để phần dọn dẹp của nó luôn được chạy
+            with anyio.CancelScope(shield=True):
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                if self.on_close is not None:
+                    result = self.on_close()
+                    if inspect.isawaitable(result):
+                        await result
+
+        if self.background is not None and not self.client_disconnected:
+            await self.background()
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """
+    Định dạng một sự kiện Server-Sent Events.
+
+    Args:
+        data: Dữ liệu (được mã hóa JSON)
+        event (str, optional): Tên sự kiện
+
+    Returns:
+        str: Sự kiện SSE kết thúc bằng dòng trống
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,62 @@
+"""
+backend/app/utils/token_counter.py
+------------------
+Mục đích:
+- Ước tính số lượng token của văn bản để tính quota và chọn lịch sử hội thoại.
+- Không bao giờ chặn event loop trên đường xử lý request.
+
+Chức năng chính:
+- Nạp bộ mã hóa tiktoken một lần (load_tokenizer) trong thread riêng khi ứng dụng khởi động.
+- Hàm count_tokens() dùng tiktoken nếu đã nạp, ngược lại dùng ước lượng theo số ký tự.
+"""
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Số ký tự trung bình cho một token khi chưa có tiktoken
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+
+def load_tokenizer(encoding_name: Optional[str] = None) -> bool:
+    """
+    Nạp bộ mã hóa tiktoken (có thể tải file BPE qua mạng nên cần gọi ngoài event loop).
+
+    Args:
+        encoding_name (str, optional): Tên encoding của tiktoken, mặc định TOKENIZER_ENCODING
+
+    Returns:
+        bool: True nếu nạp thành công
+    """
+    global _encoding
+
+    # Import tại đây vì app.config import module reflection, module này lại dùng token_counter
+    from app.config import TOKENIZER_ENCODING
+    encoding_name = encoding_name or TOKENIZER_ENCODING
+
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(encoding_name)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer '{encoding_name}', using character estimate: {e}")
+        return False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Đếm (hoặc ước lượng) số token trong văn bản.
+
+    Args:
+        text (str): Văn bản cần đếm
+
+    Returns:
+        int: Số token
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
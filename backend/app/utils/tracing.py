@@ -0,0 +1,109 @@
+"""
+backend/app/utils/tracing.py
+------------------
+Mục đích:
+- Đo thời gian từng giai đoạn của một request (xác thực, kiểm tra quota, lấy lịch sử, tạo prompt,
+  TTFT của upstream, commit cuối) để biết lượt chat chậm ở đâu.
+
+Chức năng chính:
+- Class RequestTrace: danh sách span của một request, gắn vào context (contextvars) nên mọi hàm
+  trong cùng request (kể cả task con và generator stream) đều ghi vào được.
+- Hàm span(): context manager đo một giai đoạn; không làm gì khi không có trace (chi phí gần bằng 0).
+- Hàm record_span(): ghi một khoảng thời gian đã đo sẵn (vd: TTFT).
+- Hàm server_timing(): định dạng header Server-Timing từ các span.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Các span của một request.
+
+    Thuộc tính:
+        spans (List[Tuple[str, float]]): (tên giai đoạn, thời lượng giây) theo thứ tự kết thúc.
+        started (float): Thời điểm bắt đầu request (perf_counter).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+    def add(self, name: str, duration: float):
+        self.spans.append((name, duration))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def totals(self) -> Dict[str, float]:
+        """Tổng thời lượng theo tên giai đoạn (ms), cộng dồn các span trùng tên."""
+        totals: Dict[str, float] = {}
+        for name, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+
+def start_trace() -> Tuple[RequestTrace, object]:
+    """
+    Bắt đầu trace cho request hiện tại.
+
+    Returns:
+        Tuple[RequestTrace, Token]: Trace mới và token để khôi phục context bằng end_trace()
+    """
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Đo thời gian của một giai đoạn và ghi vào trace của request hiện tại.
+
+    Args:
+        name (str): Tên giai đoạn (chữ, số, '_' để dùng được trong Server-Timing)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def record_span(name: str, duration: float):
+    """Ghi một khoảng thời gian (giây) đã đo sẵn vào trace của request hiện tại."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration)
+
+
+def server_timing(trace: RequestTrace, include_total: bool = True) -> str:
+    """
+    Định dạng header Server-Timing (đơn vị ms).
+
+    Args:
+        trace (RequestTrace): Trace của request
+        include_total (bool): Thêm mục "total" là thời gian từ đầu request tới hiện tại
+
+    Returns:
+        str: Giá trị header, vd: "auth;dur=0.41, quota;dur=2.10, total;dur=8.02"
+    """
+    entries = [f"{name};dur={ms}" for name, ms in trace.totals().items()]
+    if include_total:
+        entries.append(f"total;dur={round(trace.elapsed() * 1000, 3)}")
+    return ", ".join(entries)
@@ -0,0 +1,99 @@
+"""
+backend/app/utils/ttl_cache.py
+------------------
+Mục đích:
+- Cung cấp bộ nhớ đệm trong tiến trình có giới hạn kích thước và thời gian sống.
+- Dùng chung cho các cache trên đường xử lý request (danh tính người dùng, lịch sử hội thoại, ...).
+
+Chức năng chính:
+- Định nghĩa class TTLCache: loại bỏ theo LRU khi đầy và theo TTL khi hết hạn.
+- Hỗ trợ vô hiệu hóa từng khóa một cách tường minh.
+- Thống kê số lần hit/miss.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Cache LRU có thời gian sống cho từng phần tử.
+
+    Thuộc tính:
+        maxsize (int): Số phần tử tối đa.
+        ttl (float): Thời gian sống mặc định (giây).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Lấy giá trị theo khóa, đánh dấu là vừa được dùng.
+
+        Args:
+            key: Khóa cần tìm
+            default: Giá trị trả về khi không có hoặc đã hết hạn
+
+        Returns:
+            Giá trị trong cache hoặc default
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Lưu giá trị vào cache, loại bỏ phần tử ít dùng nhất nếu vượt quá kích thước.
+
+        Args:
+            key: Khóa
+            value: Giá trị
+            ttl (float, optional): Thời gian sống riêng cho phần tử này
+        """
+        self._data[key] = (value, self._clock() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Xóa một khóa khỏi cache (nếu có)."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[1] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss của cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,106 @@
+"""
+benchmarks/bench_reflection.py
+------------------
+Mục đích:
+- Đo kích thước prompt và thời gian tạo prompt theo độ dài cuộc hội thoại.
+- So sánh cách cũ (lấy toàn bộ lịch sử rồi giữ 8 tin nhắn cuối) với cách chọn theo ngân sách token.
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.bench_reflection
+    python -m benchmarks.bench_reflection --lengths 10 100 1000 --budget 2048 --json
+"""
+import argparse
+import json
+import random
+import time
+
+from app.config import HISTORY_WINDOW_SIZE, HISTORY_TOKEN_BUDGET
+from app.utils.prompt_templates import AI_TUTOR_TEMPLATE
+from app.utils.reflection import Reflection
+from app.utils.token_counter import count_tokens
+
+SHORT_MESSAGES = [
+    "Làm sao để in Hello World trong C++?",
+    "Em chưa hiểu vòng lặp for lắm ạ.",
+    "Đúng rồi! Bạn thử đoán xem lệnh nào dùng để in ra màn hình?",
+    "printf(\"Hello, world!\");",
+]
+
+CODE_SNIPPET = "#include <iostream>\nint main() {\n    for (int i = 0; i < 10; ++i) {\n        std::cout << i << std::endl;\n    }\n}\n"
+
+
+def make_conversation(length: int, seed: int = 0):
+    """Tạo cuộc hội thoại giả với tin nhắn ngắn xen lẫn các đoạn code dán vào."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(length):
+        if rng.random() < 0.15:
+            content = CODE_SNIPPET * rng.randint(5, 40)
+        else:
+            content = rng.choice(SHORT_MESSAGES)
+        role = "user" if i % 2 == 0 else "assistant"
+        # token_count được tính một lần lúc ghi tin nhắn, không nằm trong phần đo thời gian
+        messages.append({"role": role, "content": content, "token_count": count_tokens(content)})
+    return messages
+
+
+def build_fixed(messages, reflection):
+    history = [{"role": m["role"], "content": m["content"]} for m in messages]
+    return AI_TUTOR_TEMPLATE.render(reflection(history, lastItemsConsidereds=8))
+
+
+def build_budget(messages, reflection, budget):
+    window = messages[-HISTORY_WINDOW_SIZE:]
+    return AI_TUTOR_TEMPLATE.render(reflection(window, lastItemsConsidereds=HISTORY_WINDOW_SIZE, token_budget=budget))
+
+
+def measure(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        prompt = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    return prompt, elapsed
+
+
+def run(lengths, budget, repeat):
+    reflection = Reflection()
+    results = []
+    for length in lengths:
+        messages = make_conversation(length)
+        fixed_prompt, fixed_time = measure(lambda: build_fixed(messages, reflection), repeat)
+        budget_prompt, budget_time = measure(lambda: build_budget(messages, reflection, budget), repeat)
+        results.append({
+            "conversation_length": length,
+            "fixed8_prompt_tokens": count_tokens(fixed_prompt),
+            "fixed8_build_us": round(fixed_time * 1e6, 1),
+            "budget_prompt_tokens": count_tokens(budget_prompt),
+            "budget_build_us": round(budget_time * 1e6, 1),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--budget", type=int, default=HISTORY_TOKEN_BUDGET)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    results = run(args.lengths, args.budget, args.repeat)
+    if args.json:
+        print(json.dumps({"budget": args.budget, "prefix_tokens": AI_TUTOR_TEMPLATE.prefix_tokens,
+                          "results": results}, indent=2))
+        return
+
+    header = f"{'messages':>9} | {'fixed-8 tokens':>14} | {'fixed-8 us':>10} | {'budget tokens':>13} | {'budget us':>9}"
+    print(f"history token budget: {args.budget}, static prefix tokens: {AI_TUTOR_TEMPLATE.prefix_tokens}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['conversation_length']:>9} | {r['fixed8_prompt_tokens']:>14} | {r['fixed8_build_us']:>10} | "
+              f"{r['budget_prompt_tokens']:>13} | {r['budget_build_us']:>9}")
+
+
+if __name__ == "__main__":
+    main()
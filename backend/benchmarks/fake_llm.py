@@ -0,0 +1,191 @@
+"""
+benchmarks/fake_llm.py
+------------------
+Mục đích:
+- Server LLM giả chạy cục bộ, tương thích endpoint completions (stream=True) của OpenAI,
+  để đo tải backend mà không phụ thuộc vào API LLM thật.
+
+Chức năng chính:
+- FakeLLMConfig: TTFT, số token mỗi giây, số token mỗi phản hồi, độ dao động (jitter) và tỉ lệ lỗi.
+- Hàm build_fake_llm_app(): ứng dụng FastAPI stream từng token dạng SSE ("data: {...}", "data: [DONE]"),
+  trả usage ở chunk cuối nếu request yêu cầu stream_options.include_usage.
+- Class FakeLLMServer: chạy server giả bằng uvicorn trong một thread riêng (dùng cho benchmark và test).
+
+Cách chạy độc lập (từ thư mục backend):
+    python -m benchmarks.fake_llm --port 9000 --ttft 0.3 --tps 40 --tokens 128 --jitter 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class FakeLLMConfig:
+    """
+    Cấu hình stream của server giả.
+
+    Thuộc tính:
+        ttft (float): Thời gian chờ (giây) trước khi trả header, giả lập xếp hàng và prefill.
+        tokens_per_second (float): Tốc độ sinh token sau khi bắt đầu stream.
+        tokens (int): Số token tối đa mỗi phản hồi (còn bị giới hạn bởi max_tokens của request).
+        jitter (float): Độ dao động tương đối của mọi khoảng chờ (0.2 = ±20%).
+        seed (int, optional): Seed cho jitter và lỗi, để các lần chạy có thể lặp lại.
+        error_rate (float): Tỉ lệ request bị trả lỗi HTTP (sau TTFT, trước token đầu tiên).
+        error_status (int): Mã HTTP của các request lỗi.
+    """
+    ttft: float = 0.3
+    tokens_per_second: float = 40.0
+    tokens: int = 128
+    jitter: float = 0.0
+    seed: Optional[int] = None
+    error_rate: float = 0.0
+    error_status: int = 500
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_fake_llm_app(config: FakeLLMConfig, stats: Optional[Dict[str, int]] = None):
+    """
+    Tạo ứng dụng FastAPI giả lập endpoint /v1/completions.
+
+    Args:
+        config (FakeLLMConfig): Cấu hình stream
+        stats (Dict[str, int], optional): Bộ đếm dùng chung: requests (số request nhận được),
+            completed (số stream đã gửi hết token, stream bị client đóng giữa chừng không được tính),
+            failed (số request bị trả lỗi theo error_rate)
+
+    Returns:
+        FastAPI: Ứng dụng server giả
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    stats = stats if stats is not None else {}
+    stats.setdefault("requests", 0)
+    stats.setdefault("completed", 0)
+    stats.setdefault("failed", 0)
+    rng = random.Random(config.seed)
+    fake_app = FastAPI()
+
+    def delay(seconds: float) -> float:
+        if config.jitter:
+            seconds *= rng.uniform(1 - config.jitter, 1 + config.jitter)
+        return max(seconds, 0.0)
+
+    def chunk(model: str, choices: list, usage: Optional[Dict[str, int]] = None) -> str:
+        data: Dict[str, Any] = {
+            "id": "cmpl-fake",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+        }
+        if usage is not None:
+            data["usage"] = usage
+        return f"data: {json.dumps(data)}\n\n"
+
+    @fake_app.post("/v1/completions")
+    async def completions(body: dict):
+        stats["requests"] += 1
+        model = body.get("model", "fake")
+        count = min(config.tokens, body.get("max_tokens") or config.tokens)
+        # Bị cắt bởi max_tokens của request thì kết thúc với "length", như API thật
+        finish_reason = "length" if count < config.tokens else "stop"
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        # Giả lập upstream xếp hàng trước khi trả về header
+        await asyncio.sleep(delay(config.ttft))
+        if config.error_rate and rng.random() < config.error_rate:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"message": "fake upstream failure", "type": "server_error"}},
+                                status_code=config.error_status)
+
+        async def events():
+            for i in range(count):
+                await asyncio.sleep(delay(1 / config.tokens_per_second))
+                yield chunk(model, [{
+                    "index": 0,
+                    "text": f"tok{i} ",
+                    "finish_reason": finish_reason if i == count - 1 else None,
+                    "logprobs": None
+                }])
+            if include_usage:
+                prompt_tokens = len(body.get("prompt", "")) // 4
+                yield chunk(model, [], {"prompt_tokens": prompt_tokens, "completion_tokens": count,
+                                        "total_tokens": prompt_tokens + count})
+            yield "data: [DONE]\n\n"
+            stats["completed"] += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return fake_app
+
+
+class FakeLLMServer:
+    """
+    Chạy server LLM giả bằng uvicorn trong một thread riêng.
+
+    Thuộc tính:
+        url (str): Base URL tương thích OpenAI (vd: http://127.0.0.1:9000/v1).
+        stats (Dict[str, int]): Bộ đếm request của server giả.
+    """
+
+    def __init__(self, config: FakeLLMConfig, host: str = "127.0.0.1", port: Optional[int] = None,
+                 stats: Optional[Dict[str, int]] = None):
+        import uvicorn
+
+        self.stats = stats if stats is not None else {}
+        self.port = port or _free_port()
+        self.url = f"http://{host}:{self.port}/v1"
+        self._server = uvicorn.Server(uvicorn.Config(build_fake_llm_app(config, self.stats), host=host,
+                                                     port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self) -> "FakeLLMServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Server LLM giả tương thích OpenAI completions (stream)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Thời gian chờ trước token đầu tiên (giây)")
+    parser.add_argument("--tps", type=float, default=40.0, help="Số token mỗi giây")
+    parser.add_argument("--tokens", type=int, default=128, help="Số token mỗi phản hồi")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Độ dao động tương đối của các khoảng chờ")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ request bị trả lỗi HTTP 500")
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(ttft=args.ttft, tokens_per_second=args.tps, tokens=args.tokens,
+                           jitter=args.jitter, seed=args.seed, error_rate=args.error_rate)
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1 ({config})")
+    uvicorn.run(build_fake_llm_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
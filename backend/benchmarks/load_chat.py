@@ -0,0 +1,296 @@
+"""
+benchmarks/load_chat.py
+------------------
+Mục đích:
+- Đo tải end-to-end endpoint /api/chat/conversations/{id}/chat với số request đồng thời cố định.
+- Xuất kết quả dạng JSON (TTFT, tokens/s, độ trễ p50/p95/p99) để so sánh giữa các commit.
+
+Chức năng chính:
+- Mặc định tự dựng toàn bộ môi trường: server LLM giả (benchmarks.fake_llm), database SQLite tạm
+  được seed sẵn (benchmarks.seed_db) và ứng dụng chạy bằng uvicorn trong cùng tiến trình.
+- Với --base-url: đo một server đang chạy; dữ liệu được seed vào DATABASE_URL hiện tại
+  (phải là database của server đó, và server phải trỏ tới một LLM giả hoặc thật).
+- Mỗi request ghi nhận mã trạng thái, TTFT (thời gian tới byte đầu tiên của body), tổng thời gian và số token.
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.load_chat --concurrency 16 --requests 200 --output bench.json
+    python -m benchmarks.load_chat --concurrency 32 --tps 80 --ttft 0.5 --jitter 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+
+QUESTIONS = [
+    "Giải thích vòng lặp for trong Python",
+    "Làm sao để đảo ngược một chuỗi?",
+    "Khác nhau giữa list và tuple là gì?",
+    "Tại sao code của em bị IndexError?",
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Phân vị theo nội suy tuyến tính giữa hai phần tử gần nhất (None nếu không có dữ liệu)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values: List[float], scale: float = 1.0) -> Dict[str, Optional[float]]:
+    """Tóm tắt phân phối: p50/p95/p99, trung bình và lớn nhất (nhân với `scale`, làm tròn 3 chữ số)."""
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * scale, 3)
+
+    return {
+        "p50": rounded(percentile(values, 50)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "mean": rounded(sum(values) / len(values) if values else None),
+        "max": rounded(max(values) if values else None),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _make_token(email: str) -> str:
+    from jose import jwt
+    from app.config import SECRET_KEY, ALGORITHM
+
+    expires = datetime.now(timezone.utc) + timedelta(hours=12)
+    return jwt.encode({"sub": email, "exp": expires}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class AppServer:
+    """Chạy ứng dụng (app.main:app) bằng uvicorn trong một thread riêng, kể cả các sự kiện startup/shutdown."""
+
+    def __init__(self, port: int):
+        import uvicorn
+
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=port,
+                                                     log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> "AppServer":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Application server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+async def _chat_once(client, base_url: str, token: str, conversation_id: int, content: str) -> Dict[str, Any]:
+    """Gửi một lượt chat và đo TTFT, tổng thời gian, số token nhận được."""
+    started = time.perf_counter()
+    first_byte = None
+    text = []
+    try:
+        async with client.stream("POST", f"{base_url}/api/chat/conversations/{conversation_id}/chat",
+                                 json={"content": content},
+                                 headers={"Authorization": f"Bearer {token}"}) as response:
+            async for chunk in response.aiter_text():
+                if chunk and first_byte is None:
+                    first_byte = time.perf_counter()
+                text.append(chunk)
+            status_code = response.status_code
+    except Exception as e:
+        return {"status": type(e).__name__, "ok": False, "latency": time.perf_counter() - started}
+
+    finished = time.perf_counter()
+    ok = status_code == 200
+    tokens = len("".join(text).split()) if ok else 0
+    result = {"status": str(status_code), "ok": ok, "latency": finished - started, "tokens": tokens}
+    if ok and first_byte is not None:
+        result["ttft"] = first_byte - started
+        if tokens > 1 and finished > first_byte:
+            # Tốc độ stream sau token đầu tiên, không tính thời gian chờ TTFT
+            result["tokens_per_second"] = (tokens - 1) / (finished - first_byte)
+    return result
+
+
+async def run_load(base_url: str, targets: List[Dict[str, Any]], concurrency: int, requests: int,
+                   warmup: int = 0, seed: int = 0) -> Dict[str, Any]:
+    """
+    Gửi `requests` lượt chat với đúng `concurrency` request đang chạy tại mọi thời điểm.
+
+    Args:
+        base_url (str): URL của ứng dụng
+        targets (List[Dict]): Các cặp {"token", "conversation_id"} được dùng xoay vòng
+        concurrency (int): Số request đồng thời
+        requests (int): Tổng số request được đo
+        warmup (int): Số request chạy trước, không tính vào kết quả
+        seed (int): Seed chọn câu hỏi
+
+    Returns:
+        Dict: Kết quả tổng hợp
+    """
+    import httpx
+
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        async def run_batch(count: int, offset: int) -> List[Dict[str, Any]]:
+            results: List[Dict[str, Any]] = []
+            next_index = 0
+
+            async def worker():
+                nonlocal next_index
+                while next_index < count:
+                    index = offset + next_index
+                    next_index += 1
+                    target = targets[index % len(targets)]
+                    # Mỗi câu hỏi khác nhau để không bị gộp bởi single-flight/cache câu trả lời
+                    content = f"{rng.choice(QUESTIONS)} (#{index})"
+                    results.append(await _chat_once(client, base_url, target["token"],
+                                                    target["conversation_id"], content))
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return results
+
+        if warmup:
+            await run_batch(warmup, 0)
+        started = time.perf_counter()
+        results = await run_batch(requests, warmup)
+        duration = time.perf_counter() - started
+
+    succeeded = [r for r in results if r["ok"]]
+    status_codes: Dict[str, int] = {}
+    for r in results:
+        status_codes[r["status"]] = status_codes.get(r["status"], 0) + 1
+    total_tokens = sum(r["tokens"] for r in succeeded)
+
+    return {
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "status_codes": status_codes,
+        "duration_s": round(duration, 3),
+        "requests_per_second": round(len(succeeded) / duration, 3) if duration else None,
+        "ttft_ms": summarize([r["ttft"] for r in succeeded if "ttft" in r], 1000),
+        "latency_ms": summarize([r["latency"] for r in succeeded], 1000),
+        "tokens_per_second": {
+            "per_stream": summarize([r["tokens_per_second"] for r in succeeded if "tokens_per_second" in r]),
+            "aggregate": round(total_tokens / duration, 3) if duration else None,
+        },
+        "tokens_total": total_tokens,
+    }
+
+
+def _configure_environment(args, llm_url: str):
+    """Đặt biến môi trường cho ứng dụng chạy trong tiến trình (trước khi import app)."""
+    if not os.getenv("DATABASE_URL") or args.fresh_db:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="aitutor-bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["api_url_fpt"] = llm_url
+    os.environ.setdefault("api_key_fpt", "bench-key")
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    # Benchmark đo hiệu năng, không đo giới hạn request/quota của người dùng
+    os.environ["DAILY_REQUEST_LIMIT"] = str(10 ** 9)
+    os.environ["TOKEN_QUOTA_PER_USER"] = str(10 ** 12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo tải endpoint chat (TTFT, tokens/s, p50/p95/p99)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số request đồng thời")
+    parser.add_argument("--requests", type=int, default=100, help="Tổng số request được đo")
+    parser.add_argument("--warmup", type=int, default=8, help="Số request khởi động, không tính vào kết quả")
+    parser.add_argument("--base-url", default=None, help="Đo một server đang chạy thay vì tự dựng môi trường")
+    parser.add_argument("--fresh-db", action="store_true", help="Luôn dùng database SQLite tạm mới")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=2, help="Số hội thoại mỗi người dùng")
+    parser.add_argument("--messages", type=int, default=20, help="Số tin nhắn có sẵn mỗi hội thoại")
+    parser.add_argument("--ttft", type=float, default=0.2, help="TTFT của LLM giả (giây)")
+    parser.add_argument("--tps", type=float, default=50.0, help="Số token mỗi giây của LLM giả")
+    parser.add_argument("--tokens", type=int, default=64, help="Số token mỗi phản hồi của LLM giả")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Độ dao động các khoảng chờ của LLM giả")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="Nhãn tùy ý ghi vào kết quả")
+    parser.add_argument("--output", default=None, help="Ghi JSON vào file thay vì stdout")
+    args = parser.parse_args()
+
+    llm_config = FakeLLMConfig(ttft=args.ttft, tokens_per_second=args.tps, tokens=args.tokens,
+                               jitter=args.jitter, seed=args.seed)
+    fake_llm = None if args.base_url else FakeLLMServer(llm_config).start()
+    if fake_llm is not None:
+        _configure_environment(args, fake_llm.url)
+
+    # Import sau khi cấu hình môi trường vì app.config đọc biến môi trường lúc import
+    from benchmarks.seed_db import seed_database
+
+    users = seed_database(args.users, args.conversations, args.messages, args.seed,
+                         email_prefix=f"bench-{int(time.time())}")
+    targets = [{"token": _make_token(user.email), "conversation_id": conversation_id}
+               for user in users for conversation_id in user.conversation_ids]
+
+    try:
+        if args.base_url:
+            results = asyncio.run(run_load(args.base_url.rstrip("/"), targets, args.concurrency, args.requests,
+                                           args.warmup, args.seed))
+        else:
+            with AppServer(_free_port()) as app_server:
+                results = asyncio.run(run_load(app_server.url, targets, args.concurrency, args.requests,
+                                               args.warmup, args.seed))
+    finally:
+        if fake_llm is not None:
+            fake_llm.stop()
+
+    report = {
+        "label": args.label,
+        "commit": _git_commit(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "users": args.users,
+            "conversations_per_user": args.conversations,
+            "messages_per_conversation": args.messages,
+            "target": args.base_url or "in-process",
+            "fake_llm": None if args.base_url else vars(llm_config),
+        },
+        "results": results,
+    }
+    if fake_llm is not None:
+        report["fake_llm_stats"] = fake_llm.stats
+
+    output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
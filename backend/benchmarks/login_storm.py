@@ -0,0 +1,261 @@
+"""
+benchmarks/login_storm.py
+------------------
+Mục đích:
+- Đo ảnh hưởng của một loạt đăng nhập (bcrypt) lên các stream chat đang chạy trên cùng worker,
+  vd: cả lớp đăng nhập cùng lúc đầu giờ học.
+
+Chức năng chính:
+- Hai giai đoạn có cùng tải chat liên tục: baseline (không có đăng nhập) và storm (bắn --logins lượt
+  POST /api/auth/login với --login-concurrency request đồng thời).
+- Với mỗi giai đoạn ghi TTFT, độ trễ và khoảng lặng dài nhất giữa hai chunk của stream chat (stall);
+  với đăng nhập ghi mã trạng thái và độ trễ. Stream chat không bị ảnh hưởng khi số liệu hai giai đoạn gần nhau.
+- --blocking: chạy bcrypt trực tiếp trên event loop như trước đây để so sánh (chỉ khi tự dựng môi trường).
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.login_storm --logins 200 --login-concurrency 50 --output storm.json
+    python -m benchmarks.login_storm --logins 200 --login-concurrency 50 --blocking --label before
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+from benchmarks.load_chat import QUESTIONS, AppServer, _configure_environment, _free_port, _git_commit, _make_token, \
+    summarize
+
+LOGIN_PASSWORD = "storm-password"
+
+
+def _seed_login_users(count: int, prefix: str) -> List[str]:
+    """Tạo người dùng đăng nhập bằng mật khẩu (dùng chung một hash để việc seed không tốn thời gian)."""
+    from app.database import SessionLocal
+    from app.models.user import User
+    from app.services.password_hasher import pwd_context
+
+    hashed_password = pwd_context.hash(LOGIN_PASSWORD)
+    emails = [f"{prefix}-login{index}@example.com" for index in range(count)]
+    db = SessionLocal()
+    try:
+        db.add_all([User(email=email, name="Student", provider="email", hashed_password=hashed_password)
+                    for email in emails])
+        db.commit()
+    finally:
+        db.close()
+    return emails
+
+
+def _run_bcrypt_inline():
+    """Mô phỏng hành vi cũ: hash/verify chạy ngay trên event loop thay vì executor."""
+    from app.services.password_hasher import PasswordHasher
+
+    async def run_inline(self, operation, func, *args):
+        return func(*args)
+
+    PasswordHasher._run = run_inline
+
+
+async def _chat_with_stalls(client, base_url: str, token: str, conversation_id: int, content: str) -> Dict[str, Any]:
+    """Gửi một lượt chat, đo TTFT, tổng thời gian và khoảng lặng dài nhất giữa hai chunk."""
+    started = time.perf_counter()
+    first_byte = last_chunk = None
+    max_gap = 0.0
+    try:
+        async with client.stream("POST", f"{base_url}/api/chat/conversations/{conversation_id}/chat",
+                                 json={"content": content},
+                                 headers={"Authorization": f"Bearer {token}"}) as response:
+            async for chunk in response.aiter_text():
+                if not chunk:
+                    continue
+                now = time.perf_counter()
+                if first_byte is None:
+                    first_byte = now
+                else:
+                    max_gap = max(max_gap, now - last_chunk)
+                last_chunk = now
+            status_code = response.status_code
+    except Exception as e:
+        return {"status": type(e).__name__, "ok": False}
+
+    result = {"status": str(status_code), "ok": status_code == 200, "latency": time.perf_counter() - started}
+    if first_byte is not None:
+        result["ttft"] = first_byte - started
+        result["max_gap"] = max_gap
+    return result
+
+
+async def _login_once(client, base_url: str, email: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"{base_url}/api/auth/login", json={"email": email, "password": LOGIN_PASSWORD})
+    except Exception as e:
+        return {"status": type(e).__name__, "latency": time.perf_counter() - started}
+    return {"status": str(response.status_code), "latency": time.perf_counter() - started}
+
+
+def _status_counts(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return counts
+
+
+async def _run_phase(client, base_url: str, targets: List[Dict[str, Any]], chat_concurrency: int, duration: float,
+                     emails: List[str], logins: int, login_concurrency: int, rng: random.Random) -> Dict[str, Any]:
+    """Chạy tải chat liên tục trong `duration` giây, kèm `logins` lượt đăng nhập nếu có."""
+    chats: List[Dict[str, Any]] = []
+    login_results: List[Dict[str, Any]] = []
+    stop = asyncio.Event()
+    counter = 0
+
+    async def chat_worker():
+        nonlocal counter
+        while not stop.is_set():
+            counter += 1
+            target = targets[counter % len(targets)]
+            content = f"{rng.choice(QUESTIONS)} (#{counter})"
+            chats.append(await _chat_with_stalls(client, base_url, target["token"], target["conversation_id"],
+                                                 content))
+
+    async def login_worker(indexes):
+        for index in indexes:
+            login_results.append(await _login_once(client, base_url, emails[index % len(emails)]))
+
+    chat_tasks = [asyncio.create_task(chat_worker()) for _ in range(chat_concurrency)]
+    started = time.perf_counter()
+    if logins:
+        await asyncio.gather(*(login_worker(range(worker, logins, login_concurrency))
+                               for worker in range(login_concurrency)))
+    await asyncio.sleep(max(duration - (time.perf_counter() - started), 0))
+    stop.set()
+    await asyncio.gather(*chat_tasks)
+
+    succeeded = [r for r in chats if r["ok"]]
+    phase = {
+        "chats": len(chats),
+        "chat_status_codes": _status_counts(chats),
+        "chat_ttft_ms": summarize([r["ttft"] for r in succeeded if "ttft" in r], 1000),
+        "chat_latency_ms": summarize([r["latency"] for r in succeeded], 1000),
+        "chat_max_gap_ms": summarize([r["max_gap"] for r in succeeded if "max_gap" in r], 1000),
+    }
+    if logins:
+        phase["logins"] = len(login_results)
+        phase["login_status_codes"] = _status_counts(login_results)
+        phase["login_latency_ms"] = summarize([r["latency"] for r in login_results], 1000)
+    return phase
+
+
+async def run_storm(base_url: str, targets: List[Dict[str, Any]], emails: List[str], chat_concurrency: int,
+                    duration: float, logins: int, login_concurrency: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Đo tải chat khi không có và khi có một loạt đăng nhập.
+
+    Args:
+        base_url (str): URL của ứng dụng
+        targets (List[Dict]): Các cặp {"token", "conversation_id"} cho tải chat
+        emails (List[str]): Email các tài khoản đăng nhập bằng mật khẩu LOGIN_PASSWORD
+        chat_concurrency (int): Số stream chat đồng thời
+        duration (float): Thời gian tối thiểu của mỗi giai đoạn (giây)
+        logins (int): Số lượt đăng nhập trong giai đoạn storm
+        login_concurrency (int): Số lượt đăng nhập đồng thời
+        seed (int): Seed chọn câu hỏi
+
+    Returns:
+        Dict: Kết quả của hai giai đoạn baseline và storm
+    """
+    import httpx
+
+    rng = random.Random(seed)
+    connections = chat_concurrency + login_concurrency
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        baseline = await _run_phase(client, base_url, targets, chat_concurrency, duration, emails, 0,
+                                    login_concurrency, rng)
+        storm = await _run_phase(client, base_url, targets, chat_concurrency, duration, emails, logins,
+                                 login_concurrency, rng)
+    return {"baseline": baseline, "storm": storm}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo độ trễ stream chat trong lúc có nhiều lượt đăng nhập (bcrypt)")
+    parser.add_argument("--chat-concurrency", type=int, default=8, help="Số stream chat đồng thời")
+    parser.add_argument("--duration", type=float, default=10.0, help="Thời gian tối thiểu mỗi giai đoạn (giây)")
+    parser.add_argument("--logins", type=int, default=100, help="Số lượt đăng nhập trong giai đoạn storm")
+    parser.add_argument("--login-concurrency", type=int, default=25, help="Số lượt đăng nhập đồng thời")
+    parser.add_argument("--login-users", type=int, default=50, help="Số tài khoản đăng nhập bằng mật khẩu")
+    parser.add_argument("--blocking", action="store_true",
+                        help="Chạy bcrypt trên event loop (hành vi cũ) để so sánh")
+    parser.add_argument("--base-url", default=None, help="Đo một server đang chạy thay vì tự dựng môi trường")
+    parser.add_argument("--fresh-db", action="store_true", help="Luôn dùng database SQLite tạm mới")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--conversations", type=int, default=1, help="Số hội thoại mỗi người dùng")
+    parser.add_argument("--messages", type=int, default=10, help="Số tin nhắn có sẵn mỗi hội thoại")
+    parser.add_argument("--ttft", type=float, default=0.2, help="TTFT của LLM giả (giây)")
+    parser.add_argument("--tps", type=float, default=50.0, help="Số token mỗi giây của LLM giả")
+    parser.add_argument("--tokens", type=int, default=64, help="Số token mỗi phản hồi của LLM giả")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="Nhãn tùy ý ghi vào kết quả")
+    parser.add_argument("--output", default=None, help="Ghi JSON vào file thay vì stdout")
+    args = parser.parse_args()
+
+    if args.blocking and args.base_url:
+        parser.error("--blocking only applies to the in-process server")
+
+    llm_config = FakeLLMConfig(ttft=args.ttft, tokens_per_second=args.tps, tokens=args.tokens, seed=args.seed)
+    fake_llm = None if args.base_url else FakeLLMServer(llm_config).start()
+    if fake_llm is not None:
+        _configure_environment(args, fake_llm.url)
+
+    # Import sau khi cấu hình môi trường vì app.config đọc biến môi trường lúc import
+    from benchmarks.seed_db import seed_database
+
+    prefix = f"storm-{int(time.time())}"
+    users = seed_database(args.users, args.conversations, args.messages, args.seed, email_prefix=prefix)
+    targets = [{"token": _make_token(user.email), "conversation_id": conversation_id}
+               for user in users for conversation_id in user.conversation_ids]
+    emails = _seed_login_users(args.login_users, prefix)
+    if args.blocking:
+        _run_bcrypt_inline()
+
+    try:
+        if args.base_url:
+            results = asyncio.run(run_storm(args.base_url.rstrip("/"), targets, emails, args.chat_concurrency,
+                                            args.duration, args.logins, args.login_concurrency, args.seed))
+        else:
+            with AppServer(_free_port()) as app_server:
+                results = asyncio.run(run_storm(app_server.url, targets, emails, args.chat_concurrency,
+                                                args.duration, args.logins, args.login_concurrency, args.seed))
+    finally:
+        if fake_llm is not None:
+            fake_llm.stop()
+
+    report = {
+        "label": args.label,
+        "commit": _git_commit(),
+        "config": {
+            "chat_concurrency": args.chat_concurrency,
+            "duration": args.duration,
+            "logins": args.logins,
+            "login_concurrency": args.login_concurrency,
+            "login_users": args.login_users,
+            "blocking": args.blocking,
+            "target": args.base_url or "in-process",
+            "fake_llm": None if args.base_url else vars(llm_config),
+        },
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+benchmarks/seed_db.py
+------------------
+Mục đích:
+- Tạo dữ liệu mẫu (người dùng, hội thoại, tin nhắn) cho benchmark, có thể lặp lại theo seed.
+
+Chức năng chính:
+- Hàm seed_database(): tạo bảng và chèn hàng loạt người dùng, hội thoại kèm cột tóm tắt và tin nhắn.
+- SeededUser: email, id người dùng và danh sách id hội thoại đã tạo, để load driver chọn đối tượng gọi API.
+
+Cách chạy độc lập (từ thư mục backend, database lấy từ DATABASE_URL):
+    python -m benchmarks.seed_db --users 50 --conversations 5 --messages 40
+"""
+import argparse
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import insert, select
+
+from app.database import SessionLocal, create_tables
+from app.models.chat import Conversation, Message
+from app.models.user import User
+from app.services.conversation_service import make_preview
+from app.utils.token_counter import count_tokens
+
+QUESTIONS = [
+    "Làm sao để in Hello World trong C++?",
+    "Em chưa hiểu vòng lặp for lắm ạ.",
+    "Con trỏ trong C khác gì tham chiếu?",
+    "Tại sao chương trình của em bị lỗi segmentation fault?",
+    "Đệ quy là gì, cho em ví dụ với ạ.",
+]
+
+ANSWERS = [
+    "Đúng rồi! Bạn thử đoán xem lệnh nào dùng để in ra màn hình?",
+    "Hãy thử viết vòng lặp in các số từ 1 đến 10 trước nhé.",
+    "Bạn xem lại xem biến đó đã được cấp phát bộ nhớ chưa?",
+]
+
+
+@dataclass
+class SeededUser:
+    email: str
+    user_id: int
+    conversation_ids: List[int] = field(default_factory=list)
+
+
+def seed_database(users: int = 20, conversations_per_user: int = 5, messages_per_conversation: int = 20,
+                  seed: int = 0, email_prefix: str = "bench-user") -> List[SeededUser]:
+    """
+    Tạo dữ liệu mẫu cho benchmark.
+
+    Args:
+        users (int): Số người dùng
+        conversations_per_user (int): Số hội thoại mỗi người dùng
+        messages_per_conversation (int): Số tin nhắn mỗi hội thoại (xen kẽ user/assistant)
+        seed (int): Seed sinh nội dung
+        email_prefix (str): Tiền tố email của người dùng mẫu
+
+    Returns:
+        List[SeededUser]: Người dùng và hội thoại đã tạo
+    """
+    create_tables()
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    seeded: List[SeededUser] = []
+
+    db = SessionLocal()
+    try:
+        emails = [f"{email_prefix}-{i}@example.com" for i in range(users)]
+        db.execute(insert(User), [{"email": email, "name": f"Bench {i}", "provider": "email"}
+                                  for i, email in enumerate(emails)])
+        user_ids = dict(db.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+
+        for email in emails:
+            user = SeededUser(email=email, user_id=user_ids[email])
+            for c in range(conversations_per_user):
+                created_at = start + timedelta(minutes=c)
+                contents = [rng.choice(QUESTIONS if m % 2 == 0 else ANSWERS)
+                            for m in range(messages_per_conversation)]
+                token_counts = [count_tokens(content) for content in contents]
+                conversation_id = db.execute(insert(Conversation).values(
+                    user_id=user.user_id,
+                    title=f"Hội thoại {c}",
+                    created_at=created_at,
+                    updated_at=created_at + timedelta(seconds=messages_per_conversation),
+                    message_count=messages_per_conversation,
+                    last_message_preview=make_preview(contents[-1]) if contents else None,
+                    total_tokens=sum(token_counts)
+                )).inserted_primary_key[0]
+                if contents:
+                    db.execute(insert(Message), [{
+                        "conversation_id": conversation_id,
+                        "role": "user" if m % 2 == 0 else "assistant",
+                        "content": content,
+                        "token_count": token_counts[m],
+                        "created_at": created_at + timedelta(seconds=m)
+                    } for m, content in enumerate(contents)])
+                user.conversation_ids.append(conversation_id)
+            seeded.append(user)
+        db.commit()
+    finally:
+        db.close()
+
+    return seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo dữ liệu mẫu cho benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=5, help="Số hội thoại mỗi người dùng")
+    parser.add_argument("--messages", type=int, default=20, help="Số tin nhắn mỗi hội thoại")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    seeded = seed_database(args.users, args.conversations, args.messages, args.seed)
+    print(f"Seeded {len(seeded)} users, {sum(len(u.conversation_ids) for u in seeded)} conversations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+conftest.py
+-----------
+Mục đích:
+- Chuẩn bị môi trường chung cho các bài kiểm thử backend.
+- Dựng server LLM giả tương thích OpenAI (completions, stream=True) của benchmarks.fake_llm chạy cục bộ.
+
+Nội dung:
+- Thiết lập biến môi trường (DATABASE_URL SQLite tạm, SECRET_KEY, URL LLM) trước khi import app.
+- Fixture fake_llm_server: server giả stream từng token với độ trễ cấu hình được.
+- Fixture db_tables: tạo lại toàn bộ bảng cho mỗi test.
+- Hàm make_user_token/auth_headers: tạo người dùng và JWT (header Authorization) để gọi các endpoint cần xác thực.
+- Fixture run_api: chạy một kịch bản async với httpx.AsyncClient gọi trực tiếp ứng dụng ASGI.
+- Hàm open_conversation/send_chat: tạo hội thoại và gửi một lượt chat qua API.
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+FAKE_LLM_PORT = _free_port()
+_TEST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="aitutor-tests-"), "test.db")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TEST_DB_PATH}")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("api_key_fpt", "test-key")
+os.environ.setdefault("api_url_fpt", f"http://127.0.0.1:{FAKE_LLM_PORT}/v1")
+
+# Cấu hình stream của server giả: thời gian chờ token đầu (TTFT), số token và độ trễ giữa các token
+FAKE_LLM_TTFT = 0.3
+FAKE_LLM_TOKENS = 10
+FAKE_LLM_TOKEN_DELAY = 0.05
+
+# Số stream mà server giả đã gửi hết toàn bộ token (stream bị client đóng giữa chừng không được tính)
+FAKE_LLM_STATS = {"completed": 0}
+
+
+@pytest.fixture(scope="session")
+def fake_llm_server():
+    """Chạy server LLM giả (benchmarks.fake_llm) trong một thread riêng trong suốt phiên test."""
+    from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+
+    config = FakeLLMConfig(ttft=FAKE_LLM_TTFT, tokens_per_second=1 / FAKE_LLM_TOKEN_DELAY, tokens=FAKE_LLM_TOKENS)
+    with FakeLLMServer(config, port=FAKE_LLM_PORT, stats=FAKE_LLM_STATS) as server:
+        yield server.url
+
+
+@pytest.fixture
+def run_api():
+    """
+    Chạy một kịch bản async với client gọi trực tiếp ứng dụng ASGI (không cần server thật).
+
+    Dùng: run_api(scenario) với scenario là hàm async nhận httpx.AsyncClient; trả về kết quả của scenario.
+    """
+    import httpx
+    from app.main import app
+
+    def run(scenario):
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await scenario(client)
+
+        return asyncio.run(main())
+
+    return run
+
+
+def _reset_in_memory_state():
+    """Xóa các cache trong tiến trình để dữ liệu của test trước không rò sang test sau."""
+    from app.services.admission import llm_admission
+    from app.services.auth_service import user_identity_cache
+    from app.services.hedging import hedge_policy
+    from app.services import token_service
+    from app.services.history_service import history_cache
+    from app.services.rate_limiter import MemoryCounterStore, request_limiter
+    from app.services.response_cache import response_cache
+    from app.services.single_flight import single_flight
+    from app.services.usage_aggregator import usage_aggregator
+    from app.utils.metrics import registry
+
+    user_identity_cache.clear()
+    history_cache.clear()
+    response_cache.clear()
+    response_cache.reset_stats()
+    single_flight.reset_stats()
+    llm_admission.reset_stats()
+    hedge_policy.reset_stats()
+    # Bộ đếm request hằng ngày: người dùng của mỗi test bắt đầu lại từ 0
+    request_limiter.store = MemoryCounterStore()
+    request_limiter._seeded.clear()
+    # Sổ quota token: khôi phục lại từ database mới của test
+    token_service.quota_ledger.store = MemoryCounterStore()
+    token_service.quota_ledger._seeded.clear()
+    token_service.quota_ledger._reserved.clear()
+    # Số liệu sử dụng chưa ghi của test trước không được ghi vào database của test sau
+    usage_aggregator.clear()
+    usage_aggregator.reset_stats()
+    registry.reset()
+
+
+@pytest.fixture
+def db_tables():
+    """Tạo lại schema trên database SQLite của test."""
+    from app.database import engine
+    from app.models.base import load_models
+
+    metadata = load_models()
+    metadata.drop_all(bind=engine)
+    metadata.create_all(bind=engine)
+    _reset_in_memory_state()
+    yield
+    metadata.drop_all(bind=engine)
+
+
+def make_user_token(email: str = "student@example.com") -> str:
+    """Tạo người dùng trong database và trả về JWT access token."""
+    from jose import jwt
+    from app.config import SECRET_KEY, ALGORITHM
+    from app.database import SessionLocal
+    from app.models.user import User
+
+    db = SessionLocal()
+    try:
+        db.add(User(email=email, name="Student", provider="email"))
+        db.commit()
+    finally:
+        db.close()
+
+    return jwt.encode({"sub": email}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def auth_headers(email: str = "student@example.com") -> dict:
+    """Tạo người dùng và trả về header Authorization của họ."""
+    return {"Authorization": f"Bearer {make_user_token(email)}"}
+
+
+async def open_conversation(client, headers: dict, title: str = "Test") -> int:
+    """Tạo hội thoại qua API và trả về ID."""
+    response = await client.post("/api/chat/conversations", json={"title": title}, headers=headers)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+async def send_chat(client, headers: dict, conversation_id: int, content: str = "Xin chào", sse: bool = False):
+    """Gửi một lượt chat (hoặc biến thể SSE) và trả về response đã đọc hết."""
+    suffix = "/chat/sse" if sse else "/chat"
+    return await client.post(f"/api/chat/conversations/{conversation_id}{suffix}", json={"content": content},
+                             headers=headers)
@@ -0,0 +1,93 @@
+"""
+test_admission.py
+-----------------
+Mục đích:
+- Kiểm thử hàng đợi gọi LLM: chia công bằng giữa người dùng, bậc ưu tiên, deadline và phản hồi 503/SSE.
+"""
+import asyncio
+
+import pytest
+
+from app.services.admission import PRIORITY_HIGH, AdmissionController, AdmissionRejected, llm_admission
+from tests.conftest import auth_headers, open_conversation, send_chat
+
+
+def _admission_order(controller, tickets):
+    order = []
+    while any(not ticket.done for ticket in tickets):
+        admitted = next(ticket for ticket in tickets if ticket.admitted and not ticket.done)
+        order.append(admitted)
+        controller.release(admitted)
+    return order
+
+
+def test_burst_from_one_user_does_not_starve_others():
+    async def run():
+        controller = AdmissionController(capacity=1, max_queue=100, deadline=10)
+        holder = controller.enqueue(user_id=99)
+        burst = [controller.enqueue(user_id=1) for _ in range(4)]
+        others = [controller.enqueue(user_id=2), controller.enqueue(user_id=3)]
+
+        assert controller.position(burst[0]) == 1
+        assert controller.position(others[0]) == 2
+        assert controller.position(others[1]) == 3
+
+        controller.release(holder)
+        order = _admission_order(controller, burst + others)
+        return [ticket.user_id for ticket in order]
+
+    assert asyncio.run(run()) == [1, 2, 3, 1, 1, 1]
+
+
+def test_priority_tier_is_served_first():
+    async def run():
+        controller = AdmissionController(capacity=1, max_queue=100, deadline=10)
+        holder = controller.enqueue(user_id=99)
+        standard = controller.enqueue(user_id=1)
+        teacher = controller.enqueue(user_id=2, priority=PRIORITY_HIGH)
+        controller.release(holder)
+        return teacher.admitted, standard.admitted
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_queue_limits_and_deadline_reject_quickly():
+    async def run():
+        controller = AdmissionController(capacity=1, max_queue=1, deadline=0.05)
+        controller.enqueue(user_id=1)
+        waiting = controller.enqueue(user_id=2)
+        with pytest.raises(AdmissionRejected) as full:
+            controller.enqueue(user_id=3)
+        with pytest.raises(AdmissionRejected) as expired:
+            await controller.acquire(waiting)
+        return full.value.reason, expired.value.reason, controller.stats()
+
+    full_reason, expired_reason, stats = asyncio.run(run())
+
+    assert (full_reason, expired_reason) == ("queue_full", "deadline")
+    assert stats["waiting"] == 0 and stats["rejected_total"] == 2
+
+
+def test_saturated_chat_returns_503_and_sse_reports_position(db_tables, run_api, monkeypatch):
+    monkeypatch.setattr(llm_admission, "capacity", 1)
+    monkeypatch.setattr(llm_admission, "deadline", 0.1)
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        holder = llm_admission.enqueue(user_id=0)
+        try:
+            plain = await send_chat(client, headers, conversation_id)
+            sse = await send_chat(client, headers, conversation_id, sse=True)
+        finally:
+            llm_admission.release(holder)
+        return plain, sse
+
+    plain, sse = run_api(run)
+
+    assert plain.status_code == 503
+    assert int(plain.headers["retry-after"]) >= 1
+    assert sse.status_code == 200
+    assert 'event: queued\ndata: {"position": 1}' in sse.text
+    assert "event: rejected" in sse.text
+    assert llm_admission.stats()["active"] == 0
@@ -0,0 +1,91 @@
+"""
+test_auth.py
+------------
+Mục đích:
+- Kiểm thử việc xác thực một lần cho mỗi request và cache danh tính người dùng.
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app.database import SessionLocal
+from app.main import app
+from app.models.user import User
+from app.database import db_session
+from app.services.auth_service import deactivate_user, invalidate_user, user_identity_cache
+from tests.conftest import auth_headers
+
+client = TestClient(app)
+
+
+def test_me_returns_current_user(db_tables):
+    headers = auth_headers("me@example.com")
+
+    response = client.get("/api/auth/me", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["email"] == "me@example.com"
+
+
+def test_invalid_token_is_rejected(db_tables):
+    response = client.get("/api/auth/me", headers={"Authorization": "Bearer not-a-jwt"})
+    assert response.status_code == 401
+
+
+def test_user_identity_is_served_from_cache_until_invalidated(db_tables):
+    headers = auth_headers("cached@example.com")
+    misses_before = user_identity_cache.misses
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    # Middleware và dependency dùng chung một lần tra cứu: chỉ một miss cho request đầu tiên
+    assert user_identity_cache.misses == misses_before + 1
+
+    # Xóa người dùng khỏi database: request tiếp theo vẫn dùng danh tính trong cache
+    db = SessionLocal()
+    db.execute(delete(User).where(User.email == "cached@example.com"))
+    db.commit()
+    db.close()
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert user_identity_cache.misses == misses_before + 1
+
+    asyncio.run(invalidate_user("cached@example.com"))
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_deactivated_user_is_rejected_even_when_cached(db_tables):
+    headers = auth_headers("inactive@example.com")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    async def deactivate():
+        async with db_session() as db:
+            return await deactivate_user(db, "inactive@example.com")
+
+    assert asyncio.run(deactivate()).is_active is False
+
+    # Danh tính trong cache đã bị xóa; lần nạp lại từ database (và các lần dùng cache sau đó) đều bị từ chối
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_shared_identity_version_invalidates_other_workers(db_tables, monkeypatch):
+    from app.services import auth_service
+    from app.services.rate_limiter import MemoryCounterStore
+
+    class SharedStore(MemoryCounterStore):
+        shared = True
+
+    monkeypatch.setattr(auth_service, "identity_versions", SharedStore())
+    headers = auth_headers("worker@example.com")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    # Worker khác vô hiệu hóa người dùng: database thay đổi, cache của worker này thì chưa
+    db = SessionLocal()
+    db.query(User).filter(User.email == "worker@example.com").update({"is_active": False})
+    db.commit()
+    db.close()
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    asyncio.run(auth_service.identity_versions.set("worker@example.com", 1.0, 60))
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
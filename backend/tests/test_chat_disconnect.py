@@ -0,0 +1,120 @@
+"""
+test_chat_disconnect.py
+-----------------------
+Mục đích:
+- Kiểm thử việc client ngắt kết nối giữa chừng khi stream câu trả lời:
+  request tới LLM bị hủy, phần trả lời dở được lưu và chỉ tính token đã sinh.
+- Kiểm thử biến thể Server-Sent Events của endpoint chat.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.main import app
+from app.models.chat import MESSAGE_STATUS_COMPLETE, MESSAGE_STATUS_TRUNCATED
+from tests.conftest import (
+    FAKE_LLM_STATS, FAKE_LLM_TOKENS, FAKE_LLM_TOKEN_DELAY, auth_headers, make_user_token, open_conversation, send_chat
+)
+
+# Số chunk client nhận trước khi ngắt kết nối
+CHUNKS_BEFORE_DISCONNECT = 3
+
+
+async def _chat_and_disconnect(token: str, conversation_id: int, spec_version: str) -> list:
+    """
+    Gọi trực tiếp ứng dụng ASGI, giả lập client ngắt kết nối sau vài chunk đầu tiên.
+
+    ASGI 2.3: server gửi http.disconnect; ASGI 2.4: lệnh send sau khi ngắt kết nối báo OSError.
+    """
+    body = json.dumps({"content": "Giải thích vòng lặp for"}).encode()
+    path = f"/api/chat/conversations/{conversation_id}/chat"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"test"),
+            (b"authorization", f"Bearer {token}".encode()),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 12345),
+        "server": ("test", 80),
+    }
+    received = []
+    enough = asyncio.Event()
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await enough.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if enough.is_set() and spec_version == "2.4":
+            raise OSError("client disconnected")
+        if message["type"] == "http.response.body" and message.get("body"):
+            received.append(message["body"].decode())
+            if len(received) >= CHUNKS_BEFORE_DISCONNECT:
+                enough.set()
+
+    try:
+        await app(scope, receive, send)
+    except OSError:
+        # ASGI 2.4: lỗi ngắt kết nối được đẩy lên cho server xử lý
+        pass
+    return received
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_disconnect_cancels_upstream_and_persists_partial_answer(fake_llm_server, db_tables, run_api, spec_version):
+    token = make_user_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        completed_before = FAKE_LLM_STATS["completed"]
+        received = await _chat_and_disconnect(token, conversation_id, spec_version)
+
+        # Chờ lâu hơn thời gian còn lại của stream upstream nếu nó vẫn tiếp tục chạy
+        await asyncio.sleep(FAKE_LLM_TOKENS * FAKE_LLM_TOKEN_DELAY + 0.2)
+        completed_after = FAKE_LLM_STATS["completed"]
+
+        detail = (await client.get(f"/api/chat/conversations/{conversation_id}", headers=headers)).json()
+        usage = (await client.get("/api/chat/token-usage", headers=headers)).json()
+        return received, completed_after - completed_before, detail, usage
+
+    received, upstream_completed, detail, usage = run_api(run)
+    assistant = [m for m in detail["messages"] if m["role"] == "assistant"][0]
+
+    assert upstream_completed == 0
+    assert assistant["status"] == MESSAGE_STATUS_TRUNCATED
+    assert assistant["content"].startswith("".join(received))
+    assert len(assistant["content"].split()) < FAKE_LLM_TOKENS
+    assert 0 < usage["tokens_used"]
+
+
+def test_sse_variant_streams_token_events_and_done(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        return await send_chat(client, headers, conversation_id, sse=True)
+
+    response = run_api(run)
+    events = [block for block in response.text.split("\n\n") if block]
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [json.loads(e[len("data: "):])["token"] for e in events[:-1]] == [f"tok{i} " for i in range(FAKE_LLM_TOKENS)]
+    assert events[-1].startswith("event: done\n")
+    assert json.loads(events[-1].split("data: ", 1)[1])["status"] == MESSAGE_STATUS_COMPLETE
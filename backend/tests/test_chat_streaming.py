@@ -0,0 +1,93 @@
+"""
+test_chat_streaming.py
+----------------------
+Mục đích:
+- Kiểm thử endpoint stream /api/chat/conversations/{id}/chat.
+- Đảm bảo việc đọc token từ LLM không chặn event loop: N stream đồng thời
+  phải hoàn thành trong khoảng thời gian của một stream.
+"""
+import asyncio
+import time
+
+from tests.conftest import (
+    FAKE_LLM_TOKENS, FAKE_LLM_TOKEN_DELAY, FAKE_LLM_TTFT, auth_headers, open_conversation, send_chat
+)
+
+CONCURRENT_STREAMS = 5
+QUESTION = "Làm sao để in Hello World trong C++?"
+
+
+async def _chat(client, headers: dict, conversation_id: int) -> str:
+    response = await send_chat(client, headers, conversation_id, QUESTION)
+    assert response.status_code == 200
+    return response.text
+
+
+def test_chat_stream_returns_tokens(fake_llm_server, db_tables, run_api):
+    """Stream trả về đầy đủ nội dung từ LLM."""
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        return await _chat(client, headers, conversation_id)
+
+    text = run_api(run)
+    assert text == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS))
+
+
+def test_concurrent_chat_streams_do_not_block_each_other(fake_llm_server, db_tables, run_api):
+    """N stream đồng thời hoàn thành trong khoảng thời gian của một stream."""
+    headers = auth_headers()
+    single_stream_time = FAKE_LLM_TTFT + FAKE_LLM_TOKENS * FAKE_LLM_TOKEN_DELAY
+
+    async def run(client):
+        conversation_ids = [await open_conversation(client, headers) for _ in range(CONCURRENT_STREAMS)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_chat(client, headers, cid) for cid in conversation_ids))
+        return time.perf_counter() - start, results
+
+    elapsed, results = run_api(run)
+
+    assert len(results) == CONCURRENT_STREAMS
+    assert all(result.startswith("tok0 ") for result in results)
+    # Nếu event loop bị chặn, tổng thời gian sẽ xấp xỉ N lần một stream
+    assert elapsed < single_stream_time * 2, f"{CONCURRENT_STREAMS} streams took {elapsed:.2f}s"
+
+
+def test_sequential_chat_streams_reuse_llm_connection(fake_llm_server, db_tables, run_api):
+    """Các lượt chat liên tiếp dùng lại kết nối keep-alive tới LLM."""
+    from app.services.llm_client import pool_stats
+
+    headers = auth_headers()
+    pool_stats.reset()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        for _ in range(3):
+            await _chat(client, headers, conversation_id)
+
+    run_api(run)
+
+    stats = pool_stats.snapshot()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+
+
+def test_streamed_tokens_are_charged_atomically(fake_llm_server, db_tables, run_api):
+    """Token của các stream đồng thời được cộng dồn đúng vào token_usage."""
+    headers = auth_headers()
+
+    async def run(client):
+        await _chat(client, headers, await open_conversation(client, headers))
+        single = (await client.get("/api/chat/token-usage", headers=headers)).json()["tokens_used"]
+
+        conversation_ids = [await open_conversation(client, headers) for _ in range(3)]
+        await asyncio.gather(*(_chat(client, headers, cid) for cid in conversation_ids))
+        total = (await client.get("/api/chat/token-usage", headers=headers)).json()["tokens_used"]
+        return single, total
+
+    single, total = run_api(run)
+
+    assert single > FAKE_LLM_TOKENS
+    assert total == 4 * single
@@ -1,69 +1,59 @@
 """
-test_chat.py
-------------
+test_chats.py
+-------------
 Mục đích:
-- Kiểm thử các API endpoint của backend, đặc biệt là endpoint /chat/.
-- Sử dụng thư viện như pytest và HTTPX (hoặc TestClient của FastAPI) để mô phỏng các request.
+- Kiểm thử các API endpoint của backend, đặc biệt là endpoint chat stream
+  /api/chat/conversations/{id}/chat, với server LLM giả.
 
-Nội dung cần có:
-- Thiết lập TestClient cho FastAPI app.
-- Viết các test case cho trường hợp thành công và thất bại (ví dụ: input rỗng).
-- Kiểm tra kết quả trả về đúng với định dạng (model ChatResponse) và các mã lỗi phù hợp.
+Nội dung:
+- Health check của ứng dụng.
+- Trường hợp thành công: phản hồi được stream đầy đủ và lưu vào cuộc hội thoại.
+- Trường hợp thất bại: thiếu token xác thực, hội thoại không tồn tại.
 """
+from tests.conftest import FAKE_LLM_TOKENS, auth_headers, open_conversation, send_chat
 
-from fastapi.testclient import TestClient
-from backend.app.main import app
 
-import pytest
-from fastapi.testclient import TestClient
-from backend.app.main import app
+def test_health_check(run_api):
+    """Kiểm tra API health check"""
+    async def run(client):
+        return await client.get("/")
 
-client = TestClient(app)
+    response = run_api(run)
+    assert response.status_code == 200
+    assert response.json() == {"message": "Welcome to AI Tutor API"}
 
 
-def test_health_check():
-    """ Kiểm tra API health check """
-    response = client.get("/api/v1/health")
-    assert response.status_code == 200
-    assert response.json() == {"llm_connection": True,
-                               "status": 'healthy'}
+def test_chat_success(fake_llm_server, db_tables, run_api):
+    """Gửi tin nhắn hợp lệ: nhận đủ phản hồi và cả hai tin nhắn được lưu"""
+    headers = auth_headers()
 
+    async def run(client):
+        conversation_id = await open_conversation(client, headers, title="C++")
+        response = await send_chat(client, headers, conversation_id, "Làm sao để in Hello World trong C++?")
+        detail = (await client.get(f"/api/chat/conversations/{conversation_id}", headers=headers)).json()
+        return response, detail
 
-def test_chat_success():
-    """ Test khi gửi request hợp lệ """
-    payload = {
-        "messages": [
-            {"role": "user", "content": "Làm sao để in Hello World trong C++?"}
-        ],
-        "max_tokens": 800
-    }
+    response, detail = run_api(run)
 
-    response = client.post("/api/v1/chat/", json=payload)
     assert response.status_code == 200
-    data = response.json()
-
-    # Kiểm tra dữ liệu trả về có key 'response'
-    assert "response" in data
-    assert isinstance(data["response"],str)
-    assert len(data["response"]) > 0  # Đảm bảo có nội dung
-
-
-# def test_chat_empty_input():
-#     """ Test khi gửi request với messages rỗng """
-#     payload = {"messages": [], "max_tokens": 800}
-#
-#     response = client.post("/api/message/", json=payload)
-#     assert response.status_code == 400
-#     data = response.json()
-#     assert "detail" in data
-#     assert data["detail"] == "Input messages cannot be empty"
-#
-#
-# def test_chat_invalid_payload():
-#     """ Test khi gửi request với payload không hợp lệ """
-#     payload = {"wrong_key": "invalid_data"}
-#
-#     response = client.post("/api/message/", json=payload)
-#     assert response.status_code == 422  # FastAPI sẽ tự động trả về 422 cho schema sai
-#     data = response.json()
-#     assert "detail" in data
+    assert response.text == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS))
+    assert [m["role"] for m in detail["messages"]] == ["user", "assistant"]
+    assert detail["messages"][1]["content"] == response.text
+
+
+def test_chat_requires_authentication(db_tables, run_api):
+    """Không có token: 401"""
+    async def run(client):
+        return await send_chat(client, {}, 1)
+
+    assert run_api(run).status_code == 401
+
+
+def test_chat_unknown_conversation(fake_llm_server, db_tables, run_api):
+    """Hội thoại không tồn tại (hoặc của người khác): 404"""
+    headers = auth_headers()
+
+    async def run(client):
+        return await send_chat(client, headers, 999)
+
+    assert run_api(run).status_code == 404
@@ -0,0 +1,95 @@
+"""
+test_conversations.py
+---------------------
+Mục đích:
+- Kiểm thử danh sách hội thoại: phân trang theo cursor, thứ tự theo updated_at,
+  các cột tóm tắt được cập nhật khi ghi tin nhắn và chỉ tốn một truy vấn mỗi trang.
+"""
+from sqlalchemy import event, select
+
+from app.database import async_engine, engine, db_session
+from app.models.user import User
+from app.services.conversation_service import list_conversation_summaries
+from tests.conftest import FAKE_LLM_TOKENS, auth_headers, open_conversation, send_chat
+
+
+async def _create_conversations(client, headers: dict, count: int) -> list:
+    return [await open_conversation(client, headers, title=f"Bài {i}") for i in range(count)]
+
+
+def test_listing_is_paginated_by_cursor_newest_first(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        ids = await _create_conversations(client, headers, 5)
+        # Tin nhắn mới đưa hội thoại đầu tiên lên đầu danh sách
+        await client.post(f"/api/chat/conversations/{ids[0]}/messages",
+                          json={"role": "user", "content": "Xin chào", "conversation_id": ids[0]}, headers=headers)
+
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+            page = (await client.get("/api/chat/conversations", params=params, headers=headers)).json()
+            pages.append(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids, pages
+
+    ids, pages = run_api(run)
+    listed = [item["id"] for page in pages for item in page]
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert listed == [ids[0], ids[4], ids[3], ids[2], ids[1]]
+    assert pages[0][0]["message_count"] == 1
+    assert pages[0][0]["last_message_preview"] == "Xin chào"
+    assert "messages" not in pages[0][0]
+
+
+def test_chat_turn_updates_summary_columns(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        [conversation_id] = await _create_conversations(client, headers, 1)
+        await send_chat(client, headers, conversation_id, "Vòng lặp for là gì?")
+        return (await client.get("/api/chat/conversations", headers=headers)).json()["items"][0]
+
+    summary = run_api(run)
+
+    assert summary["message_count"] == 2
+    assert summary["last_message_preview"] == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS)).strip()
+    assert summary["total_tokens"] > FAKE_LLM_TOKENS
+
+
+def test_listing_page_is_a_single_query(db_tables, run_api):
+    headers = auth_headers()
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def run(client):
+        await _create_conversations(client, headers, 3)
+        async with db_session() as db:
+            user_id = await db.scalar(select(User.id).where(User.email == "student@example.com"))
+            statements.clear()
+            return await list_conversation_summaries(db, user_id, 2)
+
+    for target in (async_engine.sync_engine, engine):
+        event.listen(target, "before_cursor_execute", count)
+    try:
+        page = run_api(run)
+    finally:
+        for target in (async_engine.sync_engine, engine):
+            event.remove(target, "before_cursor_execute", count)
+
+    assert len(page.items) == 2 and page.next_cursor
+    assert len(statements) == 1
+
+
+def test_invalid_cursor_is_rejected(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        return await client.get("/api/chat/conversations", params={"cursor": "not-a-cursor"}, headers=headers)
+
+    assert run_api(run).status_code == 400
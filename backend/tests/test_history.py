@@ -0,0 +1,119 @@
+"""
+test_history.py
+---------------
+Mục đích:
+- Kiểm thử việc lấy cửa sổ lịch sử gần nhất của cuộc hội thoại và cache lịch sử.
+"""
+import asyncio
+
+from app.database import SessionLocal, db_session
+from app.models.chat import Conversation, Message
+from app.models.user import User
+from app.services.history_service import append_history, get_recent_history, history_cache, load_history_window
+from app.utils.reflection import MESSAGE_TOKEN_OVERHEAD, Reflection
+
+
+def _seed_conversation(message_count: int) -> int:
+    db = SessionLocal()
+    try:
+        user = User(email="history@example.com", name="History", provider="email")
+        db.add(user)
+        db.flush()
+        conversation = Conversation(user_id=user.id, title="History")
+        db.add(conversation)
+        db.flush()
+        for i in range(message_count):
+            role = "user" if i % 2 == 0 else "assistant"
+            db.add(Message(conversation_id=conversation.id, role=role, content=f"message {i}"))
+        db.commit()
+        return conversation.id
+    finally:
+        db.close()
+
+
+def test_load_history_window_returns_latest_messages_in_order(db_tables):
+    conversation_id = _seed_conversation(20)
+
+    async def run():
+        async with db_session() as db:
+            return await load_history_window(db, conversation_id, limit=8)
+
+    history = asyncio.run(run())
+
+    assert [entry["content"] for entry in history] == [f"message {i}" for i in range(12, 20)]
+
+
+def test_recent_history_is_served_from_cache_and_updated_on_append(db_tables):
+    conversation_id = _seed_conversation(3)
+
+    async def run():
+        async with db_session() as db:
+            first = await get_recent_history(db, conversation_id)
+            append_history(conversation_id, "user", "new question", 2)
+            second = await get_recent_history(db, conversation_id)
+            return first, second
+
+    misses_before = history_cache.stats()["misses"]
+    first, second = asyncio.run(run())
+
+    assert history_cache.stats()["misses"] == misses_before + 1
+    assert [entry["content"] for entry in first] == ["message 0", "message 1", "message 2"]
+    assert second[-1] == {"role": "user", "content": "new question", "token_count": 2}
+
+
+def test_reflection_fills_token_budget_newest_first():
+    history = [{"role": "user", "content": f"m{i}", "token_count": 10} for i in range(10)]
+    per_message = 10 + MESSAGE_TOKEN_OVERHEAD
+
+    selected = Reflection()(history, lastItemsConsidereds=None, token_budget=per_message * 3)
+
+    assert [entry["content"] for entry in selected] == ["m7", "m8", "m9"]
+
+
+def test_reflection_keeps_newest_message_even_if_over_budget():
+    history = [
+        {"role": "user", "content": "short", "token_count": 5},
+        {"role": "user", "content": "huge pasted file", "token_count": 5000},
+    ]
+
+    selected = Reflection()(history, token_budget=100)
+
+    assert [entry["content"] for entry in selected] == ["huge pasted file"]
+
+
+def test_append_during_cache_miss_is_not_lost(db_tables):
+    conversation_id = _seed_conversation(2)
+
+    async def run():
+        async with db_session() as db:
+            async def slow_load():
+                history = await load_history_window(db, conversation_id)
+                # Tin nhắn mới được lưu sau khi lần tải đã đọc database
+                db.add(Message(conversation_id=conversation_id, role="user", content="new question"))
+                await db.commit()
+                append_history(conversation_id, "user", "new question", 2)
+                return history
+
+            first = await history_cache.get_or_load(conversation_id, slow_load)
+            second = await get_recent_history(db, conversation_id)
+            return first, second
+
+    first, second = asyncio.run(run())
+
+    assert [entry["content"] for entry in first] == ["message 0", "message 1"]
+    assert [entry["content"] for entry in second] == ["message 0", "message 1", "new question"]
+
+
+def test_history_window_skips_unfinished_answers(db_tables):
+    conversation_id = _seed_conversation(2)
+    db = SessionLocal()
+    db.add_all([Message(conversation_id=conversation_id, role="assistant", content="", status="streaming"),
+                Message(conversation_id=conversation_id, role="assistant", content="partial", status="failed")])
+    db.commit()
+    db.close()
+
+    async def run():
+        async with db_session() as db:
+            return await load_history_window(db, conversation_id)
+
+    assert [entry["content"] for entry in asyncio.run(run())] == ["message 0", "message 1"]
@@ -0,0 +1,170 @@
+"""
+test_llm_router.py
+------------------
+Mục đích:
+- Kiểm thử việc chọn backend LLM theo độ trễ, circuit breaker, chuyển backend trước token đầu tiên
+  và hedging, với nhiều server LLM giả chạy cục bộ.
+"""
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from app.services import llm_client
+from app.services.hedging import HedgePolicy
+from app.services.llm_router import CIRCUIT_CLOSED, CIRCUIT_OPEN, BackendRouter, LLMBackend, NoBackendAvailable
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+from tests.conftest import auth_headers
+
+
+@pytest.fixture(scope="module")
+def fake_backends():
+    """Ba server giả: luôn lỗi, rất chậm và bình thường."""
+    configs = {
+        "broken": FakeLLMConfig(ttft=0.01, tokens=5, error_rate=1.0),
+        "slow": FakeLLMConfig(ttft=1.5, tokens=5),
+        "healthy": FakeLLMConfig(ttft=0.01, tokens_per_second=200, tokens=5),
+    }
+    servers = {name: FakeLLMServer(config).start() for name, config in configs.items()}
+    yield servers
+    for server in servers.values():
+        server.stop()
+
+
+def _use_backends(monkeypatch, servers, names, **router_options):
+    router = BackendRouter([LLMBackend(name, servers[name].url, "test-key") for name in names], **router_options)
+    monkeypatch.setattr(llm_client, "llm_router", router)
+    return router
+
+
+def _complete(prompt: str = "Xin chào") -> str:
+    async def run():
+        async with aclosing(llm_client.generate_response_stream(prompt, max_tokens=50)) as stream:
+            return "".join([chunk async for chunk in stream])
+
+    return asyncio.run(run())
+
+
+def test_router_prefers_lower_latency_and_trips_circuit():
+    fast, slow = LLMBackend("fast", "http://fast", "k"), LLMBackend("slow", "http://slow", "k")
+    router = BackendRouter([slow, fast], alpha=0.5, failure_threshold=2, open_seconds=0)
+    router.record_success(slow, 2.0)
+    router.record_success(fast, 0.2)
+
+    assert router.choose() is fast
+    router.release(fast)
+
+    router.record_failure(fast)
+    router.record_failure(fast)
+    assert fast.circuit == CIRCUIT_OPEN
+
+    # Hết thời gian nghỉ: request kế tiếp đi thăm dò backend đang ngắt, thành công thì đóng lại circuit
+    probe = router.choose(exclude=[slow])
+    assert probe is fast
+    router.record_success(fast, 0.2)
+    router.release(fast)
+    assert fast.circuit == CIRCUIT_CLOSED
+
+
+def test_all_circuits_open_raises():
+    backend = LLMBackend("only", "http://only", "k")
+    router = BackendRouter([backend], failure_threshold=1, open_seconds=60)
+    router.record_failure(backend)
+
+    with pytest.raises(NoBackendAvailable):
+        router.choose()
+
+
+def test_fails_over_before_first_token_and_stops_calling_broken_backend(fake_backends, monkeypatch):
+    router = _use_backends(monkeypatch, fake_backends, ["broken", "healthy"], failure_threshold=2,
+                           open_seconds=60)
+
+    answers = [_complete() for _ in range(3)]
+
+    assert answers == ["tok0 tok1 tok2 tok3 tok4 "] * 3
+    # Hai lần lỗi liên tiếp mở circuit, request thứ ba đi thẳng tới backend còn tốt
+    assert fake_backends["broken"].stats["failed"] == 2
+    assert router.backends[0].circuit == CIRCUIT_OPEN
+    assert router.backends[1].ttft is not None and router.backends[1].in_flight == 0
+
+
+def test_slow_first_token_fails_over(fake_backends, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_FIRST_TOKEN_TIMEOUT", 0.3)
+    router = _use_backends(monkeypatch, fake_backends, ["slow", "healthy"])
+
+    assert _complete() == "tok0 tok1 tok2 tok3 tok4 "
+    assert router.backends[0].consecutive_failures == 1
+    assert router.backends[0].in_flight == 0
+
+
+def test_hedge_policy_respects_budget_and_warm_up():
+    policy = HedgePolicy(enabled=True, quantile=0.9, min_delay=0.05, budget=0.5, min_samples=3)
+    policy.observe(0.1)
+    assert policy.delay() is None
+
+    for ttft in (0.2, 0.3, 1.0):
+        policy.observe(ttft)
+    assert policy.delay() == 1.0
+
+    # Ngân sách 0.5 hedge mỗi request: hai lần đầu dùng phần tích lũy, lần ba bị chặn
+    assert [policy.try_fire() for _ in range(3)] == [True, False, False]
+    policy.delay()
+    assert policy.try_fire() is True
+    assert policy.stats()["budget_exhausted"] == 2
+
+
+def test_hedge_to_second_backend_wins_over_stuck_request(fake_backends, monkeypatch):
+    policy = HedgePolicy(enabled=True, min_delay=0.1, budget=1.0, min_samples=0)
+    monkeypatch.setattr(llm_client, "hedge_policy", policy)
+    router = _use_backends(monkeypatch, fake_backends, ["slow", "healthy"])
+    slow_requests = fake_backends["slow"].stats["requests"]
+
+    assert _complete() == "tok0 tok1 tok2 tok3 tok4 "
+    assert fake_backends["slow"].stats["requests"] == slow_requests + 1
+    assert (policy.fired, policy.won) == (1, 1)
+    # Request thua bị hủy nhưng không bị tính là lỗi của backend chậm
+    assert [backend.in_flight for backend in router.backends] == [0, 0]
+    assert router.backends[0].consecutive_failures == 0
+
+
+def test_backend_status_requires_admin(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        anonymous = await client.get("/api/monitoring/llm-backends")
+        student = await client.get("/api/monitoring/llm-backends", headers=headers)
+        return anonymous.status_code, student.status_code
+
+    assert run_api(run) == (401, 403)
+
+
+def test_hedge_policy_records_end_to_end_ttft(fake_backends, monkeypatch):
+    policy = HedgePolicy(enabled=True, min_delay=0.1, budget=1.0, min_samples=0)
+    monkeypatch.setattr(llm_client, "hedge_policy", policy)
+    _use_backends(monkeypatch, fake_backends, ["slow", "healthy"])
+
+    assert _complete() == "tok0 tok1 tok2 tok3 tok4 "
+    # Hedge thắng sau ~10 ms của chính nó nhưng người dùng đã chờ thêm ngưỡng hedge trước đó
+    assert policy.threshold() >= 0.1
+
+
+def test_hedge_policy_threshold_follows_sliding_window():
+    policy = HedgePolicy(enabled=True, quantile=0.5, min_delay=0.0, min_samples=0)
+    for ttft in range(1000):
+        policy.observe(float(ttft))
+
+    # Chỉ còn 500 mẫu gần nhất (500..999)
+    assert policy.stats()["samples"] == 500
+    assert policy.threshold() == 750.0
+
+
+def test_upstream_error_is_kept_when_no_backend_is_left_to_retry(fake_backends, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_FAILOVER_ATTEMPTS", 3)
+    # Circuit mở sau lần lỗi đầu tiên: lần thử lại không còn backend nào để chọn
+    _use_backends(monkeypatch, fake_backends, ["broken"], failure_threshold=1, open_seconds=60)
+
+    with pytest.raises(Exception) as error:
+        _complete()
+
+    assert not isinstance(error.value, NoBackendAvailable)
+    assert isinstance(error.value.__cause__, NoBackendAvailable)
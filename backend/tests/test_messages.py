@@ -0,0 +1,92 @@
+"""
+test_messages.py
+----------------
+Mục đích:
+- Kiểm thử phân trang tin nhắn theo cursor (created_at, id) theo cả hai chiều
+  và việc chi tiết hội thoại chỉ nhúng trang tin nhắn mới nhất.
+"""
+from app.config import MESSAGE_PAGE_SIZE
+from tests.conftest import auth_headers, open_conversation
+
+
+async def _create_conversation_with_messages(client, headers: dict, count: int) -> int:
+    conversation_id = await open_conversation(client, headers)
+    for i in range(count):
+        await client.post(f"/api/chat/conversations/{conversation_id}/messages",
+                          json={"role": "user", "content": f"Tin nhắn {i}", "conversation_id": conversation_id},
+                          headers=headers)
+    return conversation_id
+
+
+def test_messages_paginate_backwards_and_forwards(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await _create_conversation_with_messages(client, headers, 7)
+        url = f"/api/chat/conversations/{conversation_id}/messages"
+
+        backward, params = [], {"limit": 3}
+        while True:
+            response = await client.get(url, params=params, headers=headers)
+            page = response.json()
+            backward.append(page)
+            if page["prev_cursor"] is None:
+                break
+            params = {"limit": 3, "before": page["prev_cursor"]}
+
+        forward, params = [], {"limit": 3, "after": backward[-1]["next_cursor"]}
+        while True:
+            page = (await client.get(url, params=params, headers=headers)).json()
+            forward.append(page)
+            if page["next_cursor"] is None:
+                break
+            params = {"limit": 3, "after": page["next_cursor"]}
+        return response, backward, forward
+
+    response, backward, forward = run_api(run)
+    contents = lambda page: [m["content"] for m in page["items"]]
+
+    assert response.headers["content-type"].startswith("application/json")
+    assert [contents(page) for page in backward] == [
+        ["Tin nhắn 4", "Tin nhắn 5", "Tin nhắn 6"],
+        ["Tin nhắn 1", "Tin nhắn 2", "Tin nhắn 3"],
+        ["Tin nhắn 0"],
+    ]
+    assert backward[0]["next_cursor"] is None
+    assert [contents(page) for page in forward] == [
+        ["Tin nhắn 1", "Tin nhắn 2", "Tin nhắn 3"],
+        ["Tin nhắn 4", "Tin nhắn 5", "Tin nhắn 6"],
+    ]
+
+
+def test_conversation_detail_embeds_latest_page_only(db_tables, run_api):
+    headers = auth_headers()
+    total = MESSAGE_PAGE_SIZE + 5
+
+    async def run(client):
+        conversation_id = await _create_conversation_with_messages(client, headers, total)
+        detail = (await client.get(f"/api/chat/conversations/{conversation_id}", headers=headers)).json()
+        older = (await client.get(f"/api/chat/conversations/{conversation_id}/messages",
+                                  params={"before": detail["messages_prev_cursor"]}, headers=headers)).json()
+        return detail, older
+
+    detail, older = run_api(run)
+
+    assert len(detail["messages"]) == MESSAGE_PAGE_SIZE
+    assert detail["messages"][-1]["content"] == f"Tin nhắn {total - 1}"
+    assert [m["content"] for m in older["items"]] == [f"Tin nhắn {i}" for i in range(5)]
+    assert older["prev_cursor"] is None
+
+
+def test_messages_reject_invalid_cursor_and_foreign_conversation(db_tables, run_api):
+    headers = auth_headers()
+    other_headers = auth_headers("other@example.com")
+
+    async def run(client):
+        conversation_id = await _create_conversation_with_messages(client, headers, 1)
+        url = f"/api/chat/conversations/{conversation_id}/messages"
+        invalid = await client.get(url, params={"before": "not-a-cursor"}, headers=headers)
+        foreign = await client.get(url, headers=other_headers)
+        return invalid.status_code, foreign.status_code
+
+    assert run_api(run) == (400, 404)
@@ -0,0 +1,52 @@
+"""
+test_metrics.py
+---------------
+Mục đích:
+- Kiểm thử định dạng Prometheus của các số liệu và endpoint /metrics sau một lượt chat stream.
+"""
+from app.utils.metrics import Histogram
+from tests.conftest import FAKE_LLM_TOKENS, auth_headers, open_conversation, send_chat
+
+CHAT_ROUTE = "/api/chat/conversations/{conversation_id}/chat"
+
+
+def _sample(text: str, series: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not found in metrics output")
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, route="/a")
+
+    lines = histogram.render()
+
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{route="/a"} 4' in lines
+
+
+def test_metrics_endpoint_covers_streamed_chat(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        await send_chat(client, headers, await open_conversation(client, headers))
+        return await client.get("/metrics")
+
+    response = run_api(run)
+    text = response.text
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert _sample(text, f'http_request_duration_seconds_count{{method="POST",route="{CHAT_ROUTE}",status="200"}}') == 1
+    assert _sample(text, f'http_time_to_first_byte_seconds_count{{method="POST",route="{CHAT_ROUTE}"}}') == 1
+    assert "llm_time_to_first_token_seconds_count" in text
+    assert _sample(text, 'llm_stream_duration_seconds_count{outcome="complete"}') == 1
+    assert _sample(text, "llm_completion_tokens_total") >= FAKE_LLM_TOKENS
+    assert _sample(text, "llm_streams_in_flight") == 0
+    assert _sample(text, 'rate_limit_decisions_total{result="allowed"}') == 2
+    assert "db_pool_checkouts_total{pool=" in text
+    assert 'cache_hits_total{cache="user_identity"}' in text
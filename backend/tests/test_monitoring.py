@@ -0,0 +1,27 @@
+"""
+test_monitoring.py
+------------------
+Mục đích:
+- Kiểm thử việc chỉ cho quản trị viên xem các số liệu thống kê trong /api/monitoring.
+"""
+import pytest
+
+from app.services import auth_service
+from tests.conftest import auth_headers
+
+STATS_ROUTES = ["/llm-pool", "/hedging", "/response-cache", "/single-flight", "/admission", "/usage",
+                "/password-hashing"]
+
+
+@pytest.mark.parametrize("route", STATS_ROUTES)
+def test_stats_routes_require_admin(db_tables, run_api, monkeypatch, route):
+    monkeypatch.setattr(auth_service, "ADMIN_EMAILS", ["admin@example.com"])
+    student = auth_headers()
+    admin = auth_headers("admin@example.com")
+
+    async def run(client):
+        responses = [await client.get(f"/api/monitoring{route}", headers=headers)
+                     for headers in ({}, student, admin)]
+        return [response.status_code for response in responses]
+
+    assert run_api(run) == [401, 403, 200]
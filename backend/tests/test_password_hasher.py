@@ -0,0 +1,105 @@
+"""
+test_password_hasher.py
+-----------------------
+Mục đích:
+- Kiểm thử việc chạy bcrypt ngoài event loop: event loop vẫn phản hồi trong lúc hash, giới hạn thời gian chờ
+  và luồng đăng ký/đăng nhập bằng mật khẩu.
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.services.password_hasher import PasswordHasher, PasswordHasherBusy, pwd_context
+
+
+@pytest.fixture(scope="module")
+def hashed_secret():
+    return pwd_context.hash("secret")
+
+
+def test_event_loop_keeps_running_while_verifying(hashed_secret):
+    async def run():
+        hasher = PasswordHasher(workers=2, queue_timeout=30)
+        max_lag = 0.0
+        done = False
+
+        async def ticker():
+            nonlocal max_lag
+            while not done:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                max_lag = max(max_lag, time.perf_counter() - started - 0.01)
+
+        ticking = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(hasher.verify("secret", hashed_secret) for _ in range(4)),
+                                       hasher.verify("wrong", hashed_secret))
+        done = True
+        await ticking
+        hasher.shutdown()
+        return results, max_lag
+
+    results, max_lag = asyncio.run(run())
+
+    assert results == [True, True, True, True, False]
+    # Chạy trực tiếp trên event loop, mỗi lần verify chặn loop hàng trăm ms
+    assert max_lag < 0.1
+
+
+def test_waiting_longer_than_queue_timeout_is_rejected(hashed_secret):
+    async def run():
+        hasher = PasswordHasher(workers=1, queue_timeout=0.05)
+        results = await asyncio.gather(*(hasher.verify("secret", hashed_secret) for _ in range(2)),
+                                       return_exceptions=True)
+        hasher.shutdown()
+        return results, hasher.stats()
+
+    results, stats = asyncio.run(run())
+
+    assert results[0] is True
+    assert isinstance(results[1], PasswordHasherBusy)
+    assert (stats["completed"], stats["rejected"], stats["active"], stats["waiting"]) == (1, 1, 0, 0)
+
+
+def test_register_and_login_with_password(db_tables, run_api):
+    async def run(client):
+        registered = await client.post("/api/auth/register", json={
+            "email": "hash@example.com", "name": "Student", "password": "secret"})
+        login = await client.post("/api/auth/login", json={"email": "hash@example.com", "password": "secret"})
+        wrong = await client.post("/api/auth/login", json={"email": "hash@example.com", "password": "nope"})
+        return registered, login, wrong
+
+    registered, login, wrong = run_api(run)
+
+    assert registered.status_code == 200
+    assert login.status_code == 200 and login.json()["access_token"]
+    assert wrong.status_code == 401
+
+
+def test_abandoned_waits_do_not_leak_slots(hashed_secret):
+    async def run():
+        hasher = PasswordHasher(workers=1, queue_timeout=30)
+        slots = hasher._get_slots()
+
+        # Lần acquire đã xong đúng lúc hết giờ: chỗ vừa giữ phải được trả lại
+        acquiring = asyncio.ensure_future(slots.acquire())
+        await acquiring
+        hasher._abandon(slots, acquiring)
+        assert not slots.locked()
+
+        # Request bị hủy trong lúc chờ tới lượt
+        running = asyncio.create_task(hasher.verify("secret", hashed_secret))
+        waiting = asyncio.create_task(hasher.verify("secret", hashed_secret))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        assert await running
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await asyncio.sleep(0)
+        hasher.shutdown()
+        return slots.locked(), hasher.stats()
+
+    locked, stats = asyncio.run(run())
+
+    assert not locked
+    assert (stats["active"], stats["waiting"]) == (0, 0)
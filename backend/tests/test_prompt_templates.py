@@ -0,0 +1,33 @@
+"""
+test_prompt_templates.py
+------------------------
+Mục đích:
+- Kiểm thử prompt template đã biên dịch: prefix cố định và lịch sử được nối phía sau.
+"""
+from app.utils.prompt_templates import AI_TUTOR_TEMPLATE, AITutorPrompt, get_template
+from app.utils.reflection import message_tokens
+from app.utils.token_counter import count_tokens
+
+
+def test_prefix_is_byte_stable_across_turns():
+    first = AI_TUTOR_TEMPLATE.render([{"role": "user", "content": "Xin chào"}])
+    second = AI_TUTOR_TEMPLATE.render([
+        {"role": "user", "content": "Xin chào"},
+        {"role": "assistant", "content": "Chào em!"},
+        {"role": "user", "content": "Vòng lặp for là gì?"},
+    ])
+
+    assert first.startswith(AI_TUTOR_TEMPLATE.prefix)
+    assert second.startswith(first[:-len(AI_TUTOR_TEMPLATE.suffix)])
+    assert second.endswith("Vòng lặp for là gì?<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n")
+
+
+def test_prefix_tokens_are_counted_once_and_reused():
+    history = [{"role": "user", "content": "Làm sao in Hello World?", "token_count": 7}]
+
+    assert get_template("ai_tutor") is AI_TUTOR_TEMPLATE
+    assert AI_TUTOR_TEMPLATE.prefix_tokens == count_tokens(AI_TUTOR_TEMPLATE.prefix)
+    assert AI_TUTOR_TEMPLATE.count_prompt_tokens(history) == (
+        AI_TUTOR_TEMPLATE.prefix_tokens + message_tokens(history[0]) + AI_TUTOR_TEMPLATE.suffix_tokens
+    )
+    assert AITutorPrompt(history).format() == AI_TUTOR_TEMPLATE.render(history)
@@ -0,0 +1,100 @@
+"""
+test_quota_ledger.py
+--------------------
+Mục đích:
+- Kiểm thử việc giữ trước token: các lượt chat đồng thời không vượt quota, phần giữ thừa được trả lại
+  và số token đã chốt được ghi xuống token_usage.
+"""
+import asyncio
+from datetime import date
+
+from sqlalchemy import select
+
+from app.services.quota_ledger import QuotaExceeded, QuotaLedger
+from app.services.rate_limiter import MemoryCounterStore
+from tests.conftest import auth_headers, open_conversation, send_chat
+
+
+def test_concurrent_reservations_cannot_overspend():
+    loads = []
+
+    async def load_used(user_id, day):
+        loads.append(user_id)
+        await asyncio.sleep(0.01)
+        return 200
+
+    async def run():
+        ledger = QuotaLedger(MemoryCounterStore(), quota=1000, load_used=load_used)
+        results = await asyncio.gather(*(ledger.reserve(1, 300) for _ in range(5)), return_exceptions=True)
+        reservations = [result for result in results if not isinstance(result, Exception)]
+        rejected = [result for result in results if isinstance(result, QuotaExceeded)]
+        assert (len(reservations), len(rejected)) == (2, 3)
+        assert rejected[0].remaining == 200
+
+        # Lượt chat dùng ít hơn phần giữ trước: phần thừa được trả lại, chốt lần hai không làm gì
+        assert await ledger.settle(reservations[0], 120)
+        assert not await ledger.settle(reservations[0], 999)
+        await ledger.release(reservations[1])
+        return await ledger.usage(1)
+
+    usage = asyncio.run(run())
+
+    assert loads == [1]
+    assert usage == {"tokens_used": 320, "tokens_reserved": 0, "tokens_remaining": 680}
+
+
+def test_seed_markers_of_previous_days_are_dropped():
+    async def load_used(user_id, day):
+        return 0
+
+    async def run():
+        ledger = QuotaLedger(MemoryCounterStore(), quota=1000, load_used=load_used)
+        for user_id in (1, 2):
+            await ledger.usage(user_id, date(2024, 1, 1))
+        await ledger.usage(1, date(2024, 1, 2))
+        return ledger._seeded
+
+    assert asyncio.run(run()) == {date(2024, 1, 2): {1}}
+
+
+def test_chat_without_quota_for_reservation_is_rejected_before_saving(db_tables, run_api, monkeypatch):
+    from app.services import token_service
+
+    # Đủ cho bước kiểm tra nhanh nhưng không đủ giữ trước prompt + max_tokens
+    monkeypatch.setattr(token_service.quota_ledger, "quota", 500)
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        response = await send_chat(client, headers, conversation_id)
+        messages = await client.get(f"/api/chat/conversations/{conversation_id}/messages", headers=headers)
+        usage = await client.get("/api/chat/token-usage", headers=headers)
+        return response, messages.json(), usage.json()
+
+    response, messages, usage = run_api(run)
+
+    assert response.status_code == 429
+    assert messages["items"] == []
+    assert (usage["tokens_used"], usage["tokens_reserved"]) == (0, 0)
+
+
+def test_settled_usage_is_flushed_to_database(db_tables):
+    from app.database import db_session
+    from app.models.token_usage import TokenUsage
+    from app.services import token_service
+    from app.services.usage_aggregator import usage_aggregator
+
+    async def run():
+        for actual in (150, 50):
+            reservation = await token_service.reserve_tokens(42, 900)
+            await token_service.settle_token_usage(reservation, actual)
+
+        async with db_session() as db:
+            assert await usage_aggregator.flush(db) == 1
+            result = await db.execute(select(TokenUsage).where(TokenUsage.user_id == 42))
+            return result.scalars().all(), await token_service.check_token_quota(42)
+
+    rows, quota = asyncio.run(run())
+
+    assert [(row.date, row.tokens_used) for row in rows] == [(date.today(), 200)]
+    assert quota["tokens_used"] == 200
@@ -0,0 +1,133 @@
+"""
+test_rate_limiter.py
+--------------------
+Mục đích:
+- Kiểm thử các thuật toán giới hạn request trong bộ nhớ (sliding window, token bucket).
+- Kiểm thử việc đồng bộ số request xuống database bằng upsert.
+"""
+import asyncio
+
+from sqlalchemy import select
+
+from app.services.rate_limiter import MemoryCounterStore, SlidingWindowLimiter, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_sliding_window_rejects_after_limit():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(MemoryCounterStore(clock), limit=3, window=60, clock=clock)
+
+    results = [_run(limiter.hit("user:1")) for _ in range(4)]
+
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[2].remaining == 0
+    # Người dùng khác không bị ảnh hưởng
+    assert _run(limiter.hit("user:2")).allowed
+
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock(now=600.0)
+    limiter = SlidingWindowLimiter(MemoryCounterStore(clock), limit=4, window=60, clock=clock)
+    for _ in range(4):
+        assert _run(limiter.hit("user:1")).allowed
+
+    # Sang cửa sổ mới được nửa chu kỳ: cửa sổ trước còn tính một nửa (2 request)
+    clock.now = 690.0
+    assert [_run(limiter.hit("user:1")).allowed for _ in range(3)] == [True, True, False]
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(MemoryCounterStore(clock), limit=2, window=60, clock=clock)
+
+    assert [_run(limiter.hit("user:1")).allowed for _ in range(3)] == [True, True, False]
+
+    clock.now += 30  # nạp lại 1 token
+    assert _run(limiter.hit("user:1")).allowed
+    assert not _run(limiter.hit("user:1")).allowed
+
+
+def test_seed_restores_usage_from_database():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(MemoryCounterStore(clock), limit=5, window=60, clock=clock)
+
+    assert limiter.needs_seed("user:1")
+    _run(limiter.seed("user:1", 4))
+    assert not limiter.needs_seed("user:1")
+
+    assert [_run(limiter.hit("user:1")).allowed for _ in range(2)] == [True, False]
+
+
+class YieldingStore(MemoryCounterStore):
+    """Bộ đếm nhường event loop ở mỗi thao tác, như một round-trip tới Redis."""
+
+    async def get(self, key: str) -> float:
+        await asyncio.sleep(0)
+        return await super().get(key)
+
+    async def incr(self, key: str, amount: float, ttl: float) -> float:
+        await asyncio.sleep(0)
+        return await super().incr(key, amount, ttl)
+
+
+def test_sliding_window_holds_limit_under_concurrent_hits():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(YieldingStore(clock), limit=5, window=60, clock=clock)
+
+    async def run():
+        return await asyncio.gather(*(limiter.hit("user:1") for _ in range(20)))
+
+    results = _run(run())
+
+    assert sum(r.allowed for r in results) == 5
+    # Các request bị từ chối đã được hoàn lại
+    assert not _run(limiter.hit("user:1")).allowed
+    clock.now += 120
+    assert _run(limiter.hit("user:1")).allowed
+
+
+def test_seed_markers_of_previous_windows_are_dropped():
+    clock = FakeClock(now=600.0)
+    limiter = SlidingWindowLimiter(MemoryCounterStore(clock), limit=5, window=60, clock=clock)
+    for key in ("user:1", "user:2"):
+        _run(limiter.seed(key, 1))
+
+    clock.now = 660.0
+    assert limiter.needs_seed("user:1")
+    _run(limiter.seed("user:1", 1))
+    assert limiter._seeded == {11: {"user:1"}}
+
+
+def test_request_counts_are_flushed_with_upsert(db_tables):
+    from app.database import db_session
+    from app.models.token_usage import RequestCount
+    from app.services import token_service
+    from app.services.usage_aggregator import usage_aggregator
+
+    async def run():
+        async with db_session() as db:
+            for _ in range(3):
+                allowed, _ = await token_service.increment_request_count(42, db)
+                assert allowed
+            assert await usage_aggregator.flush(db) == 1
+
+            await token_service.increment_request_count(42, db)
+            await usage_aggregator.flush(db)
+
+            result = await db.execute(select(RequestCount).where(RequestCount.user_id == 42))
+            return result.scalars().all()
+
+    rows = _run(run())
+    assert len(rows) == 1
+    assert rows[0].request_count == 4
@@ -0,0 +1,75 @@
+"""
+test_response_cache.py
+----------------------
+Mục đích:
+- Kiểm thử cache câu trả lời: so khớp gần đúng câu hỏi, tách theo ngữ cảnh, hết hạn theo TTL.
+- Câu hỏi lặp lại được phát lại từ cache mà không gọi LLM.
+"""
+from app.services.llm_client import pool_stats
+from app.services.response_cache import ResponseCache, response_cache
+from tests.conftest import FAKE_LLM_TOKENS, auth_headers, open_conversation, send_chat
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _history(*turns):
+    return [{"role": role, "content": content} for role, content in turns]
+
+
+def test_near_duplicate_question_hits_within_same_context():
+    cache = ResponseCache(enabled=True, threshold=0.6)
+    cache.store(_history(("user", "Làm sao để in Hello World trong C++?")), ["Em ", "thử "], 2)
+
+    hit = cache.lookup(_history(("user", "làm sao để in hello world trong C++ ạ")))
+    other_context = cache.lookup(_history(
+        ("user", "Vòng lặp for là gì?"),
+        ("assistant", "Em đoán thử xem?"),
+        ("user", "Làm sao để in Hello World trong C++?"),
+    ))
+    unrelated = cache.lookup(_history(("user", "Con trỏ trong C là gì?")))
+
+    assert hit is not None and hit.chunks == ("Em ", "thử ")
+    assert other_context is None
+    assert unrelated is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_cached_response_expires_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(enabled=True, ttl=60, clock=clock)
+    history = _history(("user", "cout là gì?"))
+    cache.store(history, ["cout "], 1)
+
+    clock.now = 59
+    assert cache.lookup(history) is not None
+    clock.now = 61
+    assert cache.lookup(history) is None
+
+
+def test_repeated_question_is_replayed_without_calling_llm(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+    response_cache.enabled = True
+    pool_stats.reset()
+
+    async def ask(client):
+        conversation_id = await open_conversation(client, headers)
+        response = await send_chat(client, headers, conversation_id, "Làm sao để in Hello World trong C++?")
+        return response.text
+
+    async def run(client):
+        return await ask(client), await ask(client)
+
+    try:
+        first, second = run_api(run)
+    finally:
+        response_cache.enabled = False
+
+    assert first == second == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS))
+    assert pool_stats.snapshot()["requests"] == 1
+    assert response_cache.stats()["hits"] == 1
@@ -0,0 +1,51 @@
+"""
+test_schema.py
+--------------
+Mục đích:
+- Kiểm thử metadata dùng chung và bộ kiểm tra schema: phát hiện index còn thiếu,
+  truy vấn nóng quét toàn bảng, và create_tables() tạo bổ sung index trên bảng đã có.
+"""
+from app.database import create_tables, engine
+from app.models.base import Base, load_models
+from app.services.schema_verifier import verify_schema
+from tests.conftest import auth_headers
+
+
+def test_all_models_share_one_metadata():
+    metadata = load_models()
+
+    assert metadata is Base.metadata
+    assert {"users", "conversations", "messages", "token_usage", "request_count"} <= set(metadata.tables)
+    assert metadata.tables["messages"].c.conversation_id.references(metadata.tables["conversations"].c.id)
+
+
+def test_verifier_passes_on_fresh_schema(db_tables):
+    report = verify_schema()
+
+    assert report.ok, report.to_dict()
+
+
+def test_verifier_reports_missing_index_and_full_scan(db_tables):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_messages_conversation_id_created_at")
+
+    report = verify_schema()
+
+    assert not report.ok
+    assert any(index.startswith("messages(conversation_id)") for index in report.missing_indexes)
+    assert "message_page" in report.slow_queries
+
+    # Khởi động lại: index khai báo trong model được tạo bổ sung trên bảng đã tồn tại
+    create_tables()
+    assert verify_schema().ok
+
+
+def test_schema_report_requires_admin(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        anonymous = await client.get("/api/monitoring/schema")
+        student = await client.get("/api/monitoring/schema", headers=headers)
+        return anonymous.status_code, student.status_code
+
+    assert run_api(run) == (401, 403)
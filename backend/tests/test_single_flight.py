@@ -0,0 +1,62 @@
+"""
+test_single_flight.py
+---------------------
+Mục đích:
+- Kiểm thử việc gộp các request LLM giống hệt nhau đang chạy đồng thời:
+  một lần gọi upstream, mọi người nhận cùng chuỗi token, người đến muộn được phát lại phần đã có.
+"""
+import asyncio
+
+from app.services.admission import llm_admission
+from app.services.llm_client import StreamUsage, pool_stats
+from app.services.single_flight import SingleFlight, single_flight
+from tests.conftest import FAKE_LLM_TOKENS, FAKE_LLM_TOKEN_DELAY, FAKE_LLM_TTFT, auth_headers, open_conversation, send_chat
+
+EXPECTED = [f"tok{i} " for i in range(FAKE_LLM_TOKENS)]
+
+
+async def _collect(flights: SingleFlight, prompt: str, usage: StreamUsage = None) -> list:
+    return [chunk async for chunk in flights.stream(prompt, usage=usage)]
+
+
+def test_identical_concurrent_chats_share_one_upstream_call(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+    pool_stats.reset()
+
+    async def ask(client, conversation_id):
+        response = await send_chat(client, headers, conversation_id, "Viết chương trình tính tổng hai số")
+        return response.text
+
+    async def run(client):
+        conversation_ids = [await open_conversation(client, headers, title="Lớp") for _ in range(4)]
+        asking = asyncio.gather(*(ask(client, cid) for cid in conversation_ids))
+        # Giữa stream: chỉ request mở lần gọi upstream còn giữ chỗ trong hàng đợi LLM
+        await asyncio.sleep(FAKE_LLM_TTFT + 3 * FAKE_LLM_TOKEN_DELAY)
+        active = llm_admission.stats()["active"]
+        return await asking, active
+
+    results, active = run_api(run)
+
+    assert results == ["".join(EXPECTED)] * 4
+    assert active == 1
+    assert pool_stats.snapshot()["requests"] == 1
+    assert single_flight.stats()["saved_calls"] == 3
+
+
+def test_late_joiner_receives_replay_then_live_tokens(fake_llm_server):
+    flights = SingleFlight(enabled=True)
+
+    async def run():
+        first_usage, late_usage = StreamUsage(), StreamUsage()
+        first = asyncio.create_task(_collect(flights, "Xin chào", first_usage))
+        # Tham gia sau khi đã có vài token trong bộ đệm
+        await asyncio.sleep(FAKE_LLM_TTFT + 3 * FAKE_LLM_TOKEN_DELAY)
+        late = await _collect(flights, "Xin chào", late_usage)
+        return await first, late, first_usage, late_usage
+
+    first, late, first_usage, late_usage = asyncio.run(run())
+
+    assert first == late == EXPECTED
+    assert late_usage.completion_tokens == first_usage.completion_tokens > 0
+    assert flights.stats()["active_flights"] == 0
+    assert (flights.upstream_calls, flights.saved_calls) == (1, 1)
@@ -0,0 +1,83 @@
+"""
+test_stream_persistence.py
+--------------------------
+Mục đích:
+- Kiểm thử việc lưu dần câu trả lời trong lúc stream (checkpoint) và trạng thái của tin nhắn.
+"""
+import asyncio
+
+from app.models.chat import Message, MESSAGE_STATUS_COMPLETE, MESSAGE_STATUS_STREAMING
+from app.services.stream_persistence import MessageStreamWriter
+from tests.conftest import FAKE_LLM_TOKENS, auth_headers, open_conversation, send_chat
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingSession:
+    """Session giả chỉ ghi lại nội dung tin nhắn tại mỗi lần commit."""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.commits = []
+
+    async def commit(self):
+        self.commits.append((self.message.content, self.message.status))
+
+
+def test_checkpoints_follow_token_cadence_and_respect_min_interval():
+    clock = FakeClock()
+    message = Message(role="assistant", content="", status=MESSAGE_STATUS_STREAMING)
+    db = RecordingSession(message)
+    writer = MessageStreamWriter(db, message, checkpoint_tokens=2, checkpoint_interval=60,
+                                 min_interval=1, clock=clock)
+
+    async def run():
+        for i in range(10):
+            clock.now += 0.5
+            await writer.write(f"t{i} ")
+        return await writer.finish(MESSAGE_STATUS_COMPLETE, 10)
+
+    content = asyncio.run(run())
+
+    # Mỗi chunk 1 token, nhưng không ghi quá một lần mỗi giây: checkpoint tại t=1, 2, 3, 4, 5
+    assert writer.checkpoints == 5
+    assert db.commits[0] == ("t0 t1 ", MESSAGE_STATUS_STREAMING)
+    assert db.commits[-1] == (content, MESSAGE_STATUS_COMPLETE)
+    assert content == "".join(f"t{i} " for i in range(10))
+
+
+def test_chat_marks_assistant_message_complete(fake_llm_server, db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        conversation_id = await open_conversation(client, headers)
+        await send_chat(client, headers, conversation_id)
+        return (await client.get(f"/api/chat/conversations/{conversation_id}", headers=headers)).json()
+
+    detail = run_api(run)
+    assistant = [m for m in detail["messages"] if m["role"] == "assistant"][0]
+
+    assert assistant["status"] == MESSAGE_STATUS_COMPLETE
+    assert assistant["content"] == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS))
+
+
+def test_chat_does_not_tokenize_chunks_twice(fake_llm_server, db_tables, run_api, monkeypatch):
+    from app.services import stream_persistence
+
+    def count_again(text):
+        raise AssertionError("chunk tokenized a second time")
+
+    monkeypatch.setattr(stream_persistence, "count_tokens", count_again)
+    headers = auth_headers()
+
+    async def run(client):
+        response = await send_chat(client, headers, await open_conversation(client, headers))
+        return response.text
+
+    assert run_api(run) == "".join(f"tok{i} " for i in range(FAKE_LLM_TOKENS))
@@ -0,0 +1,57 @@
+"""
+test_tracing.py
+---------------
+Mục đích:
+- Kiểm thử header Server-Timing, log thời gian của lượt chat và endpoint profiling dành cho quản trị viên.
+"""
+import json
+import logging
+
+from app.services import auth_service
+from tests.conftest import auth_headers, open_conversation, send_chat
+
+
+def test_chat_reports_server_timing_and_logs_all_phases(fake_llm_server, db_tables, run_api, caplog):
+    headers = auth_headers()
+
+    async def run(client):
+        return await send_chat(client, headers, await open_conversation(client, headers))
+
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        response = run_api(run)
+
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    for phase in ("auth_jwt", "rate_limit", "quota", "history", "prompt", "total;dur="):
+        assert phase in timing
+
+    records = [json.loads(record.getMessage()) for record in caplog.records if record.name == "app.timing"]
+    chat_log = next(record for record in records if record["path"].endswith("/chat"))
+    assert chat_log["status"] == 200
+    assert {"llm_ttft", "llm_stream", "finalize", "usage_commit"} <= set(chat_log["spans_ms"])
+
+
+def test_profile_requires_admin(db_tables, run_api):
+    headers = auth_headers()
+
+    async def run(client):
+        return await client.get("/api/monitoring/profile?seconds=0.1", headers=headers)
+
+    assert run_api(run).status_code == 403
+
+
+def test_profile_returns_folded_stacks(db_tables, run_api, monkeypatch):
+    monkeypatch.setattr(auth_service, "ADMIN_EMAILS", ["admin@example.com"])
+    headers = auth_headers("admin@example.com")
+
+    async def run(client):
+        return await client.get("/api/monitoring/profile?seconds=0.2&interval=0.01", headers=headers)
+
+    response = run_api(run)
+
+    assert response.status_code == 200
+    assert int(response.headers["x-profile-samples"]) > 0
+    stack, count = response.text.splitlines()[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    # Trong lúc profiling, event loop rảnh và chờ I/O trong vòng lặp của asyncio
+    assert "(base_events.py:" in stack
@@ -0,0 +1,138 @@
+"""
+test_usage_aggregator.py
+------------------------
+Mục đích:
+- Kiểm thử việc ghi số request/token theo lô: một transaction cho nhiều sự kiện, ghi sớm khi gom đủ
+  số sự kiện, ghi nốt khi dừng và không mất số liệu khi ghi lỗi.
+"""
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+from app.database import db_session
+from app.models.token_usage import RequestCount, TokenUsage
+from app.services.usage_aggregator import KIND_REQUESTS, KIND_TOKENS, UsageAggregator
+
+
+async def _rows(model):
+    async with db_session() as db:
+        result = await db.execute(select(model).order_by(model.user_id))
+        return result.scalars().all()
+
+
+def test_many_events_are_written_in_one_transaction(db_tables):
+    today = date.today()
+
+    async def run():
+        aggregator = UsageAggregator(flush_interval=60, max_events=1000)
+        for user_id in (1, 2):
+            for _ in range(50):
+                aggregator.add(KIND_REQUESTS, user_id, today)
+                aggregator.add(KIND_TOKENS, user_id, today, 10)
+        assert aggregator.pending(KIND_TOKENS, 1) == 500
+        assert await aggregator.flush() == 4
+        return aggregator.stats(), await _rows(RequestCount), await _rows(TokenUsage)
+
+    stats, requests, tokens = asyncio.run(run())
+
+    assert (stats["events_total"], stats["flushes"], stats["pending_rows"]) == (200, 1, 0)
+    assert stats["transactions_saved"] == 199
+    assert [(row.user_id, row.request_count) for row in requests] == [(1, 50), (2, 50)]
+    assert [(row.user_id, row.tokens_used) for row in tokens] == [(1, 500), (2, 500)]
+
+
+def test_flushes_early_on_event_count_and_on_stop(db_tables):
+    today = date.today()
+
+    async def run():
+        aggregator = UsageAggregator(flush_interval=60, max_events=3)
+        aggregator.start()
+        for _ in range(3):
+            aggregator.add(KIND_REQUESTS, 1, today)
+        await asyncio.sleep(0.2)
+        early = aggregator.stats()["flushes"]
+
+        aggregator.add(KIND_REQUESTS, 1, today)
+        await aggregator.stop()
+        return early, await _rows(RequestCount)
+
+    early, rows = asyncio.run(run())
+
+    assert early == 1
+    assert [row.request_count for row in rows] == [4]
+
+
+def test_failed_flush_keeps_counters_for_retry(db_tables, monkeypatch):
+    today = date.today()
+
+    async def failing_write(db, batch):
+        raise RuntimeError("database unavailable")
+
+    async def run():
+        aggregator = UsageAggregator(flush_interval=60, max_events=1000)
+        aggregator.add(KIND_TOKENS, 1, today, 120)
+        with monkeypatch.context() as patch:
+            patch.setattr(aggregator, "_write", failing_write)
+            with pytest.raises(RuntimeError):
+                await aggregator.flush()
+        assert aggregator.pending(KIND_TOKENS, 1, today) == 120
+
+        aggregator.add(KIND_TOKENS, 1, today, 30)
+        await aggregator.flush()
+        return aggregator.stats(), await _rows(TokenUsage)
+
+    stats, rows = asyncio.run(run())
+
+    assert (stats["flushes"], stats["failed_flushes"]) == (1, 1)
+    assert [row.tokens_used for row in rows] == [150]
+
+
+def test_total_does_not_double_count_a_batch_being_written(db_tables, monkeypatch):
+    today = date.today()
+
+    async def run():
+        aggregator = UsageAggregator(flush_interval=60, max_events=1000)
+        aggregator.add(KIND_TOKENS, 1, today, 100)
+        write = aggregator._write
+        writing = asyncio.Event()
+
+        async def slow_write(db, batch):
+            writing.set()
+            await asyncio.sleep(0.05)
+            await write(db, batch)
+
+        async def load_committed():
+            rows = await _rows(TokenUsage)
+            return sum(row.tokens_used for row in rows)
+
+        monkeypatch.setattr(aggregator, "_write", slow_write)
+        flushing = asyncio.create_task(aggregator.flush())
+        await writing.wait()
+        total = await aggregator.total(KIND_TOKENS, 1, today, load_committed)
+        await flushing
+        return total
+
+    assert asyncio.run(run()) == 100
+
+
+def test_total_reads_do_not_wait_for_each_other():
+    today = date.today()
+
+    async def run():
+        aggregator = UsageAggregator(flush_interval=60, max_events=1000)
+        aggregator.add(KIND_TOKENS, 1, today, 5)
+
+        async def slow_load():
+            await asyncio.sleep(0.1)
+            return 10
+
+        started = asyncio.get_running_loop().time()
+        totals = await asyncio.gather(*(aggregator.total(KIND_TOKENS, 1, today, slow_load) for _ in range(5)))
+        return totals, asyncio.get_running_loop().time() - started
+
+    totals, elapsed = asyncio.run(run())
+
+    assert totals == [15] * 5
+    assert elapsed < 0.3